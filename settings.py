@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.gis",
+    "django.contrib.postgres",
     "django_extensions",
     # our apps
     'rest_framework.authtoken',
@@ -77,6 +78,12 @@ WSGI_APPLICATION = "whoownsmass.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Connections come from a psycopg_pool pool in each worker process, so
+# requests skip the TLS handshake and authentication. Set DB_POOL=false to
+# fall back to persistent per-thread connections kept for CONN_MAX_AGE
+# seconds. Either way, connections are checked before reuse.
+DB_POOL = env.bool("DB_POOL", default=True)
+
 DATABASES = {
     "default": {
         "ENGINE": "django.contrib.gis.db.backends.postgis",
@@ -88,9 +95,26 @@ DATABASES = {
         "OPTIONS": {
             "sslmode": env("DB_SSL")
         },
+        # Pooling is incompatible with persistent connections.
+        "CONN_MAX_AGE": 0 if DB_POOL else env.int("CONN_MAX_AGE", default=60),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+if DB_POOL:
+    from psycopg_pool import ConnectionPool
+
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+        "max_size": env.int("DB_POOL_MAX_SIZE", default=10),
+        # Seconds a request waits for a free connection before erroring.
+        "timeout": env.float("DB_POOL_TIMEOUT", default=10),
+        "max_idle": env.float("DB_POOL_MAX_IDLE", default=600),
+        "max_lifetime": env.float("DB_POOL_MAX_LIFETIME", default=3600),
+        # Ping each connection as it leaves the pool, replacing dead ones.
+        "check": ConnectionPool.check_connection,
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -129,6 +153,39 @@ USE_TZ = False
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 
+# Data generation and caches
+# Seconds a process trusts its cached data generation stamp before checking
+# the database again (see whoownsmass.generation).
+DATA_GENERATION_TTL = env.int("DATA_GENERATION_TTL", default=30)
+
+TILE_CACHE_DIR = env("TILE_CACHE_DIR", default=os.path.join(BASE_DIR, "cache/tiles/"))
+
+# Rendered API responses, keyed on the data generation and stored raw,
+# gzipped and brotli-compressed (see whoownsmass.caching). The local-memory
+# backend evicts least recently used entries past MAX_ENTRIES. Forms larger
+# than RESPONSE_CACHE_MAX_BYTES are not kept; a body whose gzip form is too
+# large is not cached at all.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "responses",
+        "TIMEOUT": None,
+        "OPTIONS": {
+            "MAX_ENTRIES": env.int("RESPONSE_CACHE_ENTRIES", default=2000),
+            "CULL_FREQUENCY": 10,
+        },
+    },
+}
+RESPONSE_CACHE_MAX_BYTES = env.int("RESPONSE_CACHE_MAX_BYTES", default=1024 * 1024)
+
+# Owner search
+# Minimum pg_trgm similarity for fuzzy owner matches. Values below the
+# server's pg_trgm.similarity_threshold (0.3 by default) have no effect.
+OWNER_SEARCH_THRESHOLD = env.float("OWNER_SEARCH_THRESHOLD", default=0.3)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -141,10 +198,11 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    # The browsable API re-runs queries to build its forms, so it is only
+    # offered in development.
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
-        "rest_framework.renderers.BrowsableAPIRenderer",
-    ],
+        "whoownsmass.renderers.ORJSONRenderer",
+    ] + (["rest_framework.renderers.BrowsableAPIRenderer"] if DEBUG else []),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ]
@@ -0,0 +1,112 @@
+"""
+Free-text address lookup: "45 Main St, Somerville" to the sites at that
+address.
+
+Queries are parsed into a house number, a street body written the way the
+processing pipeline writes Address.body (upper case, with USPS street type
+and direction abbreviations) and a municipality. They match any address on
+that street whose range covers the number on the same side of the street,
+so 45 matches both 45 and 41-49 (but not 40-50). The match reads the
+address_range_idx index on (muni, body, even, start, end).
+"""
+import re
+from dataclasses import dataclass
+
+from django.db.models import F
+
+from whoownsmass.models import Address
+
+# Range and lettered numbers ("41-49", "45A") match on their first number.
+NUMBER = re.compile(r"^(\d+)[A-Z]?(?: ?- ?\d+[A-Z]?)? (.+)$")
+POSTAL = re.compile(r"\b\d{5}(?: ?-\d{4})?$")
+STATE = re.compile(r"\b(?:MA|MASS|MASSACHUSETTS)$")
+PUNCTUATION = re.compile(r"[^A-Z0-9,\- ]+")
+ABBREVIATIONS = {
+    "AVENUE": "AVE",
+    "BOULEVARD": "BLVD",
+    "CIRCLE": "CIR",
+    "COURT": "CT",
+    "DRIVE": "DR",
+    "HIGHWAY": "HWY",
+    "LANE": "LN",
+    "PARKWAY": "PKWY",
+    "PLACE": "PL",
+    "ROAD": "RD",
+    "SQUARE": "SQ",
+    "STREET": "ST",
+    "TERRACE": "TER",
+    "NORTH": "N",
+    "SOUTH": "S",
+    "EAST": "E",
+    "WEST": "W",
+}
+MAX_RESULTS = 100
+
+
+class AddressParseError(ValueError):
+    pass
+
+
+@dataclass
+class ParsedAddress:
+    number: int
+    body: str
+    muni: str
+    postal: str = None
+
+    @property
+    def even(self):
+        return self.number % 2 == 0
+
+
+def normalize_body(body):
+    return " ".join(ABBREVIATIONS.get(word, word) for word in body.split())
+
+
+def parse_address(query, muni=None):
+    """
+    Parse "<number> <street>, <municipality>[, MA] [<ZIP>]". muni, if
+    given, stands in for a missing municipality.
+    """
+    parts = [" ".join(part.split()) for part in PUNCTUATION.sub(" ", query.upper()).split(",")]
+    parts = [part for part in parts if part]
+    postal = None
+    if parts:
+        found = POSTAL.search(parts[-1])
+        if found:
+            postal = found.group()[:5]
+            parts[-1] = parts[-1][:found.start()].strip()
+        if len(parts) > 1:
+            parts[-1] = STATE.sub("", parts[-1]).strip()
+        if not parts[-1]:
+            parts.pop()
+    match = NUMBER.match(parts[0]) if parts else None
+    if not match:
+        raise AddressParseError("Expected a house number followed by a street, e.g. 45 Main St, Somerville.")
+    municipality = parts[1] if len(parts) > 1 else (muni or "").upper().strip()
+    if not municipality:
+        raise AddressParseError("Add the municipality after a comma, e.g. 45 Main St, Somerville.")
+    return ParsedAddress(
+        number=int(match.group(1)),
+        body=normalize_body(match.group(2)),
+        muni=municipality,
+        postal=postal,
+    )
+
+
+def matching_addresses(parsed):
+    """
+    Addresses on parsed.body in parsed.muni whose range covers
+    parsed.number on the same side of the street, narrowest range first.
+    """
+    return (
+        Address.objects.filter(
+            muni=parsed.muni,
+            body=parsed.body,
+            even=parsed.even,
+            start__lte=parsed.number,
+            end__gte=parsed.number,
+        )
+        .annotate(width=F("end") - F("start"))
+        .order_by("width", "id")
+    )
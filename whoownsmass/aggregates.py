@@ -0,0 +1,181 @@
+"""
+Recomputation of the aggregate columns on metacorps_network (val,
+prop_count, unit_count, area, the per-property ratios and company_count)
+from site, owner, site_to_owner and company. The processing pipeline
+writes these precomputed; run `manage.py recompute_metacorp_aggregates`
+after correcting those tables in place.
+
+val and area are bigint, since a large network's totals pass the integer
+maximum (about 2.1 billion). Tables written by write_to_django before the
+change still have integer columns, which are widened on the first
+recompute.
+"""
+from django.db import connection
+
+from whoownsmass.generation import reset_generation
+
+# Every metacorp, the given %(ids)s, or only those touched by rows
+# committed after %(since)s.
+ALL_TARGETS_SQL = "SELECT id FROM metacorps_network"
+
+# Summed columns that can pass the integer maximum.
+BIGINT_COLUMNS = ["val", "area"]
+
+LISTED_TARGETS_SQL = "SELECT unnest(%(ids)s::varchar[]) AS id"
+
+CHANGED_TARGETS_SQL = """
+    SELECT o.metacorp_id AS id
+    FROM owner o
+    WHERE pg_xact_commit_timestamp(o.xmin) > %(since)s
+    UNION
+    SELECT o.metacorp_id
+    FROM site_to_owner sto
+    JOIN owner o ON o.id = sto.owner_id
+    WHERE pg_xact_commit_timestamp(sto.xmin) > %(since)s
+    UNION
+    SELECT o.metacorp_id
+    FROM site s
+    JOIN site_to_owner sto ON sto.site_id = s.id
+    JOIN owner o ON o.id = sto.owner_id
+    WHERE pg_xact_commit_timestamp(s.xmin) > %(since)s
+    UNION
+    SELECT c.metacorp_id
+    FROM company c
+    WHERE pg_xact_commit_timestamp(c.xmin) > %(since)s
+"""
+
+# One statement: aggregate each target metacorp's sites (counted once even
+# when several of its owners hold them) and companies, then write back only
+# the rows whose values changed.
+UPDATE_SQL = """
+    WITH targets AS (
+        {targets}
+    ),
+    holdings AS (
+        SELECT DISTINCT o.metacorp_id, sto.site_id
+        FROM site_to_owner sto
+        JOIN owner o ON o.id = sto.owner_id
+        WHERE o.metacorp_id IN (SELECT id FROM targets)
+    ),
+    site_totals AS (
+        SELECT
+            h.metacorp_id,
+            count(*) AS prop_count,
+            sum(s.bld_val::bigint + s.lnd_val) AS val,
+            sum(s.units) AS unit_count,
+            sum(greatest(s.res_area, s.bld_area)) AS area
+        FROM holdings h
+        JOIN site s ON s.id = h.site_id
+        GROUP BY h.metacorp_id
+    ),
+    company_totals AS (
+        SELECT metacorp_id, count(*) AS company_count
+        FROM company
+        WHERE metacorp_id IN (SELECT id FROM targets)
+        GROUP BY metacorp_id
+    ),
+    totals AS (
+        SELECT
+            t.id,
+            coalesce(st.prop_count, 0) AS prop_count,
+            coalesce(st.val, 0) AS val,
+            coalesce(st.unit_count, 0) AS unit_count,
+            coalesce(st.area, 0) AS area,
+            coalesce(ct.company_count, 0) AS company_count
+        FROM (SELECT DISTINCT id FROM targets WHERE id IS NOT NULL) t
+        LEFT JOIN site_totals st ON st.metacorp_id = t.id
+        LEFT JOIN company_totals ct ON ct.metacorp_id = t.id
+    ),
+    computed AS (
+        SELECT
+            id,
+            val,
+            prop_count,
+            unit_count,
+            area,
+            unit_count::float / nullif(prop_count, 0) AS units_per_prop,
+            val::float / nullif(prop_count, 0) AS val_per_prop,
+            val::float / nullif(area, 0) AS val_per_area,
+            company_count
+        FROM totals
+    )
+    UPDATE metacorps_network m SET
+        val = c.val,
+        prop_count = c.prop_count,
+        unit_count = c.unit_count,
+        area = c.area,
+        units_per_prop = c.units_per_prop,
+        val_per_prop = c.val_per_prop,
+        val_per_area = c.val_per_area,
+        company_count = c.company_count
+    FROM computed c
+    WHERE m.id = c.id
+    AND (
+        m.val, m.prop_count, m.unit_count, m.area, m.units_per_prop,
+        m.val_per_prop, m.val_per_area, m.company_count
+    ) IS DISTINCT FROM (
+        c.val, c.prop_count, c.unit_count, c.area, c.units_per_prop,
+        c.val_per_prop, c.val_per_area, c.company_count
+    )
+"""
+
+
+class AggregateError(Exception):
+    pass
+
+
+def commit_timestamps_enabled():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT current_setting('track_commit_timestamp')::boolean")
+        return cursor.fetchone()[0]
+
+
+def widen_columns(cursor):
+    """Convert any of BIGINT_COLUMNS still typed integer to bigint."""
+    cursor.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'metacorps_network'
+        AND column_name = ANY(%s) AND data_type = 'integer'
+        """,
+        [BIGINT_COLUMNS]
+    )
+    narrow = [row[0] for row in cursor.fetchall()]
+    if narrow:
+        cursor.execute(
+            "ALTER TABLE metacorps_network "
+            + ", ".join(f"ALTER COLUMN {column} TYPE bigint" for column in narrow)
+        )
+
+
+def recompute_metacorp_aggregates(changed_since=None, metacorp_ids=None):
+    """
+    Recompute the aggregate columns of every metacorp, of the metacorps in
+    metacorp_ids, or with changed_since only of metacorps whose owners,
+    sites, site links or companies were written after that time. Returns the
+    number of metacorps whose values changed.
+
+    changed_since relies on PostgreSQL commit timestamps, so it needs
+    track_commit_timestamp = on. It cannot see deleted rows, or the
+    metacorp an owner or company was moved away from; run a full
+    recompute after deletions or re-clustering.
+    """
+    params = {}
+    if metacorp_ids is not None:
+        targets = LISTED_TARGETS_SQL
+        params["ids"] = list(metacorp_ids)
+    elif changed_since is None:
+        targets = ALL_TARGETS_SQL
+    else:
+        if not commit_timestamps_enabled():
+            raise AggregateError(
+                "changed_since needs track_commit_timestamp = on in postgresql.conf."
+            )
+        targets = CHANGED_TARGETS_SQL
+        params["since"] = changed_since
+    with connection.cursor() as cursor:
+        widen_columns(cursor)
+        cursor.execute(UPDATE_SQL.format(targets=targets), params)
+        updated = cursor.rowcount
+    reset_generation()
+    return updated
@@ -0,0 +1,68 @@
+"""
+The owner_alias materialized view: one row per distinct (name, metacorp)
+pair in owner, with how many owner rows and sites carry it. Owner search
+and metacorp alias lists read from it instead of grouping the owner table
+on every request. Refresh it after each load with
+`manage.py refresh_owner_aliases`. migrate and create_indexes create it
+when it is missing, so endpoints reading it work before the first refresh.
+"""
+from django.db import DEFAULT_DB_ALIAS, connection
+
+CREATE_SQL = """
+    CREATE MATERIALIZED VIEW owner_alias AS
+    SELECT
+        min(o.id) AS id,
+        o.name,
+        o.metacorp_id,
+        count(DISTINCT o.id) AS owner_count,
+        count(DISTINCT sto.site_id) AS site_count
+    FROM owner o
+    LEFT JOIN site_to_owner sto ON sto.owner_id = o.id
+    WHERE o.name IS NOT NULL
+    GROUP BY o.name, o.metacorp_id
+"""
+
+INDEX_SQL = [
+    # REFRESH ... CONCURRENTLY needs a unique index over plain columns.
+    "CREATE UNIQUE INDEX IF NOT EXISTS owner_alias_id_idx ON owner_alias (id)",
+    "CREATE INDEX IF NOT EXISTS owner_alias_metacorp_idx ON owner_alias (metacorp_id, owner_count DESC)",
+    "CREATE INDEX IF NOT EXISTS owner_alias_name_idx ON owner_alias (name, metacorp_id)",
+    "CREATE INDEX IF NOT EXISTS owner_alias_name_trgm_idx ON owner_alias USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS owner_alias_name_prefix_idx ON owner_alias (upper(name) text_pattern_ops)",
+]
+
+
+def owner_alias_exists():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_matviews WHERE schemaname = current_schema() AND matviewname = 'owner_alias'"
+        )
+        return cursor.fetchone() is not None
+
+
+def refresh_owner_aliases(concurrently=True):
+    """
+    Create owner_alias if it does not exist, otherwise refresh it. A
+    concurrent refresh leaves the view readable throughout.
+    """
+    with connection.cursor() as cursor:
+        if not owner_alias_exists():
+            cursor.execute(CREATE_SQL)
+        elif concurrently:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY owner_alias")
+        else:
+            cursor.execute("REFRESH MATERIALIZED VIEW owner_alias")
+        for sql in INDEX_SQL:
+            cursor.execute(sql)
+        cursor.execute("ANALYZE owner_alias")
+
+
+def create_owner_aliases(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Create owner_alias if it does not exist. Returns whether it was
+    created. Connected to post_migrate, once the owner table exists.
+    """
+    if using != DEFAULT_DB_ALIAS or owner_alias_exists():
+        return False
+    refresh_owner_aliases(concurrently=False)
+    return True
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class WhoOwnsMassConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "whoownsmass"
+
+    def ready(self):
+        from whoownsmass.aliases import create_owner_aliases
+        from whoownsmass.indexes import create_extensions
+        # Extensions have to exist before tables with their indexes are made.
+        pre_migrate.connect(create_extensions, sender=self)
+        # Metacorp and owner endpoints read owner_alias, a materialized view
+        # over owner that migrate does not create.
+        post_migrate.connect(create_owner_aliases, sender=self)
@@ -0,0 +1,164 @@
+"""
+Async versions of the site, metacorp and owner read endpoints, for serving
+under ASGI (whoownsmass.asgi). Queries run through Django's async ORM, so a
+single process can hold many slow requests open while the database works
+on them, instead of tying up one worker thread per request.
+
+DRF views are synchronous, so these are plain Django views. They reuse the
+sync endpoints' querysets, filter backends and serializers; every related object a
+serializer reads is prefetched, so serializing touches no database. Lists
+are keyset-paginated with `after` and `limit`. Responses are not cached.
+"""
+from functools import wraps
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.request import Request
+from rest_framework.utils.urls import replace_query_param
+
+from whoownsmass.models import OwnerAlias
+from whoownsmass.pagination import GeoJsonKeysetPagination, KeysetPagination
+from whoownsmass.renderers import ORJSONRenderer
+from whoownsmass.search import owner_search
+from whoownsmass.serializers import (
+    MetaCorpSerializer,
+    OwnerAliasSerializer,
+    OwnerSearchSerializer,
+    SiteSerializer
+)
+from whoownsmass.views import FALSE_VALUES, SiteViewset, metacorp_queryset, site_detail_queryset
+
+renderer = ORJSONRenderer()
+
+
+def render(data, status=200):
+    return HttpResponse(
+        renderer.render(data), content_type=renderer.media_type, status=status
+    )
+
+
+async def authenticate(request):
+    """
+    The active user owning the request's `Authorization: Token <key>`
+    header, as DRF's TokenAuthentication would find, or None.
+    """
+    auth = request.headers.get("Authorization", "").split()
+    if len(auth) != 2 or auth[0].lower() != "token":
+        return None
+    try:
+        token = await Token.objects.select_related("user").aget(key=auth[1])
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+def async_api_view(view):
+    """
+    Authenticate an async view like the DRF endpoints and render its data,
+    or its errors, as JSON. The view receives a DRF Request wrapping the
+    Django request for its query_params.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return render({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+        if await authenticate(request) is None:
+            response = render(
+                {"detail": "Authentication credentials were not provided."}, status=401
+            )
+            response["WWW-Authenticate"] = "Token"
+            return response
+        try:
+            return render(await view(Request(request), *args, **kwargs))
+        except ObjectDoesNotExist:
+            return render({"detail": "Not found."}, status=404)
+        except APIException as err:
+            return render(
+                err.detail if isinstance(err.detail, (list, dict)) else {"detail": err.detail},
+                status=err.status_code
+            )
+    return wrapper
+
+
+class MetaCorpPagination(KeysetPagination):
+    ordering_type = str
+
+
+def site_filter(request, queryset):
+    """
+    Apply the sync site list's filter backends: SiteFilter, `in_bbox` and
+    `point`/`dist`. None of them queries the database.
+    """
+    view = SiteViewset(request=request, format_kwarg=None)
+    for backend in SiteViewset.filter_backends:
+        queryset = backend().filter_queryset(request, queryset, view)
+    return queryset
+
+
+def offset_param(request):
+    value = request.query_params.get("offset", "0")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({"offset": "Must be an integer."})
+    if value < 0:
+        raise ValidationError({"offset": "Must be at least 0."})
+    return value
+
+
+@async_api_view
+async def site_list(request):
+    paginator = GeoJsonKeysetPagination()
+    page = await paginator.apaginate_queryset(
+        site_filter(request, site_detail_queryset()), request
+    )
+    return paginator.get_paginated_data(SiteSerializer(page, many=True).data)
+
+
+@async_api_view
+async def site_detail(request, pk):
+    site = await site_detail_queryset().aget(pk=pk)
+    return SiteSerializer(site).data
+
+
+def include_sites(request):
+    return request.query_params.get("sites", "true").lower() not in FALSE_VALUES
+
+
+@async_api_view
+async def metacorp_list(request):
+    paginator = MetaCorpPagination()
+    sites = include_sites(request)
+    page = await paginator.apaginate_queryset(metacorp_queryset(sites), request)
+    serializer = MetaCorpSerializer(page, many=True, context={"include_sites": sites})
+    return paginator.get_paginated_data(serializer.data)
+
+
+@async_api_view
+async def metacorp_detail(request, pk):
+    sites = include_sites(request)
+    metacorp = await metacorp_queryset(sites).aget(pk=pk)
+    return MetaCorpSerializer(metacorp, context={"include_sites": sites}).data
+
+
+@async_api_view
+async def owner_list(request):
+    """
+    Owner aliases by id or, with `search`, best matches first. Ranked
+    results have no unique key to seek on, so they are paged by `offset`.
+    """
+    paginator = KeysetPagination()
+    search = request.query_params.get("search", "").strip()
+    if not search:
+        page = await paginator.apaginate_queryset(OwnerAlias.objects.all(), request)
+        return paginator.get_paginated_data(OwnerAliasSerializer(page, many=True).data)
+    queryset = owner_search(search, match=request.query_params.get("match", "fuzzy"))
+    limit = paginator.get_page_size(request)
+    offset = offset_param(request)
+    results = [alias async for alias in queryset[offset:offset + limit + 1]]
+    next_link = None
+    if len(results) > limit:
+        next_link = replace_query_param(request.build_absolute_uri(), "offset", offset + limit)
+    return {"next": next_link, "results": OwnerSearchSerializer(results[:limit], many=True).data}
@@ -0,0 +1,120 @@
+"""
+Batch lookups: many sites, owners or metacorps by id in one POST to
+`batch/`, for tools that would otherwise fetch `/sites/{id}/` once per id.
+
+Ids are resolved CHUNK_SIZE at a time with a single `id = ANY(%s)` array
+parameter (the `any` lookup below, registered on the integer and string
+field classes of the primary keys looked up here) and the same prefetches
+as the detail endpoints, so each chunk costs a fixed number of queries
+however many ids it holds: three for sites and owners, two for metacorps.
+Results are keyed by id, in request order, and ids that matched nothing
+are listed under `missing`.
+
+Batches of more than one chunk are streamed: each chunk is encoded and sent
+as soon as it is read, so memory use does not depend on the batch size.
+"""
+from django.db.models import CharField, IntegerField, Lookup
+
+from whoownsmass.export import dumps
+
+# Ids accepted per type in one request.
+MAX_IDS = 10000
+CHUNK_SIZE = 1000
+
+
+class Any(Lookup):
+    """
+    `field = ANY(%s)` with the values bound as one array parameter, rather
+    than the `IN (%s, %s, ...)` list `__in` builds, so the statement text
+    stays the same size whatever the number of ids.
+    """
+    lookup_name = "any"
+    prepare_rhs = False
+
+    def get_db_prep_lookup(self, value, connection):
+        return "%s", [[self.lhs.output_field.get_prep_value(v) for v in value]]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} = ANY({rhs})", [*lhs_params, *rhs_params]
+
+
+IntegerField.register_lookup(Any)
+CharField.register_lookup(Any)
+
+
+class BatchError(ValueError):
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+
+def parse_batch(data, types):
+    """
+    The ids requested per type from a `{"sites": [...], ...}` body, checked
+    and without repeats. types maps each type to (id type, queryset,
+    serializer), where the id type is int or str.
+    """
+    if not isinstance(data, dict) or not data:
+        raise BatchError("non_field_errors", f"Expected an object with any of {', '.join(types)}.")
+    batch = {}
+    for kind, ids in data.items():
+        if kind not in types:
+            raise BatchError(kind, f"Unknown type; expected one of {', '.join(types)}.")
+        if not isinstance(ids, list):
+            raise BatchError(kind, "Must be a list of ids.")
+        if len(ids) > MAX_IDS:
+            raise BatchError(kind, f"At most {MAX_IDS} ids per request.")
+        if types[kind][0] is int:
+            # bool is a subclass of int, but true is not an id.
+            if not all(isinstance(id, int) and not isinstance(id, bool) for id in ids):
+                raise BatchError(kind, "Ids must be integers.")
+        elif not all(isinstance(id, str) for id in ids):
+            raise BatchError(kind, "Ids must be strings.")
+        batch[kind] = list(dict.fromkeys(ids))
+    return batch
+
+
+def streamed(batch):
+    """Whether batch spans more than one chunk, and so is streamed."""
+    return sum(len(ids) for ids in batch.values()) > CHUNK_SIZE
+
+
+def resolve(queryset, serializer, ids, context):
+    """
+    Yield (id, data) for every id in ids that exists, in the order given,
+    one chunk of ids per round of queries.
+    """
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        found = {obj.pk: obj for obj in queryset.filter(pk__any=chunk)}
+        for id in chunk:
+            if id in found:
+                yield id, serializer(found[id], context=context).data
+
+
+def resolve_batch(batch, types, context):
+    """The whole response body, for batches small enough to build at once."""
+    data = {}
+    for kind, ids in batch.items():
+        _, queryset, serializer = types[kind]
+        found = dict(resolve(queryset(), serializer, ids, context))
+        data[kind] = {"found": found, "missing": [id for id in ids if id not in found]}
+    return data
+
+
+def stream_batch(batch, types, context):
+    """Yield the same body as resolve_batch as JSON, chunk by chunk."""
+    yield b"{"
+    for n, (kind, ids) in enumerate(batch.items()):
+        _, queryset, serializer = types[kind]
+        yield (b"," if n else b"") + dumps(kind) + b':{"found":{'
+        found = set()
+        separator = b""
+        for id, data in resolve(queryset(), serializer, ids, context):
+            yield separator + dumps(str(id)) + b":" + dumps(data)
+            separator = b","
+            found.add(id)
+        yield b'},"missing":' + dumps([id for id in ids if id not in found]) + b"}"
+    yield b"}"
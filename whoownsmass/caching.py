@@ -0,0 +1,197 @@
+"""
+Response caching for the read endpoints, keyed on the data generation stamp.
+
+Rendered response bodies are kept in the "responses" cache (see CACHES in
+settings), whose local-memory backend evicts least recently used entries
+once it holds MAX_ENTRIES. Entries never expire on their own: a new load
+changes the generation, so later requests use new keys and the stale
+entries age out of the LRU.
+
+Each body is compressed once, with gzip and brotli, when it is stored.
+Later requests are sent whichever stored form their Accept-Encoding
+prefers, so nothing downstream has to compress it again.
+
+Every cacheable response carries an ETag derived from the same key, so
+If-None-Match requests are answered 304 from the URL and generation alone,
+without running a query.
+"""
+import gzip
+import hashlib
+from functools import wraps
+from time import time
+
+import brotli
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from whoownsmass.generation import current_generation
+
+CACHE_ALIAS = "responses"
+# Bodies are compressed once per generation, so favour size over speed.
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+
+def compress(content):
+    """
+    The stored forms of a body, by content coding: identity, gzip and br.
+    """
+    return {
+        "identity": content,
+        "gzip": gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0),
+        "br": brotli.compress(content, quality=BROTLI_QUALITY),
+    }
+
+
+def encoding_qualities(header):
+    """
+    The quality Accept-Encoding gives each content coding it lists, by
+    lower-cased coding name. A quality of 0 refuses the coding.
+    """
+    qualities = {}
+    for part in header.split(","):
+        coding, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    return qualities
+
+
+def choose_encoding(request):
+    """
+    The stored form the client rates highest: br, then gzip on equal
+    quality. `*` rates codings the header does not list, so an explicit
+    q=0 still refuses one. identity wins only when listed with a higher
+    quality, and is the fallback when neither compressed form is accepted.
+    """
+    qualities = encoding_qualities(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    default = qualities.get("*", 0.0)
+    chosen, best = "identity", 0.0
+    for coding in ("br", "gzip"):
+        quality = qualities.get(coding, default)
+        if quality > best:
+            chosen, best = coding, quality
+    if qualities.get("identity", 0.0) > best:
+        return "identity"
+    return chosen
+
+
+def response_cache_key(generation, request):
+    """
+    Key a GET request on the data generation, the absolute URL with its
+    query parameters in a stable order, and the negotiated media type.
+    """
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    )
+    url = request.build_absolute_uri(request.path)
+    media_type = request.accepted_renderer.media_type
+    raw = f"{generation}|{url}|{params}|{media_type}"
+    return "response:" + hashlib.md5(raw.encode()).hexdigest()
+
+
+def cacheable(request):
+    # The browsable API embeds the user and a CSRF token in every page.
+    return request.accepted_renderer.format != "api"
+
+
+def cached_body(entry, encoding):
+    """
+    The stored form of a cached body for encoding. Bodies too large to keep
+    uncompressed are inflated from their gzip form.
+    """
+    forms = entry["forms"]
+    if encoding in forms:
+        return forms[encoding]
+    return gzip.decompress(forms["gzip"])
+
+
+def cache_response(method):
+    """
+    Serve a viewset action from the response cache, and answer conditional
+    GETs with 304 when the client's ETag matches the current generation.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if not cacheable(request):
+            return method(self, request, *args, **kwargs)
+        cache = caches[CACHE_ALIAS]
+        key = response_cache_key(current_generation(), request)
+        encoding = choose_encoding(request)
+        # Each coding of the body is a distinct representation.
+        tag = key.split(":", 1)[1]
+        etag = quote_etag(tag if encoding == "identity" else f"{tag}-{encoding}")
+
+        entry = cache.get(key)
+        last_modified = entry["last_modified"] if entry else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if entry:
+                response = HttpResponse(
+                    cached_body(entry, encoding), content_type=entry["content_type"]
+                )
+                if encoding != "identity":
+                    response["Content-Encoding"] = encoding
+            else:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response.add_post_render_callback(
+                    lambda rendered: store(cache, key, rendered, encoding)
+                )
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ["Accept", "Accept-Encoding", "Authorization"])
+        return response
+    return wrapper
+
+
+def store(cache, key, response, encoding):
+    """
+    Compress a rendered response body, keep each form under the per-entry
+    size cap, and send the form the client asked for.
+    """
+    forms = compress(response.content)
+    stored = {
+        coding: body
+        for coding, body in forms.items()
+        if len(body) <= settings.RESPONSE_CACHE_MAX_BYTES
+    }
+    if "gzip" in stored:
+        now = int(time())
+        cache.set(key, {
+            "forms": stored,
+            "content_type": response["Content-Type"],
+            "last_modified": now,
+        })
+        response["Last-Modified"] = http_date(now)
+    if encoding != "identity":
+        response.content = forms[encoding]
+        response["Content-Encoding"] = encoding
+
+
+class CachedResponseMixin:
+    """
+    Caches list and retrieve responses. Decorate extra actions with
+    cache_response to cache them too.
+    """
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
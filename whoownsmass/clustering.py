@@ -0,0 +1,335 @@
+"""
+Re-clustering of companies into metacorps, in place of rerunning the
+external clustering after correcting company, officer or address links.
+Run it with `manage.py recluster_metacorps`.
+
+Two companies belong to the same metacorp when they are connected through
+shared addresses: a company's own address, and the addresses of its
+non-institutional officers (institutional officers are registered agents,
+whose addresses would join unrelated companies). Connected components are
+found with union-find over the company ids, held in flat integer arrays,
+while the edges are streamed from the database sorted by address, so memory
+stays at a few machine words per company however many edges there are.
+
+An incremental run takes the companies whose links changed, re-clusters
+their current metacorps together with everything now connected to them,
+and leaves every other metacorp alone. That covers both added links, which
+may merge metacorps, and removed ones, which may split them.
+
+Each new component keeps the metacorp id most of its companies already
+carried, unless a larger component claimed it first (the larger part of a
+split keeps the id). Otherwise it is given a new id, MINTED_PREFIX plus its
+lowest company id. A company without links and without a metacorp stays
+unassigned. Companies, their officers and their owners are then rewritten
+in bulk, metacorps nothing refers to any more are deleted, and the
+aggregates of every remaining metacorp involved are recomputed, along with
+owner_alias and, when it exists, geography_rollup.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.db import connection, transaction
+
+from whoownsmass.aggregates import AggregateError, commit_timestamps_enabled, recompute_metacorp_aggregates
+from whoownsmass.aliases import refresh_owner_aliases
+from whoownsmass.generation import reset_generation
+from whoownsmass.rollups import refresh_rollups, rollups_exist
+
+CHUNK_SIZE = 20000
+MINTED_PREFIX = "company-"
+
+# Company-to-address links.
+EDGES_SQL = """
+    SELECT address_id, id AS company_id
+    FROM company
+    WHERE address_id IS NOT NULL {company_filter}
+    UNION ALL
+    SELECT address_id, company_id
+    FROM officer
+    WHERE NOT inst AND address_id IS NOT NULL AND company_id IS NOT NULL {officer_filter}
+"""
+
+# The given companies plus every other company in their current metacorps.
+SEED_SQL = """
+    SELECT id FROM company WHERE id = ANY(%(ids)s)
+    UNION
+    SELECT id FROM company
+    WHERE metacorp_id IN (SELECT metacorp_id FROM company WHERE id = ANY(%(ids)s))
+"""
+
+# Companies sharing an address with any company in the frontier.
+NEIGHBORS_SQL = f"""
+    WITH edges AS NOT MATERIALIZED ({EDGES_SQL.format(company_filter="", officer_filter="")})
+    SELECT DISTINCT neighbor.company_id
+    FROM edges e
+    JOIN edges neighbor ON neighbor.address_id = e.address_id
+    WHERE e.company_id = ANY(%(frontier)s)
+"""
+
+CHANGED_COMPANIES_SQL = """
+    SELECT id FROM company WHERE pg_xact_commit_timestamp(xmin) > %(since)s
+    UNION
+    SELECT company_id FROM officer
+    WHERE company_id IS NOT NULL AND pg_xact_commit_timestamp(xmin) > %(since)s
+"""
+
+# Officers and owners follow their company, from the recluster temporary table.
+REWRITE_SQL = [
+    """
+    UPDATE company c SET metacorp_id = r.metacorp_id
+    FROM recluster r
+    WHERE c.id = r.company_id
+    """,
+    """
+    UPDATE officer o SET metacorp_id = r.metacorp_id
+    FROM recluster r
+    WHERE o.company_id = r.company_id
+    AND o.metacorp_id IS DISTINCT FROM r.metacorp_id
+    """,
+    """
+    UPDATE owner o SET metacorp_id = r.metacorp_id
+    FROM recluster r
+    WHERE o.company_id = r.company_id
+    AND o.metacorp_id IS DISTINCT FROM r.metacorp_id
+    """,
+]
+
+# New metacorps are named after their most common company name.
+NAME_SQL = """
+    UPDATE metacorps_network m SET name = (
+        SELECT c.name FROM company c
+        WHERE c.metacorp_id = m.id AND c.name IS NOT NULL
+        GROUP BY c.name
+        ORDER BY count(*) DESC, c.name
+        LIMIT 1
+    )
+    WHERE m.id = ANY(%s)
+"""
+
+
+# Metacorps a merge left without companies, officers or owners.
+DELETE_EMPTY_SQL = """
+    DELETE FROM metacorps_network m
+    WHERE m.id = ANY(%s)
+    AND NOT EXISTS (SELECT 1 FROM company c WHERE c.metacorp_id = m.id)
+    AND NOT EXISTS (SELECT 1 FROM officer o WHERE o.metacorp_id = m.id)
+    AND NOT EXISTS (SELECT 1 FROM owner o WHERE o.metacorp_id = m.id)
+    RETURNING m.id
+"""
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1, with union by size and path halving."""
+
+    def __init__(self, n):
+        self.parent = array("l", range(n))
+        self.size = array("l", [1]) * n
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+
+
+def stream(sql, params):
+    """Rows of sql, fetched through a server-side cursor."""
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(CHUNK_SIZE):
+            yield from rows
+
+
+def load_companies(company_ids=None):
+    """
+    Sorted company ids, as an array, and the metacorp id of each. Limited
+    to company_ids if given.
+    """
+    ids = array("q")
+    metacorps = []
+    interned = {}
+    where = "" if company_ids is None else "WHERE id = ANY(%(ids)s)"
+    for company_id, metacorp_id in stream(
+        f"SELECT id, metacorp_id FROM company {where} ORDER BY id",
+        {"ids": company_ids}
+    ):
+        ids.append(company_id)
+        metacorps.append(interned.setdefault(metacorp_id, metacorp_id))
+    return ids, metacorps
+
+
+def union_edges(uf, ids, company_ids=None):
+    """
+    Join the companies in ids that share an address. Edges arrive sorted
+    by address, so each is joined to the previous company at that address.
+    """
+    if company_ids is None:
+        sql, params = EDGES_SQL.format(company_filter="", officer_filter=""), {}
+    else:
+        sql = EDGES_SQL.format(
+            company_filter="AND id = ANY(%(ids)s)",
+            officer_filter="AND company_id = ANY(%(ids)s)"
+        )
+        params = {"ids": company_ids}
+    previous_address = previous = None
+    edges = 0
+    for address_id, company_id in stream(f"{sql} ORDER BY address_id", params):
+        i = bisect_left(ids, company_id)
+        if i == len(ids) or ids[i] != company_id:
+            continue
+        if address_id == previous_address:
+            uf.union(previous, i)
+        previous_address, previous = address_id, i
+        edges += 1
+    return edges
+
+
+def affected_companies(company_ids):
+    """
+    The given companies, the rest of their current metacorps and every
+    company now connected to any of them.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SEED_SQL, {"ids": list(company_ids)})
+        known = {row[0] for row in cursor.fetchall()}
+        frontier = list(known)
+        while frontier:
+            cursor.execute(NEIGHBORS_SQL, {"frontier": frontier})
+            frontier = [row[0] for row in cursor.fetchall() if row[0] not in known]
+            known.update(frontier)
+    return sorted(known)
+
+
+def label_components(uf, ids, metacorps, taken):
+    """
+    A metacorp id for each company, and the ids minted for components
+    that could not keep an existing one. taken holds ids unavailable for
+    minting.
+    """
+    components = {}
+    for i in range(len(ids)):
+        components.setdefault(uf.find(i), []).append(i)
+    labels = [None] * len(ids)
+    claimed = set()
+    minted = []
+    # Members are in id order, so ties go to the component with the lowest id.
+    for members in sorted(components.values(), key=lambda members: (-len(members), members[0])):
+        counts = Counter(metacorps[i] for i in members if metacorps[i] is not None)
+        label = next(
+            (metacorp for metacorp, _ in counts.most_common() if metacorp not in claimed),
+            None
+        )
+        if label is None and (counts or len(members) > 1):
+            base = label = f"{MINTED_PREFIX}{ids[members[0]]}"
+            suffix = 1
+            while label in taken or label in claimed:
+                suffix += 1
+                label = f"{base}-{suffix}"
+            minted.append(label)
+        if label is not None:
+            claimed.add(label)
+        for i in members:
+            labels[i] = label
+    return labels, minted
+
+
+def changed_companies(since):
+    if not commit_timestamps_enabled():
+        raise AggregateError(
+            "changed_since needs track_commit_timestamp = on in postgresql.conf."
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(CHANGED_COMPANIES_SQL, {"since": since})
+        return [row[0] for row in cursor.fetchall()]
+
+
+def write_labels(ids, metacorps, labels, minted):
+    """
+    Create the minted metacorps and point every relabelled company, and its
+    officers and owners, at its new metacorp.
+    """
+    with connection.cursor() as cursor:
+        # Dropped on commit, but an enclosing transaction may still hold one.
+        cursor.execute("DROP TABLE IF EXISTS pg_temp.recluster")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE recluster "
+            "(company_id integer PRIMARY KEY, metacorp_id varchar(100)) ON COMMIT DROP"
+        )
+        with cursor.copy("COPY recluster (company_id, metacorp_id) FROM STDIN") as copy:
+            for company_id, old, new in zip(ids, metacorps, labels):
+                if old != new:
+                    copy.write_row((company_id, new))
+        cursor.execute(
+            "INSERT INTO metacorps_network (id) SELECT unnest(%s::varchar[]) ON CONFLICT DO NOTHING",
+            [minted]
+        )
+        for sql in REWRITE_SQL:
+            cursor.execute(sql)
+        cursor.execute(NAME_SQL, [minted])
+        cursor.execute("SELECT count(*) FROM recluster")
+        return cursor.fetchone()[0]
+
+
+def delete_empty_metacorps(metacorp_ids):
+    """
+    Delete the metacorps in metacorp_ids that no company, officer or owner
+    refers to any more. Returns the ids deleted.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(DELETE_EMPTY_SQL, [list(metacorp_ids)])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def recluster_metacorps(company_ids=None, changed_since=None, log=print):
+    """
+    Re-cluster every company, or only the components around company_ids
+    or around companies and officers written after changed_since. Returns
+    the number of companies moved to another metacorp.
+
+    changed_since relies on PostgreSQL commit timestamps, so it needs
+    track_commit_timestamp = on, and cannot see deleted officers; pass
+    their company ids instead.
+    """
+    if changed_since is not None:
+        company_ids = [*(company_ids or []), *changed_companies(changed_since)]
+    with transaction.atomic():
+        if company_ids is not None:
+            company_ids = affected_companies(company_ids)
+            if not company_ids:
+                return 0
+        ids, metacorps = load_companies(company_ids)
+        uf = UnionFind(len(ids))
+        edges = union_edges(uf, ids, company_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM metacorps_network WHERE id LIKE %s",
+                [f"{MINTED_PREFIX}%"]
+            )
+            taken = {row[0] for row in cursor.fetchall()}
+        labels, minted = label_components(uf, ids, metacorps, taken)
+        log(f"{len(ids):,} companies, {edges:,} links, {len(minted):,} new metacorps.")
+        moved = write_labels(ids, metacorps, labels, minted)
+        deleted = delete_empty_metacorps(
+            {old for old, new in zip(metacorps, labels) if old != new} - {None}
+        )
+        log(f"Deleted {len(deleted):,} empty metacorps.")
+        recompute_metacorp_aggregates(
+            metacorp_ids=sorted({*metacorps, *labels} - {None} - deleted)
+        )
+        if moved:
+            refresh_owner_aliases(concurrently=False)
+            if rollups_exist():
+                refresh_rollups(concurrently=False)
+    reset_generation()
+    return moved
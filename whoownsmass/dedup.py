@@ -0,0 +1,176 @@
+"""
+Owner name deduplication, for re-running after manual fixes. Run it with
+`manage.py dedup_owners`.
+
+Names are normalized (case, punctuation, common suffix spellings), then
+blocked: each name is filed under every one of its significant words paired
+with the initial of another, so a typo in one word still leaves a shared
+key. Names are only compared within a block, with the same
+trigram similarity pg_trgm computes for owner search (shared word trigrams
+over all trigrams). Pairs whose trigram counts alone rule out reaching the
+threshold are skipped without comparing, and a pair sharing several keys is
+compared only in the first of them. Blocks are compared in batches across a
+process pool, running the kernel in whoownsmass.owner_names.
+
+Deduplication works on owner_alias rows, the distinct (name, metacorp)
+pairs, and never merges names held by two different metacorps. Applying
+the proposals renames every variant in a cluster to its most used
+spelling, then merges owners left identical, repointing their site links.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from django.db import connection, transaction
+
+from whoownsmass.aliases import refresh_owner_aliases
+from whoownsmass.clustering import UnionFind
+from whoownsmass.generation import reset_generation
+from whoownsmass.models import OwnerAlias
+from whoownsmass.owner_names import block_keys, compare_batch, normalize, set_kept
+
+THRESHOLD = 0.6
+# Blocks this large are keyed on a word too common to be informative.
+MAX_BLOCK = 1000
+# Names sent to a worker at a time.
+BATCH_SIZE = 20000
+
+
+def batches(blocks, records, normalized, size):
+    batch, names = [], 0
+    for key, members in blocks.items():
+        batch.append((key, [(records[i][0], normalized[i], records[i][2]) for i in members]))
+        names += len(members)
+        if names >= size:
+            yield batch
+            batch, names = [], 0
+    if batch:
+        yield batch
+
+
+def find_duplicates(records, threshold=THRESHOLD, workers=None, max_block=MAX_BLOCK):
+    """
+    Propose merges among (id, name, metacorp, ...) records. Returns the
+    (id, id, similarity) proposals and counts of names, blocks, skipped
+    blocks, pairs compared and seconds taken.
+    """
+    start = perf_counter()
+    normalized = [normalize(record[1] or "") for record in records]
+    blocks = {}
+    for i, name in enumerate(normalized):
+        for key in block_keys(name):
+            blocks.setdefault(key, []).append(i)
+    skipped = 0
+    for key in [key for key, members in blocks.items() if len(members) < 2 or len(members) > max_block]:
+        skipped += len(blocks[key]) > max_block
+        del blocks[key]
+    kept = frozenset(blocks)
+    stats = {"names": len(records), "blocks": len(blocks), "skipped_blocks": skipped, "compared": 0}
+    proposals = []
+    workers = workers or os.cpu_count()
+    # Every worker needs the full key set, so it is sent once per process.
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_kept, initargs=(kept,)) as pool:
+        pending = deque()
+
+        def collect():
+            compared, found = pending.popleft().result()
+            stats["compared"] += compared
+            proposals.extend(found)
+
+        for batch in batches(blocks, records, normalized, BATCH_SIZE):
+            pending.append(pool.submit(compare_batch, batch, threshold))
+            if len(pending) >= workers * 2:
+                collect()
+        while pending:
+            collect()
+    stats["seconds"] = perf_counter() - start
+    return proposals, stats
+
+
+def alias_records():
+    """Every distinct (name, metacorp) pair as (id, name, metacorp, owner_count)."""
+    return list(
+        OwnerAlias.objects.order_by("id").values_list("id", "name", "metacorp_id", "owner_count")
+    )
+
+
+def renames(records, proposals):
+    """
+    Group proposals into clusters and map every other spelling in a cluster
+    to its most used one. Returns (name, metacorp, canonical) triples.
+    """
+    index = {record[0]: i for i, record in enumerate(records)}
+    uf = UnionFind(len(records))
+    for a, b, _ in proposals:
+        uf.union(index[a], index[b])
+    clusters = {}
+    for a, b, _ in proposals:
+        for i in (index[a], index[b]):
+            clusters.setdefault(uf.find(i), set()).add(i)
+    result = []
+    for members in clusters.values():
+        canonical = records[min(members, key=lambda i: (-records[i][3], len(records[i][1]), records[i][1]))][1]
+        result.extend(
+            (records[i][1], records[i][2], canonical)
+            for i in sorted(members) if records[i][1] != canonical
+        )
+    return result
+
+
+MERGE_SQL = [
+    """
+    UPDATE owner o SET name = r.canonical
+    FROM dedup_rename r
+    WHERE o.name = r.name AND o.metacorp_id IS NOT DISTINCT FROM r.metacorp_id
+    """,
+    # Owners that now share name, address, metacorp and company are merged
+    # into the lowest id.
+    """
+    CREATE TEMPORARY TABLE dedup_owner ON COMMIT DROP AS
+    SELECT id, survivor FROM (
+        SELECT id, min(id) OVER (
+            PARTITION BY name, address_id, metacorp_id, company_id
+        ) AS survivor
+        FROM owner
+        WHERE name IN (SELECT canonical FROM dedup_rename)
+    ) ranked
+    WHERE id <> survivor
+    """,
+    """
+    UPDATE site_to_owner sto SET owner_id = d.survivor
+    FROM dedup_owner d
+    WHERE sto.owner_id = d.id
+    """,
+    """
+    DELETE FROM site_to_owner a
+    USING site_to_owner b
+    WHERE a.site_id = b.site_id AND a.owner_id = b.owner_id AND a.id > b.id
+    AND a.owner_id IN (SELECT survivor FROM dedup_owner)
+    """,
+    "DELETE FROM owner WHERE id IN (SELECT id FROM dedup_owner)",
+]
+
+
+def apply_renames(renames):
+    """
+    Rename owners and merge the duplicates that leaves. Returns the number
+    of owner rows merged away.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Both are dropped on commit, but an enclosing transaction may still hold them.
+        cursor.execute("DROP TABLE IF EXISTS pg_temp.dedup_rename, pg_temp.dedup_owner")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE dedup_rename "
+            "(name varchar(500), metacorp_id varchar(100), canonical varchar(500)) ON COMMIT DROP"
+        )
+        with cursor.copy("COPY dedup_rename (name, metacorp_id, canonical) FROM STDIN") as copy:
+            for row in renames:
+                copy.write_row(row)
+        for sql in MERGE_SQL:
+            cursor.execute(sql)
+        cursor.execute("SELECT count(*) FROM dedup_owner")
+        merged = cursor.fetchone()[0]
+        refresh_owner_aliases(concurrently=False)
+    reset_generation()
+    return merged
@@ -0,0 +1,186 @@
+"""
+Site exports. GeoJSON, NDJSON and MessagePack exports are streamed: rows are
+read through a server-side cursor and encoded one at a time, so memory use
+does not depend on the export size. Features carry the same fields as
+SiteSerializer, but are built from .values() rows rather than by
+instantiating a serializer per site. FlatGeobuf exports are built whole by
+PostGIS, since the spatial index needs every feature, so they are limited to
+MAX_FLATGEOBUF_SITES.
+"""
+import datetime
+import decimal
+
+import msgpack
+import orjson
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import connections
+from django.db.models import (
+    DecimalField,
+    F,
+    FloatField,
+    Func,
+    OuterRef,
+    Subquery,
+    TextField,
+    Value
+)
+from django.db.models.functions import Cast
+
+from whoownsmass.models import Address, Owner, Site
+from whoownsmass.serializers import AddressSerializer
+
+CHUNK_SIZE = 2000
+# FlatGeobuf files are held in memory while they are built and sent.
+MAX_FLATGEOBUF_SITES = 100000
+
+SITE_FIELDS = [
+    field.name for field in Site._meta.concrete_fields if field.name != "address"
+]
+ADDRESS_FIELDS = AddressSerializer.Meta.fields
+
+
+def encode_value(value):
+    # Matches DRF's defaults: decimals as strings, dates in ISO 8601.
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def export_rows(queryset):
+    """
+    Reduce queryset to the flat values needed for a feature: site fields,
+    address fields, owner names, first metacorp and point coordinates.
+    """
+    owners = Owner.objects.filter(site=OuterRef("pk"))
+    return (
+        queryset.annotate(
+            owner_names=ArraySubquery(owners.values("name")),
+            metacorp_id=Subquery(
+                owners.filter(metacorp__isnull=False)
+                .order_by("metacorp_id")
+                .values("metacorp_id")[:1]
+            ),
+            x=Func(F("address__parcel__geometry"), function="ST_X", output_field=FloatField()),
+            y=Func(F("address__parcel__geometry"), function="ST_Y", output_field=FloatField()),
+        )
+        .order_by("id")
+        .values(
+            *SITE_FIELDS,
+            *[f"address__{field}" for field in ADDRESS_FIELDS],
+            "address_id",
+            "owner_names",
+            "metacorp_id",
+            "x",
+            "y"
+        )
+    )
+
+
+def feature(row):
+    properties = {field: row[field] for field in SITE_FIELDS}
+    properties["owners"] = row["owner_names"]
+    properties["metacorp"] = row["metacorp_id"]
+    properties["address"] = (
+        {field: row[f"address__{field}"] for field in ADDRESS_FIELDS}
+        if row["address_id"] is not None else None
+    )
+    geometry = (
+        {"type": "Point", "coordinates": [row["x"], row["y"]]}
+        if row["x"] is not None else None
+    )
+    return {
+        "id": properties.pop("id"),
+        "type": "Feature",
+        "geometry": geometry,
+        "properties": properties
+    }
+
+
+def dumps(obj):
+    return orjson.dumps(obj, default=encode_value)
+
+
+def stream_ndjson(queryset):
+    """Yield one GeoJSON feature per line."""
+    for row in export_rows(queryset).iterator(chunk_size=CHUNK_SIZE):
+        yield dumps(feature(row)) + b"\n"
+
+
+def stream_geojson(queryset):
+    """Yield a GeoJSON FeatureCollection piece by piece."""
+    yield b'{"type":"FeatureCollection","features":['
+    separator = b""
+    for row in export_rows(queryset).iterator(chunk_size=CHUNK_SIZE):
+        yield separator + dumps(feature(row))
+        separator = b","
+    yield b"]}"
+
+
+def stream_msgpack(queryset):
+    """
+    Yield one MessagePack-encoded GeoJSON feature after another, to be read
+    back with msgpack.Unpacker.
+    """
+    packer = msgpack.Packer(default=encode_value)
+    for row in export_rows(queryset).iterator(chunk_size=CHUNK_SIZE):
+        yield packer.pack(feature(row))
+
+
+def flatgeobuf_rows(queryset):
+    """
+    export_rows flattened for FlatGeobuf, which has no nested or array
+    columns: address fields are prefixed with address_, owner names are
+    joined with "; " and decimals become floats.
+    """
+    owners = Owner.objects.filter(site=OuterRef("pk"))
+    address = {
+        f"address_{field}": (
+            Cast(f"address__{field}", FloatField())
+            if isinstance(Address._meta.get_field(field), DecimalField)
+            else F(f"address__{field}")
+        )
+        for field in ADDRESS_FIELDS
+    }
+    return (
+        queryset.annotate(
+            owner_names=Func(
+                ArraySubquery(owners.values("name")),
+                Value("; "),
+                function="array_to_string",
+                output_field=TextField()
+            ),
+            metacorp_id=Subquery(
+                owners.filter(metacorp__isnull=False)
+                .order_by("metacorp_id")
+                .values("metacorp_id")[:1]
+            ),
+            geom=F("address__parcel__geometry"),
+            **address
+        )
+        .order_by("id")
+        .values(*SITE_FIELDS, *address, "owner_names", "metacorp_id", "geom")
+    )
+
+
+def flatgeobuf_allowed(queryset):
+    """
+    Whether queryset is small enough to export as FlatGeobuf, counting no
+    further than the limit.
+    """
+    return queryset[:MAX_FLATGEOBUF_SITES + 1].count() <= MAX_FLATGEOBUF_SITES
+
+
+def export_flatgeobuf(queryset):
+    """
+    Encode the sites in queryset as a FlatGeobuf file with a spatial index,
+    using PostGIS's ST_AsFlatGeobuf.
+    """
+    sql, params = flatgeobuf_rows(queryset).query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f"SELECT ST_AsFlatGeobuf(q, true, 'geom') FROM ({sql}) AS q", params
+        )
+        result = cursor.fetchone()[0]
+    return bytes(result) if result else b""
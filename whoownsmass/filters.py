@@ -0,0 +1,38 @@
+from django_filters import rest_framework as filters
+
+from whoownsmass.models import Site, SiteToOwner
+
+
+class CharInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
+
+
+class SiteFilter(filters.FilterSet):
+    """
+    Attribute filters shared by every endpoint that lists sites. `luc`
+    accepts a comma-separated list of land use codes.
+    """
+    muni = filters.CharFilter(field_name="muni_id")
+    luc = CharInFilter(field_name="luc")
+    fy = filters.NumberFilter(field_name="fy")
+
+    class Meta:
+        model = Site
+        fields = ["muni", "luc", "fy"]
+
+
+class SiteExportFilter(SiteFilter):
+    """
+    SiteFilter plus the export scopes: sites owned by a metacorp, or located
+    in a tract.
+    """
+    metacorp = filters.CharFilter(method="filter_metacorp")
+    tract = filters.CharFilter(field_name="address__parcel__tract_id")
+
+    class Meta(SiteFilter.Meta):
+        fields = SiteFilter.Meta.fields + ["metacorp", "tract"]
+
+    def filter_metacorp(self, queryset, name, value):
+        return queryset.filter(
+            id__in=SiteToOwner.objects.filter(owner__metacorp_id=value).values("site_id")
+        )
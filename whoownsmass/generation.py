@@ -0,0 +1,73 @@
+"""
+The data generation stamp: an identifier that changes whenever the ownership
+tables are written to, whether by our own management commands or by the
+external `write_to_django` step. Caches key their entries on it so a new load
+invalidates them without any explicit purge.
+"""
+from time import monotonic
+
+from django.conf import settings
+from django.db import connection
+
+# Tables whose contents feed API responses.
+GENERATION_TABLES = [
+    "metacorps_network",
+    "muni",
+    "block_group",
+    "tract",
+    "parcels_point",
+    "address",
+    "site",
+    "company",
+    "owner",
+    "site_to_owner",
+    "officer",
+    "owner_alias",
+    "geography_rollup",
+]
+
+_cached = {"generation": None, "checked": 0.0}
+
+
+def read_generation():
+    """
+    Hash the write counters PostgreSQL keeps for each table. Any INSERT,
+    UPDATE, DELETE or COPY, or a table being swapped for a new one, changes
+    the result.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT left(md5(string_agg(
+                relid::text || ':' || n_tup_ins || ':' || n_tup_upd || ':' || n_tup_del,
+                ',' ORDER BY relname
+            )), 16)
+            FROM pg_stat_user_tables
+            WHERE relname = ANY(%s)
+            """,
+            [GENERATION_TABLES]
+        )
+        return cursor.fetchone()[0] or "empty"
+
+
+def current_generation():
+    """
+    The current data generation, re-read from the database at most once
+    every DATA_GENERATION_TTL seconds per process.
+    """
+    now = monotonic()
+    if (
+        _cached["generation"] is None
+        or now - _cached["checked"] > settings.DATA_GENERATION_TTL
+    ):
+        _cached["generation"] = read_generation()
+        _cached["checked"] = now
+    return _cached["generation"]
+
+
+def reset_generation():
+    """
+    Forget the cached stamp so the next call to current_generation() reads
+    it again. Commands that load data call this when they finish.
+    """
+    _cached["generation"] = None
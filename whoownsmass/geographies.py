@@ -0,0 +1,141 @@
+"""
+Assignment of parcel points to their municipality, tract and block group,
+for points loaded or corrected without them. Run it with
+`manage.py assign_geographies`.
+
+The default method loads every muni, tract and block group polygon into a
+shapely STRtree in each of a pool of worker processes, then streams parcel
+points to them in chunks; each chunk is matched against all three trees
+with one vectorized query per layer, by the worker code in
+whoownsmass.polygon_trees. Results are copied into a temporary table and
+written back with a single UPDATE. The "sql" method instead runs an
+ST_Contains join in PostGIS over the polygons' spatial indexes.
+
+A point on a shared boundary is within neither polygon and keeps whatever
+it had; where polygons overlap, the lowest id wins. Only missing columns are
+filled in unless every point is re-matched, and assignments are never
+cleared.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.gis.db.models.functions import AsWKB
+from django.db import connection, transaction
+
+from whoownsmass.generation import reset_generation
+from whoownsmass.models import BlockGroup, Municipality, Tract
+from whoownsmass.polygon_trees import assign_chunk, build_trees
+
+CHUNK_SIZE = 50000
+LAYERS = {
+    "muni_id": Municipality,
+    "tract_id": Tract,
+    "block_group_id": BlockGroup,
+}
+
+MISSING_SQL = "p.muni_id IS NULL OR p.tract_id IS NULL OR p.block_group_id IS NULL"
+
+POINTS_SQL = """
+    SELECT p.id, coalesce(p.lng, ST_X(p.geometry)), coalesce(p.lat, ST_Y(p.geometry))
+    FROM parcels_point p
+    WHERE {scope}
+"""
+
+CONTAINS_SQL = """
+    SELECT
+        p.id,
+        (SELECT m.id FROM muni m WHERE ST_Contains(m.geometry, p.geometry) ORDER BY m.id LIMIT 1),
+        (SELECT t.id FROM tract t WHERE ST_Contains(t.geometry, p.geometry) ORDER BY t.id LIMIT 1),
+        (SELECT b.id FROM block_group b WHERE ST_Contains(b.geometry, p.geometry) ORDER BY b.id LIMIT 1)
+    FROM parcels_point p
+    WHERE {scope}
+"""
+
+# With {first} = p, fills only missing columns from parcel_geography (a);
+# with {first} = a, replaces existing ones too where a has a match.
+UPDATE_SQL = """
+    UPDATE parcels_point p SET
+        muni_id = coalesce({first}.muni_id, {second}.muni_id),
+        tract_id = coalesce({first}.tract_id, {second}.tract_id),
+        block_group_id = coalesce({first}.block_group_id, {second}.block_group_id)
+    FROM parcel_geography a
+    WHERE p.id = a.id
+    AND (p.muni_id, p.tract_id, p.block_group_id) IS DISTINCT FROM (
+        coalesce({first}.muni_id, {second}.muni_id),
+        coalesce({first}.tract_id, {second}.tract_id),
+        coalesce({first}.block_group_id, {second}.block_group_id)
+    )
+"""
+
+
+def load_polygons():
+    """The ids and WKB geometries of every polygon, per layer."""
+    polygons = {}
+    for column, model in LAYERS.items():
+        rows = model.objects.order_by("id").values_list("id", AsWKB("geometry"))
+        polygons[column] = ([id for id, _ in rows], [bytes(wkb) for _, wkb in rows])
+    return polygons
+
+
+def point_chunks(scope):
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(POINTS_SQL.format(scope=scope))
+        while chunk := cursor.fetchmany(CHUNK_SIZE):
+            # Points without coordinates cannot be placed.
+            yield [row for row in chunk if row[1] is not None and row[2] is not None]
+
+
+def assigned_chunks(scope, workers):
+    """
+    Match chunks of points across a process pool, each worker holding its
+    own trees. At most two chunks per worker are in flight.
+    """
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=build_trees, initargs=(load_polygons(),)
+    ) as pool:
+        pending = deque()
+        for chunk in point_chunks(scope):
+            pending.append(pool.submit(assign_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def assign_geographies(method="strtree", reassign=False, workers=None, log=print):
+    """
+    Assign parcel points missing a muni, tract or block group, or with
+    reassign every point, by method "strtree" or "sql". Returns the number
+    of points updated.
+    """
+    scope = "true" if reassign else MISSING_SQL
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Dropped on commit, but an enclosing transaction may still hold one.
+        cursor.execute("DROP TABLE IF EXISTS pg_temp.parcel_geography")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE parcel_geography (id varchar(100), muni_id varchar(250), "
+            "tract_id varchar(11), block_group_id varchar(12)) ON COMMIT DROP"
+        )
+        if method == "sql":
+            cursor.execute(
+                f"INSERT INTO parcel_geography {CONTAINS_SQL.format(scope=scope)}"
+            )
+        else:
+            matched = 0
+            for rows in assigned_chunks(scope, workers):
+                with cursor.copy(
+                    "COPY parcel_geography (id, muni_id, tract_id, block_group_id) FROM STDIN"
+                ) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                matched += len(rows)
+                log(f"Matched {matched:,} points.")
+        cursor.execute(
+            UPDATE_SQL.format(first="a", second="p") if reassign
+            else UPDATE_SQL.format(first="p", second="a")
+        )
+        updated = cursor.rowcount
+    reset_generation()
+    return updated
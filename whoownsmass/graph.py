@@ -0,0 +1,174 @@
+"""
+Ownership network graphs: the companies, officers and addresses behind a
+metacorp, or the k-hop neighborhood of one company or officer, as compact
+adjacency JSON for graph renderers.
+
+Nodes are keyed "c:<id>" (company), "o:<id>" (officer) and "a:<id>"
+(address). Officer rows are per company, so a person serving several
+companies appears as several officers joined through a shared address.
+Edges are [source, target, kind] triples:
+
+    officer -> company   "officer"
+    company -> address   "address"
+    officer -> address   "address"
+
+Graphs are built breadth first with a fixed number of queries per hop, and
+stop growing at max_nodes, in which case "truncated" is set.
+"""
+from django.db.models import Q
+
+from whoownsmass.models import Address, Company, Officer, OfficerToRole
+
+MAX_NODES = 2000
+MAX_HOPS = 4
+
+COMPANY_FIELDS = ["id", "name", "address_id", "metacorp_id"]
+OFFICER_FIELDS = ["id", "name", "inst", "company_id", "address_id"]
+ADDRESS_FIELDS = ["id", "addr", "muni"]
+
+
+def fetch(model, fields, condition, seen, limit):
+    """
+    Up to limit + 1 rows of model matching condition that are not in seen,
+    lowest id first. The extra row tells Graph.add the cap was hit.
+    """
+    return list(
+        model.objects.filter(condition)
+        .exclude(id__in=list(seen))
+        .order_by("id")
+        .values(*fields)[:max(limit, 0) + 1]
+    )
+
+
+class Graph:
+    def __init__(self, max_nodes=MAX_NODES):
+        self.max_nodes = max_nodes
+        self.companies = {}
+        self.officers = {}
+        self.addresses = {}
+        self.truncated = False
+
+    def __len__(self):
+        return len(self.companies) + len(self.officers) + len(self.addresses)
+
+    def remaining(self):
+        return self.max_nodes - len(self)
+
+    def add(self, nodes, rows):
+        """Add unseen rows to nodes until the cap is reached. Returns the ids added."""
+        added = []
+        for row in rows:
+            if row["id"] in nodes:
+                continue
+            if len(self) >= self.max_nodes:
+                self.truncated = True
+                break
+            nodes[row["id"]] = row
+            added.append(row["id"])
+        return added
+
+    def add_companies(self, condition):
+        return self.add(self.companies, fetch(
+            Company, COMPANY_FIELDS, condition, self.companies, self.remaining()
+        ))
+
+    def add_officers(self, condition):
+        return self.add(self.officers, fetch(
+            Officer, OFFICER_FIELDS, condition, self.officers, self.remaining()
+        ))
+
+    def add_addresses(self, ids):
+        return self.add(self.addresses, fetch(
+            Address, ADDRESS_FIELDS, Q(id__in=ids), self.addresses, self.remaining()
+        ))
+
+    def expand(self, companies, officers, addresses):
+        """
+        Take one hop out from the given company, officer and address ids,
+        in three queries. Returns the ids added, as the next frontier.
+        """
+        new_officers = self.add_officers(
+            Q(company_id__in=companies) | Q(address_id__in=addresses)
+        )
+        new_companies = self.add_companies(
+            Q(id__in={self.officers[id]["company_id"] for id in officers} - {None})
+            | Q(address_id__in=addresses)
+        )
+        new_addresses = self.add_addresses(
+            {self.companies[id]["address_id"] for id in companies}
+            | {self.officers[id]["address_id"] for id in officers}
+        )
+        return new_companies, new_officers, new_addresses
+
+    def roles(self):
+        roles = {}
+        for officer_id, role in (
+            OfficerToRole.objects.filter(officer_id__in=list(self.officers))
+            .order_by("officer_id", "role_id")
+            .values_list("officer_id", "role_id")
+        ):
+            roles.setdefault(officer_id, []).append(role)
+        return roles
+
+    def data(self):
+        """Nodes and the edges among them, ready to render."""
+        roles = self.roles()
+        nodes = [
+            {"id": f"c:{row['id']}", "type": "company", "label": row["name"],
+             "metacorp": row["metacorp_id"]}
+            for row in self.companies.values()
+        ] + [
+            {"id": f"o:{row['id']}", "type": "officer", "label": row["name"],
+             "inst": row["inst"], "roles": roles.get(row["id"], [])}
+            for row in self.officers.values()
+        ] + [
+            {"id": f"a:{row['id']}", "type": "address",
+             "label": ", ".join(part for part in (row["addr"], row["muni"]) if part)}
+            for row in self.addresses.values()
+        ]
+        edges = []
+        for row in self.officers.values():
+            if row["company_id"] in self.companies:
+                edges.append([f"o:{row['id']}", f"c:{row['company_id']}", "officer"])
+            if row["address_id"] in self.addresses:
+                edges.append([f"o:{row['id']}", f"a:{row['address_id']}", "address"])
+        for row in self.companies.values():
+            if row["address_id"] in self.addresses:
+                edges.append([f"c:{row['id']}", f"a:{row['address_id']}", "address"])
+        return {"nodes": nodes, "edges": edges, "truncated": self.truncated}
+
+
+def metacorp_graph(metacorp_id, max_nodes=MAX_NODES):
+    """
+    The companies in a metacorp, their officers (and any other officers
+    assigned to it) and the addresses of both, in four queries.
+    """
+    graph = Graph(max_nodes)
+    companies = graph.add_companies(Q(metacorp_id=metacorp_id))
+    officers = graph.add_officers(
+        Q(metacorp_id=metacorp_id) | Q(company__metacorp_id=metacorp_id)
+    )
+    graph.add_addresses(
+        {graph.companies[id]["address_id"] for id in companies}
+        | {graph.officers[id]["address_id"] for id in officers}
+    )
+    return graph.data()
+
+
+def neighborhood_graph(kind, pk, hops=2, max_nodes=MAX_NODES):
+    """
+    Everything within hops hops of a company or officer. Returns None if it
+    does not exist.
+    """
+    graph = Graph(max_nodes)
+    if kind == "company":
+        frontier = (graph.add_companies(Q(id=pk)), [], [])
+    else:
+        frontier = ([], graph.add_officers(Q(id=pk)), [])
+    if not any(frontier):
+        return None
+    for _ in range(min(hops, MAX_HOPS)):
+        frontier = graph.expand(*frontier)
+        if not any(frontier):
+            break
+    return graph.data()
@@ -0,0 +1,71 @@
+"""
+Helpers for the secondary indexes declared in the models' Meta.indexes.
+
+The ownership tables are often written from outside Django, so these let
+commands create the declared indexes on tables that lack them, or drop and
+rebuild them around bulk loads.
+"""
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+# PostgreSQL extensions required by the declared indexes.
+EXTENSIONS = ["pg_trgm"]
+
+
+def create_extensions(using=DEFAULT_DB_ALIAS, **kwargs):
+    with connections[using].cursor() as cursor:
+        for extension in EXTENSIONS:
+            cursor.execute(f"CREATE EXTENSION IF NOT EXISTS {extension}")
+
+
+def declared_indexes(tables=None):
+    """
+    Yield (model, index) for every index declared in Meta.indexes, limited
+    to the given table names if any are passed.
+    """
+    for model in apps.get_app_config("whoownsmass").get_models():
+        if tables is not None and model._meta.db_table not in tables:
+            continue
+        for index in model._meta.indexes:
+            yield model, index
+
+
+def existing_index_names():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def create_missing_indexes(tables=None, concurrently=True):
+    """
+    Create each declared index that does not exist yet and return the names
+    of the indexes created. CONCURRENTLY keeps the tables readable while the
+    indexes build, but cannot run inside a transaction.
+    """
+    create_extensions()
+    existing = existing_index_names()
+    created = []
+    with connection.schema_editor(atomic=False) as editor:
+        for model, index in declared_indexes(tables):
+            if index.name in existing:
+                continue
+            editor.add_index(model, index, concurrently=concurrently)
+            created.append(index.name)
+    return created
+
+
+def drop_indexes(tables=None):
+    """
+    Drop each declared index that exists and return the names dropped.
+    """
+    existing = existing_index_names()
+    dropped = []
+    with connection.schema_editor(atomic=False) as editor:
+        for model, index in declared_indexes(tables):
+            if index.name not in existing:
+                continue
+            editor.remove_index(model, index)
+            dropped.append(index.name)
+    return dropped
@@ -0,0 +1,396 @@
+"""
+Bulk loading of the ownership tables from the CSV or Parquet files written
+by the processing pipeline.
+
+Each table is COPY'd into an index-free staging copy of itself, on its own
+connection so independent tables load in parallel. The live table's indexes
+and primary key are then rebuilt on the staging table, foreign keys are
+checked in bulk, and every staging table is swapped into place in a single
+transaction, so the API sees either the old data or the new data and never
+a partial load.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from django.apps import apps
+from django.contrib.gis.db.models import GeometryField
+from django.db import connection, transaction
+
+from whoownsmass.aliases import owner_alias_exists, refresh_owner_aliases
+from whoownsmass.generation import current_generation, reset_generation
+from whoownsmass.rollups import ROLLUP_TABLES, refresh_rollups, rollups_exist
+from whoownsmass.tiles import prune_generations
+
+# Tables the loader accepts, in the order the pipeline writes them.
+LOAD_TABLES = [
+    "parcels_point",
+    "address",
+    "site",
+    "company",
+    "owner",
+    "site_to_owner",
+    "officer",
+]
+STAGING_SUFFIX = "_staging"
+COPY_BLOCK_SIZE = 1 << 20
+PARQUET_BATCH_SIZE = 50000
+
+INDEXDEF_PATTERN = re.compile(
+    r"^(CREATE (?:UNIQUE )?INDEX )(\S+)( ON (?:ONLY )?)(\S+)( .*)$"
+)
+
+
+class LoadError(Exception):
+    pass
+
+
+@dataclass
+class TableLoad:
+    table: str
+    path: str
+    rows: int = 0
+    copy_seconds: float = 0.0
+    index_seconds: float = 0.0
+    # (temporary name on staging, live index name, live constraint name or
+    # None) for each index rebuilt on the staging table.
+    indexes: list = field(default_factory=list)
+
+    @property
+    def staging(self):
+        return staging_name(self.table)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.copy_seconds if self.copy_seconds else 0.0
+
+
+def staging_name(table):
+    return f"{table}{STAGING_SUFFIX}"
+
+
+def model_for_table(table):
+    for model in apps.get_app_config("whoownsmass").get_models():
+        if model._meta.db_table == table:
+            return model
+    raise LoadError(f"No model is stored in table {table}.")
+
+
+def find_files(directory, tables=None):
+    """
+    Map each loadable table to its file in directory, named <table>.csv or
+    <table>.parquet.
+    """
+    files = {}
+    for table in tables or LOAD_TABLES:
+        if table not in LOAD_TABLES:
+            raise LoadError(f"{table} is not a loadable table.")
+        for extension in (".parquet", ".csv"):
+            path = os.path.join(directory, table + extension)
+            if os.path.exists(path):
+                files[table] = path
+                break
+        else:
+            if tables:
+                raise LoadError(f"No {table}.csv or {table}.parquet in {directory}.")
+    return files
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def csv_columns(path):
+    with open(path, newline="") as f:
+        header = f.readline().strip()
+    return [column.strip().strip('"') for column in header.split(",")]
+
+
+def ewkb_hex(wkb, srid):
+    """
+    Hex EWKB for a WKB geometry, adding the SRID PostGIS needs to accept it
+    into a typed geometry column.
+    """
+    byteorder = "little" if wkb[0] == 1 else "big"
+    geom_type = int.from_bytes(wkb[1:5], byteorder)
+    if geom_type & 0x20000000:
+        return wkb.hex()
+    return (
+        wkb[:1]
+        + (geom_type | 0x20000000).to_bytes(4, byteorder)
+        + srid.to_bytes(4, byteorder)
+        + wkb[5:]
+    ).hex()
+
+
+def copy_csv(cursor, staging, path):
+    columns = ", ".join(quote(column) for column in csv_columns(path))
+    with open(path, "rb") as f:
+        with cursor.copy(
+            f"COPY {quote(staging)} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)"
+        ) as copy:
+            while block := f.read(COPY_BLOCK_SIZE):
+                copy.write(block)
+
+
+def copy_parquet(cursor, staging, path, geometry_srids):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise LoadError("Loading Parquet files requires pyarrow (pip install pyarrow).")
+    parquet = pq.ParquetFile(path)
+    columns = parquet.schema_arrow.names
+    column_list = ", ".join(quote(column) for column in columns)
+    with cursor.copy(f"COPY {quote(staging)} ({column_list}) FROM STDIN") as copy:
+        for batch in parquet.iter_batches(batch_size=PARQUET_BATCH_SIZE):
+            for row in batch.to_pylist():
+                copy.write_row([
+                    ewkb_hex(row[column], geometry_srids[column])
+                    if column in geometry_srids and isinstance(row[column], bytes)
+                    else row[column]
+                    for column in columns
+                ])
+
+
+def live_indexes(cursor, table):
+    """
+    The live table's indexes as (name, definition, constraint name,
+    constraint type), so they can be rebuilt on its staging copy.
+    """
+    cursor.execute(
+        """
+        SELECT i.relname, pg_get_indexdef(i.oid), con.conname, con.contype
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        LEFT JOIN pg_constraint con
+            ON con.conindid = x.indexrelid AND con.contype IN ('p', 'u')
+        WHERE x.indrelid = %s::regclass
+        """,
+        [table]
+    )
+    return cursor.fetchall()
+
+
+def build_staging_indexes(cursor, load):
+    """
+    Recreate each of the live table's indexes (and primary key or unique
+    constraints) on the staging table under temporary names.
+    """
+    for n, (name, definition, constraint, contype) in enumerate(live_indexes(cursor, load.table)):
+        match = INDEXDEF_PATTERN.match(definition)
+        if not match:
+            raise LoadError(f"Cannot parse index definition: {definition}")
+        temporary = f"{load.staging}_idx{n}"
+        schema = match.group(4).rsplit(".", 1)[0] + "." if "." in match.group(4) else ""
+        cursor.execute(
+            match.group(1) + quote(temporary) + match.group(3)
+            + schema + quote(load.staging) + match.group(5)
+        )
+        if constraint:
+            kind = "PRIMARY KEY" if contype == "p" else "UNIQUE"
+            temporary_constraint = f"{load.staging}_con{n}"
+            cursor.execute(
+                f"ALTER TABLE {quote(load.staging)} ADD CONSTRAINT {quote(temporary_constraint)} "
+                f"{kind} USING INDEX {quote(temporary)}"
+            )
+            # The index takes the constraint's name.
+            temporary = temporary_constraint
+        load.indexes.append((temporary, name, constraint))
+
+
+def reset_identities(cursor, table):
+    """
+    Restart each identity column of table after its largest value. COPY
+    with explicit ids never advances the sequence, which would otherwise
+    hand out ids from 1 again once the table is live.
+    """
+    cursor.execute(
+        "SELECT attname FROM pg_attribute "
+        "WHERE attrelid = %s::regclass AND attidentity <> '' AND NOT attisdropped",
+        [table]
+    )
+    for (column,) in cursor.fetchall():
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, %s), coalesce(max({quote(column)}), 0) + 1, false) "
+            f"FROM {quote(table)}",
+            [table, column]
+        )
+
+
+def load_table(load):
+    """
+    COPY one file into a fresh staging table, then index and analyze it.
+    Runs on its own connection.
+    """
+    model = model_for_table(load.table)
+    geometry_srids = {
+        f.column: f.srid for f in model._meta.concrete_fields if isinstance(f, GeometryField)
+    }
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {quote(load.staging)}")
+            cursor.execute(
+                f"CREATE TABLE {quote(load.staging)} (LIKE {quote(load.table)} "
+                "INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING GENERATED)"
+            )
+            start = perf_counter()
+            if load.path.endswith(".parquet"):
+                copy_parquet(cursor, load.staging, load.path, geometry_srids)
+            else:
+                copy_csv(cursor, load.staging, load.path)
+            load.copy_seconds = perf_counter() - start
+            cursor.execute(f"SELECT count(*) FROM {quote(load.staging)}")
+            load.rows = cursor.fetchone()[0]
+            reset_identities(cursor, load.staging)
+
+            start = perf_counter()
+            build_staging_indexes(cursor, load)
+            cursor.execute(f"ANALYZE {quote(load.staging)}")
+            load.index_seconds = perf_counter() - start
+    finally:
+        connection.close()
+    return load
+
+
+def foreign_keys(tables):
+    """
+    (child table, column, parent table, parent column) for every foreign key
+    constraint with either end in tables.
+    """
+    keys = []
+    for model in apps.get_app_config("whoownsmass").get_models():
+        if not model._meta.managed:
+            continue
+        for f in model._meta.concrete_fields:
+            if not (f.many_to_one and f.db_constraint):
+                continue
+            parent = f.related_model._meta.db_table
+            child = model._meta.db_table
+            if child in tables or parent in tables:
+                keys.append((child, f.column, parent, f.target_field.column))
+    return keys
+
+
+def check_foreign_keys(tables):
+    """
+    Count rows, in the staged tables or in live tables pointing at them,
+    whose foreign keys would dangle after the swap. Returns
+    [(child, column, parent, violations)] for the keys that fail.
+    """
+    def source(table):
+        return staging_name(table) if table in tables else table
+
+    failures = []
+    with connection.cursor() as cursor:
+        for child, column, parent, parent_column in foreign_keys(tables):
+            cursor.execute(
+                f"""
+                SELECT count(*) FROM {quote(source(child))} c
+                WHERE c.{quote(column)} IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM {quote(source(parent))} p
+                    WHERE p.{quote(parent_column)} = c.{quote(column)}
+                )
+                """
+            )
+            violations = cursor.fetchone()[0]
+            if violations:
+                failures.append((child, column, parent, violations))
+    return failures
+
+
+def live_foreign_keys(cursor, tables):
+    """
+    (child table, constraint name, definition) for every foreign key
+    constraint with either end in tables, as the catalog has them.
+    """
+    cursor.execute(
+        """
+        SELECT con.conrelid::regclass::text, con.conname, pg_get_constraintdef(con.oid)
+        FROM pg_constraint con
+        WHERE con.contype = 'f'
+            AND (con.conrelid = ANY(%s::regclass[]) OR con.confrelid = ANY(%s::regclass[]))
+        ORDER BY con.conname
+        """,
+        [tables, tables]
+    )
+    return cursor.fetchall()
+
+
+def swap_tables(loads):
+    """
+    Replace each live table with its staging copy in one transaction,
+    restoring index, constraint and foreign key names. Dependent objects on
+    the old tables (owner_alias and geography_rollup) are rebuilt before
+    committing, and the re-added foreign keys are validated after.
+    """
+    tables = [load.table for load in loads]
+    rebuild_aliases = owner_alias_exists()
+    rebuild_rollups = rollups_exist()
+    with transaction.atomic(), connection.cursor() as cursor:
+        keys = live_foreign_keys(cursor, tables)
+        for load in loads:
+            cursor.execute(f"ALTER TABLE {quote(load.table)} RENAME TO {quote(load.table + '_old')}")
+            cursor.execute(f"ALTER TABLE {quote(load.staging)} RENAME TO {quote(load.table)}")
+        for load in loads:
+            cursor.execute(f"DROP TABLE {quote(load.table + '_old')} CASCADE")
+        for load in loads:
+            for temporary, name, constraint in load.indexes:
+                if constraint:
+                    cursor.execute(
+                        f"ALTER TABLE {quote(load.table)} RENAME CONSTRAINT "
+                        f"{quote(temporary)} TO {quote(constraint)}"
+                    )
+                else:
+                    cursor.execute(f"ALTER INDEX {quote(temporary)} RENAME TO {quote(name)}")
+        # Foreign keys into or out of the old tables were dropped with them.
+        # They were checked above, so re-adding them NOT VALID skips a rescan
+        # while the tables are locked.
+        for child, name, definition in keys:
+            cursor.execute(
+                f"ALTER TABLE {child} ADD CONSTRAINT {quote(name)} "
+                f"{definition.removesuffix(' NOT VALID')} NOT VALID"
+            )
+        if rebuild_aliases or {"owner", "site_to_owner"} & set(tables):
+            refresh_owner_aliases(concurrently=False)
+        if rebuild_rollups or ROLLUP_TABLES & set(tables):
+            refresh_rollups(concurrently=False)
+    # Validating only takes a lock that lets reads and writes continue.
+    with connection.cursor() as cursor:
+        for child, name, definition in keys:
+            cursor.execute(f"ALTER TABLE {child} VALIDATE CONSTRAINT {quote(name)}")
+    reset_generation()
+    prune_generations(keep=current_generation())
+
+
+def drop_staging(tables):
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f"DROP TABLE IF EXISTS {quote(staging_name(table))}")
+
+
+def load_ownership(files, workers=4, log=print):
+    """
+    Load {table: path} into the database, replacing each table's contents.
+    Returns the TableLoad for each table.
+    """
+    loads = [TableLoad(table, path) for table, path in files.items()]
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for load in pool.map(load_table, loads):
+                log(
+                    f"{load.table}: {load.rows:,} rows in {load.copy_seconds:.1f}s "
+                    f"({load.rows_per_second:,.0f} rows/s), indexed in {load.index_seconds:.1f}s"
+                )
+        failures = check_foreign_keys([load.table for load in loads])
+        if failures:
+            raise LoadError("Foreign key check failed:\n" + "\n".join(
+                f"  {child}.{column} -> {parent}: {violations:,} missing"
+                for child, column, parent, violations in failures
+            ))
+        swap_tables(loads)
+    except Exception:
+        drop_staging(files)
+        raise
+    return loads
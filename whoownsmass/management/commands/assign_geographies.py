@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from whoownsmass.geographies import assign_geographies
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in the municipality, tract and block group of parcel points "
+        "that lack them by point-in-polygon matching."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--method",
+            choices=["strtree", "sql"],
+            default="strtree",
+            help=(
+                "strtree (default) matches in worker processes with shapely; "
+                "sql runs ST_Contains in PostGIS."
+            )
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-match every parcel point, not only those missing an assignment."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Worker processes for the strtree method (default: all cores)."
+        )
+
+    def handle(self, *args, **options):
+        updated = assign_geographies(
+            method=options["method"],
+            reassign=options["all"],
+            workers=options["workers"],
+            log=self.stdout.write
+        )
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated:,} parcel point(s)."))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from whoownsmass.aliases import create_owner_aliases
+from whoownsmass.indexes import create_missing_indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the spatial and join indexes declared on the whoownsmass "
+        "models wherever they are missing, e.g. after tables were written by "
+        "write_to_django, and the owner_alias view if it does not exist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "tables",
+            nargs="*",
+            help="Only index these tables (default: all)."
+        )
+        parser.add_argument(
+            "--blocking",
+            action="store_true",
+            help="Build indexes without CONCURRENTLY (faster, but locks writes)."
+        )
+
+    def handle(self, *args, **options):
+        created = create_missing_indexes(
+            tables=options["tables"] or None,
+            concurrently=not options["blocking"]
+        )
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} index(es) created."))
+        if create_owner_aliases():
+            self.stdout.write(self.style.SUCCESS("Created owner_alias."))
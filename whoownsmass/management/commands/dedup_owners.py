@@ -0,0 +1,56 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from whoownsmass.dedup import THRESHOLD, alias_records, apply_renames, find_duplicates, renames
+
+
+class Command(BaseCommand):
+    help = (
+        "Find owner names that are spelling variants of one another and "
+        "write the proposed renames to a CSV file, or apply them with --apply."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=THRESHOLD,
+            help=f"Minimum trigram similarity to propose a merge (default {THRESHOLD})."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Processes comparing names (default: all cores)."
+        )
+        parser.add_argument(
+            "--output",
+            default="owner_renames.csv",
+            help="CSV file to write proposed renames to (default owner_renames.csv)."
+        )
+        parser.add_argument(
+            "--apply",
+            action="store_true",
+            help="Rename owners and merge the duplicates that leaves."
+        )
+
+    def handle(self, *args, **options):
+        records = alias_records()
+        proposals, stats = find_duplicates(records, options["threshold"], options["workers"])
+        self.stdout.write(
+            f"{stats['names']:,} names, {stats['blocks']:,} blocks "
+            f"({stats['skipped_blocks']:,} too large to compare), "
+            f"{stats['compared']:,} pairs compared in {stats['seconds']:.1f}s, "
+            f"{len(proposals):,} matches."
+        )
+        changes = renames(records, proposals)
+        with open(options["output"], "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "metacorp", "canonical"])
+            writer.writerows(changes)
+        self.stdout.write(f"Wrote {len(changes):,} renames to {options['output']}.")
+        if options["apply"]:
+            merged = apply_renames(changes)
+            self.stdout.write(self.style.SUCCESS(
+                f"Renamed {len(changes):,} names and merged {merged:,} owners."
+            ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from whoownsmass.loading import LOAD_TABLES, LoadError, find_files, load_ownership
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace the ownership tables with the CSV or Parquet files written "
+        "by the processing pipeline, using COPY into staging tables and an "
+        "atomic swap. Files are named <table>.csv or <table>.parquet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "directory",
+            help="Directory holding the exported tables."
+        )
+        parser.add_argument(
+            "--tables",
+            nargs="+",
+            choices=LOAD_TABLES,
+            help="Only load these tables (default: every table with a file)."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Tables to load in parallel, each on its own connection."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            files = find_files(options["directory"], options["tables"])
+            if not files:
+                raise CommandError(f"No table files found in {options['directory']}.")
+            loads = load_ownership(
+                files,
+                workers=options["workers"],
+                log=self.stdout.write
+            )
+        except LoadError as err:
+            raise CommandError(str(err))
+        total = sum(load.rows for load in loads)
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {total:,} rows into {len(loads)} table(s)."
+        ))
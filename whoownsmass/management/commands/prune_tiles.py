@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from whoownsmass.generation import read_generation
+from whoownsmass.tiles import STALE_AGE, prune_generations
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete cached vector tiles of past data generations. load_ownership "
+        "does this itself; run it after writing the tables any other way."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=STALE_AGE,
+            help="Keep generations written to within this many seconds."
+        )
+
+    def handle(self, *args, **options):
+        prune_generations(keep=read_generation(), min_age=options["min_age"])
+        self.stdout.write(self.style.SUCCESS("Pruned the tile cache."))
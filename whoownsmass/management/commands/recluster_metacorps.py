@@ -0,0 +1,52 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from whoownsmass.aggregates import AggregateError
+from whoownsmass.clustering import recluster_metacorps
+from whoownsmass.management.commands.recompute_metacorp_aggregates import timestamp
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-cluster companies into metacorps by their shared company and "
+        "officer addresses, and rewrite the metacorp of every company, "
+        "officer and owner that moved, deleting metacorps left empty. "
+        "Re-clusters everything unless --company or --changed-since is "
+        "given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--company",
+            type=int,
+            action="append",
+            dest="companies",
+            help=(
+                "Only re-cluster around this company, e.g. after adding or "
+                "removing its officers. May be repeated."
+            )
+        )
+        parser.add_argument(
+            "--changed-since",
+            type=timestamp,
+            help=(
+                "Only re-cluster around companies and officers written after "
+                "this date or time (YYYY-MM-DD[ HH:MM]). Needs "
+                "track_commit_timestamp = on."
+            )
+        )
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        try:
+            moved = recluster_metacorps(
+                company_ids=options["companies"],
+                changed_since=options["changed_since"],
+                log=self.stdout.write
+            )
+        except AggregateError as err:
+            raise CommandError(str(err))
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved:,} companies in {perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from whoownsmass.aggregates import AggregateError, recompute_metacorp_aggregates
+
+
+def timestamp(value):
+    parsed = parse_datetime(value) or parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute val, prop_count, unit_count, area, the per-property "
+        "ratios and company_count on metacorps_network from the site, "
+        "owner and company tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--changed-since",
+            type=timestamp,
+            help=(
+                "Only recompute metacorps whose owners, sites or companies "
+                "were written after this date or time (YYYY-MM-DD[ HH:MM]). "
+                "Needs track_commit_timestamp = on."
+            )
+        )
+
+    def handle(self, *args, **options):
+        try:
+            updated = recompute_metacorp_aggregates(options["changed_since"])
+        except AggregateError as err:
+            raise CommandError(str(err))
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated:,} metacorp(s)."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from whoownsmass.aliases import refresh_owner_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or refresh the owner_alias materialized view of distinct "
+        "owner names per metacorp. Run after every data load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--blocking",
+            action="store_true",
+            help="Refresh without CONCURRENTLY (faster, but blocks reads)."
+        )
+
+    def handle(self, *args, **options):
+        refresh_owner_aliases(concurrently=not options["blocking"])
+        self.stdout.write(self.style.SUCCESS("Refreshed owner_alias."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from whoownsmass.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or refresh the geography_rollup materialized view of "
+        "ownership statistics per municipality, tract and block group. Run "
+        "after every data load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--blocking",
+            action="store_true",
+            help="Refresh without CONCURRENTLY (faster, but blocks reads)."
+        )
+
+    def handle(self, *args, **options):
+        refresh_rollups(concurrently=not options["blocking"])
+        self.stdout.write(self.style.SUCCESS("Refreshed geography_rollup."))
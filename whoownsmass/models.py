@@ -1,4 +1,5 @@
 from django.contrib.gis.db import models
+from django.contrib.postgres.indexes import GistIndex
 
 class MetaCorp(models.Model):
     """
@@ -16,7 +17,7 @@ class MetaCorp(models.Model):
         max_length=500,
         help_text="Most common company name within metacorp."
         )
-    val = models.IntegerField(
+    val = models.BigIntegerField(
         blank=True, 
         null=True,
         help_text="Summed building and residential value held by a particular metacorp."
@@ -31,7 +32,7 @@ class MetaCorp(models.Model):
         null=True,
         help_text="Estimated number of units linked to a given metacorp."
         )
-    area = models.IntegerField(
+    area = models.BigIntegerField(
         blank=True, 
         null=True,
         help_text="Summed building area held by a particular metacorp (where 'building area' means the larger of res_area and bld_area)."
@@ -196,12 +197,16 @@ class ParcelPoint(models.Model):
     geometry = models.PointField(
         blank=False, 
         null=False, 
-        srid=4326
+        srid=4326,
+        spatial_index=False
         )
 
     class Meta:
         db_table = "parcels_point"
         managed = True    
+        indexes = [
+            GistIndex(fields=["geometry"], name="parcels_point_geometry_gist"),
+        ]
 
 
 class Address(models.Model):
@@ -265,12 +270,19 @@ class Address(models.Model):
     parcel = models.ForeignKey(
         ParcelPoint, 
         null=True, 
-        on_delete=models.DO_NOTHING
+        on_delete=models.DO_NOTHING,
+        db_index=False
         ) 	
 
     class Meta:
         db_table = "address"
         managed = True
+        indexes = [
+            models.Index(fields=["parcel"], name="address_parcel_idx"),
+            # Address lookup: equality on muni, body and even, then a range
+            # scan on start with end checked in the index.
+            models.Index(fields=["muni", "body", "even", "start", "end"], name="address_range_idx"),
+        ]
 
 class Site(models.Model):
     """
@@ -332,12 +344,16 @@ class Site(models.Model):
     address = models.ForeignKey(
         Address, 
         null=True, 
-        on_delete=models.DO_NOTHING
+        on_delete=models.DO_NOTHING,
+        db_index=False
     )
     
     class Meta:
         managed = True 
         db_table = "site"
+        indexes = [
+            models.Index(fields=["address"], name="site_address_idx"),
+        ]
 
 class Company(models.Model):
     """
@@ -443,7 +459,8 @@ class SiteToOwner(models.Model):
         blank=False, 
         on_delete=models.DO_NOTHING,
         help_text="Identifier of property.",
-        related_name="site_from_owner"
+        related_name="site_from_owner",
+        db_index=False
         )
     owner = models.ForeignKey(
         Owner, 
@@ -451,12 +468,98 @@ class SiteToOwner(models.Model):
         blank=False, 
         on_delete=models.DO_NOTHING,
         help_text="Identifier of owner.",
-        related_name="owner_from_site"
+        related_name="owner_from_site",
+        db_index=False
         )
 
     class Meta:
         managed = True
         db_table = "site_to_owner"
+        indexes = [
+            models.Index(fields=["site"], name="site_to_owner_site_idx"),
+            # Also serves lookups by owner alone, and supports seeking through
+            # a metacorp's portfolio by site id.
+            models.Index(fields=["owner", "site"], name="site_to_owner_owner_site_idx"),
+        ]
+
+class OwnerAlias(models.Model):
+    """
+    Each row is a distinct owner name within a metacorp. Backed by the
+    owner_alias materialized view (see whoownsmass.aliases), which carries
+    its own name search indexes.
+    """
+    id = models.IntegerField(
+        primary_key=True,
+        help_text="Lowest owner id carrying this name within the metacorp."
+        )
+    name = models.CharField(
+        max_length=500,
+        help_text="Deduplicated owner name."
+        )
+    metacorp = models.ForeignKey(
+        MetaCorp,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="aliases"
+        )
+    owner_count = models.IntegerField(
+        help_text="Number of owner rows carrying this name within the metacorp."
+        )
+    site_count = models.IntegerField(
+        help_text="Number of sites owned under this name within the metacorp."
+        )
+
+    class Meta:
+        managed = False
+        db_table = "owner_alias"
+
+class GeographyRollup(models.Model):
+    """
+    Each row summarizes ownership within one municipality, tract or block
+    group. Backed by the geography_rollup materialized view (see
+    whoownsmass.rollups).
+    """
+    id = models.CharField(
+        primary_key=True,
+        max_length=270,
+        help_text="<geography>:<geo_id>."
+        )
+    geography = models.CharField(
+        max_length=20,
+        help_text="One of muni, tract or block_group."
+        )
+    geo_id = models.CharField(
+        max_length=250,
+        help_text="Municipality id or tract/block group GEOID."
+        )
+    site_count = models.IntegerField(
+        help_text="Number of sites."
+        )
+    unit_count = models.IntegerField(
+        help_text="Number of units across all sites."
+        )
+    value = models.BigIntegerField(
+        help_text="Total assessed building and land value."
+        )
+    ooc_rate = models.FloatField(
+        help_text="Share of sites that are owner-occupied."
+        )
+    large_network_unit_share = models.FloatField(
+        null=True,
+        help_text="Share of units held by metacorps with at least whoownsmass.rollups.LARGE_NETWORK sites statewide."
+        )
+    hhi = models.FloatField(
+        null=True,
+        help_text="Herfindahl-Hirschman index of unit ownership, from 0 to 1. Sites without a metacorp count as separate holders."
+        )
+    top_metacorps = models.JSONField(
+        help_text="Largest metacorps by units held, with their site and unit counts."
+        )
+
+    class Meta:
+        managed = False
+        db_table = "geography_rollup"
 
 class Role(models.Model):
     """
@@ -0,0 +1,110 @@
+"""
+Owner name normalization, blocking and trigram comparison, the kernel of
+owner deduplication (see whoownsmass.dedup). It imports nothing from
+Django, so process pool workers started with spawn or forkserver can load
+it without setting up the app registry.
+"""
+import re
+
+PERIODS = re.compile(r"\.")
+PUNCTUATION = re.compile(r"[^A-Z0-9 ]+")
+SPELLINGS = {
+    "CORPORATION": "CORP",
+    "COMPANY": "CO",
+    "INCORPORATED": "INC",
+    "LIMITED": "LTD",
+    "TRUSTEE": "TR",
+    "TRUSTEES": "TR",
+    "TRS": "TR",
+    "TRST": "TRUST",
+    "TRUSTS": "TRUST",
+    "ASSOCIATES": "ASSOC",
+    "PROPERTIES": "PROP",
+    "PROPERTY": "PROP",
+    "HOLDINGS": "HOLDING",
+}
+DROPPED = {"THE"}
+# Common words that make poor blocking keys.
+STOP_WORDS = {
+    "AL", "AND", "ASSOC", "CO", "CORP", "ET", "ETAL", "HOLDING", "INC",
+    "LLC", "LLP", "LP", "LTD", "NOMINEE", "OF", "PROP", "REALTY", "TR",
+    "TRUST",
+}
+
+
+def normalize(name):
+    tokens = PUNCTUATION.sub(" ", PERIODS.sub("", name.upper())).split()
+    return " ".join(SPELLINGS.get(token, token) for token in tokens if token not in DROPPED)
+
+
+def trigrams(normalized):
+    """Word trigrams as pg_trgm builds them: two spaces before, one after."""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def block_keys(normalized):
+    """
+    For each pair of significant words, each word with the other's initial,
+    so a typo in either word still leaves a shared key.
+    """
+    words = {
+        word for word in normalized.split()
+        if len(word) >= 3 and word not in STOP_WORDS
+    }
+    if len(words) < 2:
+        return {normalized[:4], normalized[-4:]} if normalized else set()
+    return {f"{a}|{b[0]}" for a in words for b in words if a != b}
+
+
+def compare_blocks(blocks, threshold, kept):
+    """
+    Compare names within each (key, [(id, normalized, metacorp)]) block.
+    kept holds every block key that is compared, in this batch or another.
+    Returns the number of pairs compared and (id, id, similarity) proposals.
+    """
+    compared = 0
+    proposals = []
+    # Names appear in several blocks of a batch; build their grams once.
+    grams, keys = {}, {}
+    for key, records in blocks:
+        for id, name, _ in records:
+            if id not in grams:
+                grams[id] = trigrams(name)
+                keys[id] = block_keys(name)
+        records = sorted(records, key=lambda record: len(grams[record[0]]))
+        for position, (a_id, _, a_metacorp) in enumerate(records):
+            a, a_keys = grams[a_id], keys[a_id]
+            # Similarity is at most len(a) / len(b) for len(b) >= len(a).
+            longest = len(a) / threshold
+            for b_id, _, b_metacorp in records[position + 1:]:
+                b = grams[b_id]
+                if len(b) > longest:
+                    break
+                if a_metacorp and b_metacorp and a_metacorp != b_metacorp:
+                    continue
+                # Compare each pair once, in the first block both share.
+                if min(a_keys & keys[b_id] & kept) != key:
+                    continue
+                compared += 1
+                shared = len(a & b)
+                similarity = shared / (len(a) + len(b) - shared)
+                if similarity >= threshold:
+                    proposals.append((a_id, b_id, similarity))
+    return compared, proposals
+
+
+# Per-process copy of the kept block keys, set by set_kept.
+_kept = frozenset()
+
+
+def set_kept(kept):
+    global _kept
+    _kept = kept
+
+
+def compare_batch(blocks, threshold):
+    return compare_blocks(blocks, threshold, _kept)
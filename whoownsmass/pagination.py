@@ -0,0 +1,168 @@
+import json
+
+from django.db import connections
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class SmallResultsSetPagination(LimitOffsetPagination):
+    default_limit = 5  # Limit to 5 items per page
+    max_limit = 5  # Optional: maximum allowed page size
+
+
+def estimate_count(queryset):
+    """
+    Planner estimate of the number of rows in queryset, in place of an exact
+    COUNT(*). Unfiltered querysets read pg_class.reltuples for their table;
+    filtered ones use the row estimate from EXPLAIN.
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 for tables that have never been analyzed.
+            if row and row[0] >= 0:
+                return row[0]
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]["Plan Rows"]
+
+
+class SmallResultsSetCursorPagination(CursorPagination):
+    """
+    Opaque-cursor pagination on the primary key. Pages are fetched with an
+    index range scan instead of OFFSET, and no COUNT(*) is run. Pass
+    `count=estimate` to include an approximate total from planner statistics.
+    """
+    ordering = "id"
+    page_size = 5
+    max_page_size = 5
+    page_size_query_param = "limit"
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "estimate":
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = {}
+        if self.count is not None:
+            response["count"] = self.count
+        response.update({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data
+        })
+        return Response(response)
+
+
+class QueryOrderedCursorPagination(SmallResultsSetCursorPagination):
+    """
+    SmallResultsSetCursorPagination in the order the queryset already has,
+    for lists whose ordering depends on the request (e.g. search ranking).
+    The cursor position is taken from the first ordering column.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(queryset.query.order_by)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over a unique, indexed column. Each page is
+    fetched with WHERE <ordering> > <last seen> ORDER BY <ordering> LIMIT n,
+    so page 1,000 costs the same as page 1.
+    """
+    ordering = "id"
+    # Type of the ordering column, used to parse `after`.
+    ordering_type = int
+    page_size = 100
+    max_page_size = 1000
+    after_query_param = "after"
+    page_size_query_param = "limit"
+    invalid_after_message = "Invalid 'after' value."
+
+    def get_after(self, request):
+        after = request.query_params.get(self.after_query_param)
+        if after is None:
+            return None
+        try:
+            return self.ordering_type(after)
+        except ValueError:
+            raise ValidationError({self.after_query_param: self.invalid_after_message})
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset for async views, fetching the page with the async
+        ORM.
+        """
+        return self.finish_page([obj async for obj in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        after = self.get_after(request)
+        if after is not None:
+            queryset = queryset.filter(**{f"{self.ordering}__gt": after})
+        # Fetch one extra row to learn whether there is a next page without
+        # running a COUNT(*).
+        return queryset.order_by(self.ordering)[:self.limit + 1]
+
+    def finish_page(self, page):
+        self.has_next = len(page) > self.limit
+        page = page[:self.limit]
+        self.last = getattr(page[-1], self.ordering) if page else None
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.after_query_param, self.last)
+
+    def get_paginated_data(self, data):
+        return {
+            "next": self.get_next_link(),
+            "results": data
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class GeoJsonKeysetPagination(KeysetPagination):
+    """
+    KeysetPagination for GeoFeatureModelSerializer output: pages are
+    returned as a FeatureCollection with a `next` link.
+    """
+
+    def get_paginated_data(self, data):
+        return {
+            "type": "FeatureCollection",
+            "next": self.get_next_link(),
+            "features": data["features"]
+        }
@@ -0,0 +1,37 @@
+"""
+The STRtree matching run in assign_geographies' worker processes (see
+whoownsmass.geographies). It imports nothing from Django, so workers
+started with spawn or forkserver can load it without setting up the app
+registry.
+"""
+import numpy as np
+import shapely
+
+# Per-process trees, built once by build_trees.
+_trees = {}
+
+
+def build_trees(polygons):
+    for column, (ids, wkbs) in polygons.items():
+        _trees[column] = (np.array(ids, dtype=object), shapely.STRtree(shapely.from_wkb(wkbs)))
+
+
+def assign_chunk(chunk):
+    """
+    (id, muni_id, tract_id, block_group_id) for each (id, x, y) point,
+    with None where no polygon contains it.
+    """
+    ids = [id for id, _, _ in chunk]
+    points = shapely.points(
+        np.array([x for _, x, _ in chunk], dtype=float),
+        np.array([y for _, _, y in chunk], dtype=float)
+    )
+    columns = []
+    for polygon_ids, tree in _trees.values():
+        point_index, polygon_index = tree.query(points, predicate="within")
+        assigned = np.full(len(ids), None, dtype=object)
+        # Later writes win, so write in reverse to keep the lowest polygon.
+        order = np.lexsort((-polygon_index, point_index))
+        assigned[point_index[order]] = polygon_ids[polygon_index[order]]
+        columns.append(assigned.tolist())
+    return list(zip(ids, *columns))
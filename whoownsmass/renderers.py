@@ -0,0 +1,92 @@
+import json
+
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Falls back to DRF's handling of types orjson leaves alone: Decimal, lazy
+# translation strings, querysets, and datetimes, which DRF trims to
+# milliseconds.
+drf_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson, producing the same compact output.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=drf_encoder.default, option=option)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack encoding of the same data the JSON renderer would send.
+    """
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=drf_encoder.default)
+
+
+class MVTRenderer(BaseRenderer):
+    """
+    Passes already-encoded Mapbox Vector Tile bytes through unchanged. Error
+    payloads render as an empty body; the status code carries the error.
+    """
+    media_type = "application/vnd.mapbox-vector-tile"
+    format = "mvt"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return b""
+
+
+class GeoJSONRenderer(BaseRenderer):
+    """
+    Selects GeoJSON output for views that stream their own body; only error
+    payloads pass through render().
+    """
+    media_type = "application/geo+json"
+    format = "geojson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode(self.charset)
+
+
+class NDJSONRenderer(GeoJSONRenderer):
+    """
+    Selects newline-delimited GeoJSON output (one feature per line).
+    """
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class FlatGeobufRenderer(BaseRenderer):
+    """
+    Selects FlatGeobuf output for views that build their own body. Error
+    payloads render as an empty body; the status code carries the error.
+    """
+    media_type = "application/flatgeobuf"
+    format = "fgb"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return b""
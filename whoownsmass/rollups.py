@@ -0,0 +1,165 @@
+"""
+The geography_rollup materialized view: ownership statistics per
+municipality, tract and block group, built once per load so the rollups
+endpoint reads a single indexed row. Refresh it after each load with
+`manage.py refresh_rollups`.
+
+Each site is counted once, under the metacorp its owners resolve to (the
+lowest metacorp id when they span several, as in tiles and exports), and
+located by its parcel point.
+"""
+from django.db import connection
+
+GEOGRAPHIES = ["muni", "tract", "block_group"]
+# Metacorps listed per geography, by units held.
+TOP_N = 10
+# Networks holding at least this many sites statewide count as large.
+LARGE_NETWORK = 10
+# Tables the view reads; loading any of them builds it.
+ROLLUP_TABLES = {"site", "address", "parcels_point", "owner", "site_to_owner", "metacorps_network"}
+
+CREATE_SQL = f"""
+    CREATE MATERIALIZED VIEW geography_rollup AS
+    WITH located AS (
+        SELECT
+            s.id,
+            s.units,
+            s.bld_val::bigint + s.lnd_val AS value,
+            s.ooc,
+            p.muni_id,
+            p.tract_id,
+            p.block_group_id,
+            (
+                SELECT min(o.metacorp_id)
+                FROM site_to_owner sto
+                JOIN owner o ON o.id = sto.owner_id
+                WHERE sto.site_id = s.id
+            ) AS metacorp_id
+        FROM site s
+        JOIN address a ON a.id = s.address_id
+        JOIN parcels_point p ON p.id = a.parcel_id
+    ),
+    network_size AS (
+        SELECT metacorp_id, count(*) AS site_count
+        FROM located
+        WHERE metacorp_id IS NOT NULL
+        GROUP BY metacorp_id
+    ),
+    geo_sites AS (
+        SELECT 'muni' AS geography, muni_id AS geo_id, id, units, value, ooc, metacorp_id
+        FROM located WHERE muni_id IS NOT NULL
+        UNION ALL
+        SELECT 'tract', tract_id, id, units, value, ooc, metacorp_id
+        FROM located WHERE tract_id IS NOT NULL
+        UNION ALL
+        SELECT 'block_group', block_group_id, id, units, value, ooc, metacorp_id
+        FROM located WHERE block_group_id IS NOT NULL
+    ),
+    totals AS (
+        SELECT
+            g.geography,
+            g.geo_id,
+            count(*) AS site_count,
+            sum(g.units) AS unit_count,
+            sum(g.value) AS value,
+            avg(g.ooc::int)::float AS ooc_rate,
+            coalesce(sum(g.units) FILTER (WHERE n.site_count >= {LARGE_NETWORK}), 0)::float
+                / nullif(sum(g.units), 0) AS large_network_unit_share
+        FROM geo_sites g
+        LEFT JOIN network_size n ON n.metacorp_id = g.metacorp_id
+        GROUP BY g.geography, g.geo_id
+    ),
+    -- Sites with no metacorp are each their own holder.
+    holders AS (
+        SELECT
+            geography,
+            geo_id,
+            metacorp_id,
+            count(*) AS site_count,
+            sum(units) AS unit_count
+        FROM geo_sites
+        GROUP BY geography, geo_id, coalesce(metacorp_id, 'site:' || id), metacorp_id
+    ),
+    concentration AS (
+        SELECT
+            h.geography,
+            h.geo_id,
+            sum(power(h.unit_count::float / nullif(t.unit_count, 0), 2)) AS hhi
+        FROM holders h
+        JOIN totals t ON t.geography = h.geography AND t.geo_id = h.geo_id
+        GROUP BY h.geography, h.geo_id
+    ),
+    ranked AS (
+        SELECT
+            h.*,
+            row_number() OVER (
+                PARTITION BY h.geography, h.geo_id
+                ORDER BY h.unit_count DESC, h.site_count DESC, h.metacorp_id
+            ) AS rank
+        FROM holders h
+        WHERE h.metacorp_id IS NOT NULL
+    ),
+    top AS (
+        SELECT
+            r.geography,
+            r.geo_id,
+            jsonb_agg(
+                jsonb_build_object(
+                    'metacorp', r.metacorp_id,
+                    'name', m.name,
+                    'site_count', r.site_count,
+                    'unit_count', r.unit_count
+                )
+                ORDER BY r.rank
+            ) AS top_metacorps
+        FROM ranked r
+        JOIN metacorps_network m ON m.id = r.metacorp_id
+        WHERE r.rank <= {TOP_N}
+        GROUP BY r.geography, r.geo_id
+    )
+    SELECT
+        t.geography || ':' || t.geo_id AS id,
+        t.geography,
+        t.geo_id,
+        t.site_count,
+        t.unit_count,
+        t.value,
+        t.ooc_rate,
+        t.large_network_unit_share,
+        c.hhi,
+        coalesce(top.top_metacorps, '[]'::jsonb) AS top_metacorps
+    FROM totals t
+    JOIN concentration c ON c.geography = t.geography AND c.geo_id = t.geo_id
+    LEFT JOIN top ON top.geography = t.geography AND top.geo_id = t.geo_id
+"""
+
+INDEX_SQL = [
+    # REFRESH ... CONCURRENTLY needs a unique index over plain columns.
+    "CREATE UNIQUE INDEX IF NOT EXISTS geography_rollup_id_idx ON geography_rollup (id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS geography_rollup_geo_idx ON geography_rollup (geography, geo_id)",
+]
+
+
+def rollups_exist():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_matviews WHERE schemaname = current_schema() AND matviewname = 'geography_rollup'"
+        )
+        return cursor.fetchone() is not None
+
+
+def refresh_rollups(concurrently=True):
+    """
+    Create geography_rollup if it does not exist, otherwise refresh it. A
+    concurrent refresh leaves the view readable throughout.
+    """
+    with connection.cursor() as cursor:
+        if not rollups_exist():
+            cursor.execute(CREATE_SQL)
+        elif concurrently:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY geography_rollup")
+        else:
+            cursor.execute("REFRESH MATERIALIZED VIEW geography_rollup")
+        for sql in INDEX_SQL:
+            cursor.execute(sql)
+        cursor.execute("ANALYZE geography_rollup")
@@ -1,9 +1,32 @@
-import re
 import csv
-import string
+import os
+from time import perf_counter
+
 from django.db.models.functions import Length
 from who_owns.models import Docket, Filing, Plaintiff, Defendant, Attorney
 
+# get_attorney_and_client_from_str is re-exported for existing callers.
+from whoownsmass.scripts.docket_parsing import (  # noqa: F401
+    CHUNK_SIZE,
+    FAILED,
+    get_attorney_and_client_from_str,
+    parsed_chunks,
+)
+
+FIELDNAMES = [
+    "docket_id",
+    "text",
+    "action",
+    "new_attorney_type",
+    "new_attorney",
+    "new_attorney_bar",
+    "p_name",
+    "ptf_bar",
+    "d_name",
+    "def_bar",
+    "client",
+]
+
 dockets = (
     Docket.objects.filter(text__contains="Attorney Appearance")
     .annotate(text_len=Length("text"))
@@ -11,146 +34,126 @@ dockets = (
 )
 
 
-def run_extraction():
-    failures = 0
-    successes = 0
-    attorney_hits = 0
-    attorney_exists = 0
-    with open("results.csv", "a+") as f:
-        fieldnames = [
-            "docket_id",
-            "text",
-            "action",
-            "new_attorney_type",
-            "new_attorney",
-            "new_attorney_bar",
-            "p_name",
-            "ptf_bar",
-            "d_name",
-            "def_bar",
-            "client",
-        ]
-        csvwriter = csv.DictWriter(f, fieldnames=fieldnames)
-        csvwriter.writeheader()
-        for docket in dockets:
-            res = get_attorney_and_client_from_str(docket.text)
-            if res == (None, None, None, None):
-                failures += 1
-            else:
-                filing = Filing.objects.get(docket_id=docket.docket_id)
-                plaintiffs = Plaintiff.objects.filter(
-                    docket=docket.docket_id
-                ).values_list("name")
-                defendants = Defendant.objects.filter(
-                    docket=docket.docket_id
-                ).values_list("name")
+def iter_chunks(queryset, size):
+    """
+    Stream (docket_id, text) pairs from a server-side cursor in lists of
+    size.
+    """
+    chunk = []
+    for row in queryset.values_list("docket_id", "text").iterator(chunk_size=size):
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def group_names(rows):
+    grouped = {}
+    for docket_id, name in rows:
+        grouped.setdefault(docket_id, []).append(name)
+    return grouped
+
+
+def resolve_chunk(parsed):
+    """
+    Fetch filings, parties and attorneys for every parsed docket in the
+    chunk with four queries, and build the output rows.
+    """
+    docket_ids = [docket_id for docket_id, _, res in parsed]
+    filings = {
+        filing.docket_id: filing
+        for filing in Filing.objects.filter(docket_id__in=docket_ids)
+    }
+    plaintiffs = group_names(
+        Plaintiff.objects.filter(docket__in=docket_ids).values_list("docket", "name")
+    )
+    defendants = group_names(
+        Defendant.objects.filter(docket__in=docket_ids).values_list("docket", "name")
+    )
+    attorney_bars = group_names(
+        Attorney.objects.filter(
+            name__in={res[0] for _, _, res in parsed if res[0]}
+        ).values_list("name", "bar")
+    )
 
-                attorney_type, defendant, plaintiff, new_attorney, new_attorney_bar = (
-                    None,
-                    None,
-                    None,
-                    None,
-                    None,
-                )
+    rows = []
+    for docket_id, text, res in parsed:
+        filing = filings.get(docket_id)
+        ptf_names = plaintiffs.get(docket_id, [])
+        def_names = defendants.get(docket_id, [])
+        attorney_type, defendant, plaintiff, new_attorney, new_attorney_bar = (
+            None,
+            None,
+            None,
+            None,
+            None,
+        )
 
-                # figure out if it's on the plaintiff or defendant side
-                if not res[3]:
-                    if res[1]:
-                        for ptf in plaintiffs:
-                            if res[1] == ptf[0]:
-                                attorney_type = "ptf"
-                                plaintiff = ptf[0]
-                                break
-                        if not attorney_type:
-                            for defe in defendants:
-                                if res[1] == defe[0]:
-                                    attorney_type = "def"
-                                    defendant = defe[0]
-                                    break
+        # figure out if it's on the plaintiff or defendant side
+        if not res[3]:
+            if res[1]:
+                if res[1] in ptf_names:
+                    attorney_type = "ptf"
+                    plaintiff = res[1]
+                elif res[1] in def_names:
+                    attorney_type = "def"
+                    defendant = res[1]
+        elif res[3] == "ptf":
+            attorney_type = res[3]
+            if res[1] in ptf_names:
+                plaintiff = res[1]
+        elif res[3] == "def":
+            attorney_type = res[3]
+            if res[1] in def_names:
+                defendant = res[1]
+        if res[0]:
+            new_attorney = res[0]
+            bars = attorney_bars.get(res[0], [])
+            if len(bars) == 1:
+                new_attorney_bar = bars[0]
 
-                elif res[3] == "ptf":
-                    attorney_type = res[3]
-                    for ptf in plaintiffs:
-                        if res[1] == ptf[0]:
-                            attorney_type = "ptf"
-                            plaintiff = ptf
-                            break
-                elif res[3] == "def":
-                    attorney_type = res[3]
-                    for defe in defendants:
-                        if res[1] == defe[0]:
-                            attorney_type = "def"
-                            defendant = defe
-                            break
-                if res[0]:
-                    attorney_exists += 1
-                    new_attorney = res[0]
-                    attorneys = Attorneys.objects.filter(name=res[0])
-                    if len(attorneys) == 1:
-                        attorney_hits += 1
-                        new_attorney_bar = attorneys.first().bar
+        rows.append({
+            "docket_id": docket_id,
+            "text": text,
+            "action": res[2],
+            "ptf_bar": filing.ptf_attorney_id if filing else None,
+            "def_bar": filing.def_attorney_id if filing else None,
+            "d_name": defendant,
+            "p_name": plaintiff,
+            "new_attorney_type": attorney_type,
+            "new_attorney": new_attorney,
+            "new_attorney_bar": new_attorney_bar,
+        })
+    return rows
 
-                row = {
-                    "docket_id": docket.docket_id,
-                    "text": docket.text,
-                    "action": res[2],
-                    "ptf_bar": filing.ptf_attorney_id,
-                    "def_bar": filing.def_attorney_id,
-                    "d_name": defendant,
-                    "p_name": plaintiff,
-                    "new_attorney_type": attorney_type,
-                    "new_attorney": new_attorney,
-                    "new_attorney_bar": new_attorney_bar,
-                }
-                csvwriter.writerow(row)
-                successes += 1
+
+def run_extraction(path="results.csv", chunk_size=CHUNK_SIZE, workers=None):
+    workers = workers or os.cpu_count()
+    failures = 0
+    successes = 0
+    attorney_hits = 0
+    attorney_exists = 0
+    start = perf_counter()
+    with open(path, "a+", newline="") as f:
+        csvwriter = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        if f.tell() == 0:
+            csvwriter.writeheader()
+        for parsed in parsed_chunks(iter_chunks(dockets, chunk_size), workers):
+            matched = [row for row in parsed if row[2] != FAILED]
+            failures += len(parsed) - len(matched)
+            rows = resolve_chunk(matched)
+            attorney_exists += sum(1 for row in rows if row["new_attorney"])
+            attorney_hits += sum(1 for row in rows if row["new_attorney_bar"])
+            successes += len(rows)
+            csvwriter.writerows(rows)
+            f.flush()
+            elapsed = perf_counter() - start
+            print(f"{successes + failures} dockets, {(successes + failures) / elapsed:.0f}/s")
     return {
         "failures": failures,
         "successes": successes,
         "attorney_hits": attorney_hits,
         "attorney_exists": attorney_exists,
     }
-
-
-def get_attorney_and_client_from_str(input_str):
-    """
-    >>> get_attorney_and_client_from_str('Attorney Appearance | On this date 12/11/2019 Pro Se added for Example, Bob')
-    ('Pro Se', 'Example, Bob', 'added', None)
-    >>> get_attorney_and_client_from_str('Attorney Appearance | On this date 12/03/2019 Ashton, Esq., Donna M added for Longview Apartments at Georgetown, LLC')
-    ('Ashton Donna M', 'Longview Apartments at Georgetown, LLC', 'added', None)
-    >>> get_attorney_and_client_from_str('On this date Judrick K Fletcher, Esq. added as Limited Assistance Representation for Defendant Elvin Cochran')
-    ('Judrick K Fletcher', 'Elvin Cochran', 'added', 'def')
-    >>> get_attorney_and_client_from_str('Attorney Appearance | On this date Pro Se dismissed/withdrawn for Defendant Elvin Cochran')
-    ('Pro Se', 'Elvin Cochran', 'dismissed', 'def')
-    >>> get_attorney_and_client_from_str('Attorney Appearance for Defendant by K. Wibby, Esq.')
-    """
-    try:
-        try:
-            _, parties = re.split(
-                r"(?:On this date)(?:\s*)?(?:\d{2}\/\d{2}\/\d{4})?\s*", input_str
-            )
-        except:
-            parties = input_str
-        attorney, action, client = re.split(
-            r"(?:\s*)(added as| added for|withdrawn for|dismissed for|dismissed\/withdrawn for|dismissed\/withdrawn as|withdrawn as)(?:\s*)",
-            parties,
-        )
-        action = action.lower()
-        if ("dismissed" in action) or ("withdrawn" in action):
-            action = "dismissed"
-        elif "added" in action:
-            action = "added"
-        attorney_type = None
-        if "Defendant" in client:
-            client = client.split("Defendant")[-1].strip()
-            attorney_type = "def"
-        elif "Plaintiff" in client:
-            client = client.split("Plaintiff")[-1].strip()
-            attorney_type = "ptf"
-        if "Esq." in attorney:
-            attorney = attorney.translate(str.maketrans("", "", string.punctuation))
-            attorney = "".join(attorney.split(" Esq"))
-        return (attorney, client, action, attorney_type)
-    except Exception as err:
-        print("Exception", input_str)
-        return (None, None, None, None)
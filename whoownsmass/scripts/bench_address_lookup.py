@@ -0,0 +1,55 @@
+"""
+Measure address lookup latency through the /lookup/address/ endpoint,
+using real addresses typed out in full.
+
+    python manage.py runscript bench_address_lookup --script-args 500
+
+The argument is the number of queries to time (default 500). Half query a
+single-number address and half a number inside a range address. Reports
+p50 and p95; the target is a p95 under 30 ms.
+"""
+import random
+from statistics import quantiles
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from whoownsmass.models import Address
+from whoownsmass.views import AddressLookupView
+
+factory = APIRequestFactory()
+view = AddressLookupView.as_view()
+
+
+def sample(n, ranges):
+    """Up to n (number, body, muni) from single-number or range addresses."""
+    condition = '"end" - start >= 2' if ranges else '"end" = start'
+    return [
+        (
+            random.randrange(int(address.start), int(address.end) + 1, 2) if ranges else int(address.start),
+            address.body,
+            address.muni,
+        )
+        for address in Address.objects.raw(
+            'SELECT id, start, "end", body, muni FROM address TABLESAMPLE SYSTEM (1) '
+            f"WHERE body IS NOT NULL AND muni IS NOT NULL AND {condition} LIMIT %s",
+            [n]
+        )
+    ]
+
+
+def run(*args):
+    n = int(args[0]) if args else 500
+    user = get_user_model()(username="bench")
+    queries = sample(n // 2, ranges=False) + sample(n - n // 2, ranges=True)
+    timings = []
+    # "_" keeps every request out of the response cache.
+    for i, (number, body, muni) in enumerate(queries):
+        request = factory.get("/lookup/address/", {"q": f"{number} {body}, {muni}", "_": i})
+        force_authenticate(request, user=user)
+        start = perf_counter()
+        view(request).render()
+        timings.append((perf_counter() - start) * 1000)
+    cuts = quantiles(timings, n=100)
+    print(f"{len(queries)} queries, p50 {cuts[49]:.2f} ms, p95 {cuts[94]:.2f} ms")
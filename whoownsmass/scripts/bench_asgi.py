@@ -0,0 +1,50 @@
+"""
+Compare concurrent metacorp throughput of the sync endpoints under gunicorn
+(WSGI) with the async endpoints under uvicorn (ASGI).
+
+Start both servers with the same number of worker processes, e.g.
+
+    gunicorn whoownsmass.wsgi -w 4 -b 127.0.0.1:8000
+    uvicorn whoownsmass.asgi:application --workers 4 --port 8001
+
+then run
+
+    python manage.py runscript bench_asgi --script-args http://127.0.0.1:8000 http://127.0.0.1:8001 64 1000
+
+The arguments are the WSGI and ASGI base URLs, the number of concurrent
+clients (default 64) and requests per server (default 1000). Requests
+retrieve metacorps with their sites, sampled from mid-sized networks, so
+each one waits on several prefetch queries.
+"""
+from urllib.parse import urlencode
+
+from whoownsmass.models import MetaCorp
+from whoownsmass.scripts.bench_load import bench_token, load
+
+
+def run(*args):
+    wsgi_url = (args[0] if args else "http://127.0.0.1:8000").rstrip("/")
+    asgi_url = (args[1] if len(args) > 1 else "http://127.0.0.1:8001").rstrip("/")
+    clients = int(args[2]) if len(args) > 2 else 64
+    n = int(args[3]) if len(args) > 3 else 1000
+    token = bench_token()
+    ids = list(
+        MetaCorp.objects.filter(prop_count__range=(20, 200))
+        .order_by("?").values_list("id", flat=True)[:100]
+    )
+
+    def urls(base_url):
+        # "_" keeps every request out of the sync endpoints' response cache.
+        return [
+            f"{base_url}/{ids[i % len(ids)]}/?{urlencode({'_': i})}"
+            for i in range(n)
+        ]
+
+    print(f"{n} requests per server, {clients} clients")
+    print(f"{'server':<18}{'requests/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, base_url in (
+        ("gunicorn (sync)", f"{wsgi_url}/metacorps"),
+        ("uvicorn (async)", f"{asgi_url}/async/metacorps"),
+    ):
+        rate, p50, p99 = load(urls(base_url), token, clients)
+        print(f"{name:<18}{rate:>12.0f}{p50:>10.1f}{p99:>10.1f}")
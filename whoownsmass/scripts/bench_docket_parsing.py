@@ -0,0 +1,105 @@
+"""
+Measure docket parsing throughput on a synthetic corpus.
+
+    python manage.py runscript bench_docket_parsing --script-args 200000 8
+
+The arguments are the number of dockets (default 200000) and pool workers
+(default: all cores). Compares per-call regexes, precompiled patterns and
+the process pool used by attorney_standins.run_extraction.
+"""
+import os
+import random
+import re
+import string
+from time import perf_counter
+
+from whoownsmass.scripts.docket_parsing import CHUNK_SIZE, get_attorney_and_client_from_str, parsed_chunks
+
+TEMPLATES = [
+    "Attorney Appearance | On this date {date} {attorney} added for {client}",
+    "Attorney Appearance | On this date {date} {attorney}, Esq. added for Plaintiff {client}",
+    "On this date {attorney}, Esq. added as Limited Assistance Representation for Defendant {client}",
+    "Attorney Appearance | On this date {attorney} dismissed/withdrawn for Defendant {client}",
+    "Attorney Appearance for Defendant by {attorney}, Esq.",
+]
+FIRST = ["Donna", "Judrick", "Elvin", "Maria", "Kevin", "Priya", "Sean", "Lucia"]
+LAST = ["Ashton", "Fletcher", "Cochran", "Nguyen", "Walsh", "Okafor", "Rossi"]
+COMPANIES = ["Longview Apartments at Georgetown, LLC", "Harbor Point Realty Trust", "Mill St Holdings LLC"]
+
+
+def synthetic_dockets(n):
+    random.seed(0)
+    for docket_id in range(n):
+        yield docket_id, random.choice(TEMPLATES).format(
+            date=f"{random.randint(1, 12):02}/{random.randint(1, 28):02}/20{random.randint(10, 23)}",
+            attorney=f"{random.choice(LAST)}, {random.choice(FIRST)}",
+            client=random.choice(COMPANIES + [f"{random.choice(FIRST)} {random.choice(LAST)}"]),
+        )
+
+
+def uncompiled(input_str):
+    """The parser as it was before its patterns were compiled once."""
+    try:
+        try:
+            _, parties = re.split(
+                r"(?:On this date)(?:\s*)?(?:\d{2}\/\d{2}\/\d{4})?\s*", input_str
+            )
+        except:
+            parties = input_str
+        attorney, action, client = re.split(
+            r"(?:\s*)(added as| added for|withdrawn for|dismissed for|dismissed\/withdrawn for|dismissed\/withdrawn as|withdrawn as)(?:\s*)",
+            parties,
+        )
+        action = action.lower()
+        if ("dismissed" in action) or ("withdrawn" in action):
+            action = "dismissed"
+        elif "added" in action:
+            action = "added"
+        attorney_type = None
+        if "Defendant" in client:
+            client = client.split("Defendant")[-1].strip()
+            attorney_type = "def"
+        elif "Plaintiff" in client:
+            client = client.split("Plaintiff")[-1].strip()
+            attorney_type = "ptf"
+        if "Esq." in attorney:
+            attorney = attorney.translate(str.maketrans("", "", string.punctuation))
+            attorney = "".join(attorney.split(" Esq"))
+        return (attorney, client, action, attorney_type)
+    except Exception:
+        print("Exception", input_str)
+        return (None, None, None, None)
+
+
+def chunks(corpus, size):
+    for i in range(0, len(corpus), size):
+        yield corpus[i:i + size]
+
+
+def run(*args):
+    n = int(args[0]) if args else 200000
+    workers = int(args[1]) if len(args) > 1 else os.cpu_count()
+    corpus = list(synthetic_dockets(n))
+    # The unmatched template prints an exception line per docket.
+    null = open(os.devnull, "w")
+
+    def timed(parse):
+        start = perf_counter()
+        stdout = os.dup(1)
+        os.dup2(null.fileno(), 1)
+        try:
+            parse()
+        finally:
+            os.dup2(stdout, 1)
+            os.close(stdout)
+        return n / (perf_counter() - start)
+
+    results = [
+        ("uncompiled", timed(lambda: [uncompiled(text) for _, text in corpus])),
+        ("compiled", timed(lambda: [get_attorney_and_client_from_str(text) for _, text in corpus])),
+        (f"pool x{workers}", timed(lambda: list(parsed_chunks(chunks(corpus, CHUNK_SIZE), workers)))),
+    ]
+    print(f"{n} dockets")
+    print(f"{'parser':<14}{'dockets/s':>12}")
+    for name, rate in results:
+        print(f"{name:<14}{rate:>12,.0f}")
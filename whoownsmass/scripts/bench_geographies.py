@@ -0,0 +1,51 @@
+"""
+Compare point-in-polygon assignment of parcel points with shapely STRtrees
+against PostGIS ST_Contains.
+
+    python manage.py runscript bench_geographies --script-args 100000
+
+The argument is the number of parcel points sampled (default 100000).
+Both methods match the same points against every muni, tract and block
+group without writing anything; the STRtree side runs in this process, so
+its rate is per worker. Reports points per second for each and how often
+they agree.
+"""
+from time import perf_counter
+
+from django.db import connection
+
+from whoownsmass.geographies import CONTAINS_SQL, load_polygons
+from whoownsmass.polygon_trees import assign_chunk, build_trees
+
+
+def run(*args):
+    n = int(args[0]) if args else 100000
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT p.id, coalesce(p.lng, ST_X(p.geometry)), coalesce(p.lat, ST_Y(p.geometry)) "
+            "FROM parcels_point p TABLESAMPLE SYSTEM (5) LIMIT %s",
+            [n]
+        )
+        points = cursor.fetchall()
+    ids = [id for id, _, _ in points]
+    scope = "p.id = ANY(%s)"
+
+    start = perf_counter()
+    build_trees(load_polygons())
+    built = perf_counter() - start
+    start = perf_counter()
+    strtree = {row[0]: row[1:] for row in assign_chunk(points)}
+    strtree_seconds = perf_counter() - start
+
+    start = perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(CONTAINS_SQL.format(scope=scope), [ids])
+        sql = {row[0]: row[1:] for row in cursor.fetchall()}
+    sql_seconds = perf_counter() - start
+
+    agree = sum(strtree[id] == sql.get(id) for id in ids) / len(ids)
+    print(f"{len(ids):,} points, trees built in {built:.1f}s")
+    print(f"{'method':<10}{'points/s':>12}")
+    print(f"{'strtree':<10}{len(ids) / strtree_seconds:>12,.0f}")
+    print(f"{'sql':<10}{len(ids) / sql_seconds:>12,.0f}")
+    print(f"{agree:.2%} of points assigned identically")
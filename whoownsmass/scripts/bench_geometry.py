@@ -0,0 +1,71 @@
+"""
+Measure per-feature CPU time of site FeatureCollections with point
+geometries built from lat/lng, against parsing the geometry column into
+GEOS points.
+
+    python manage.py runscript bench_geometry --script-args 5000 5
+
+The first argument is the number of sites serialized (default 5000), the
+second the repetitions (default 5). Timings cover fetching the rows and
+serializing them with SimpleSiteSerializer.
+"""
+import json
+from statistics import median
+from time import process_time
+
+from django.db.models import Prefetch
+
+from whoownsmass.models import Site
+from whoownsmass.serializers import OwnerSerializer, SimpleSiteSerializer
+from whoownsmass.views import owner_queryset, site_queryset
+
+
+def geos_geometry(obj):
+    """The previous path: a GEOS point rendered back to GeoJSON."""
+    if not (obj.address and obj.address.parcel):
+        return None
+    return json.loads(obj.address.parcel.geometry.geojson)
+
+
+class GEOSOwnerSerializer(OwnerSerializer):
+    def get_geometry(self, obj):
+        return geos_geometry(obj)
+
+
+class GEOSSiteSerializer(SimpleSiteSerializer):
+    def get_geometry(self, obj):
+        return geos_geometry(obj)
+
+    def get_owners(self, obj):
+        return [GEOSOwnerSerializer(owner).data for owner in obj.owners.all()]
+
+
+def geos_queryset():
+    """site_queryset() with the geometry column fetched and parsed."""
+    return Site.objects.select_related("address__parcel").prefetch_related(
+        Prefetch(
+            "owners",
+            queryset=owner_queryset().defer(None)
+        )
+    )
+
+
+def time_serializer(serializer_class, queryset, ids, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = process_time()
+        serializer_class(list(queryset.filter(id__in=ids)), many=True).data
+        timings.append(process_time() - start)
+    return median(timings) / len(ids) * 1e6
+
+
+def run(*args):
+    n = int(args[0]) if args else 5000
+    repeat = int(args[1]) if len(args) > 1 else 5
+    ids = list(Site.objects.order_by("id").values_list("id", flat=True)[:n])
+    geos = time_serializer(GEOSSiteSerializer, geos_queryset(), ids, repeat)
+    latlng = time_serializer(SimpleSiteSerializer, site_queryset(), ids, repeat)
+    print(f"{len(ids)} sites")
+    print(f"{'geometry':<10}{'us/feature':>12}")
+    print(f"{'GEOS':<10}{geos:>12.1f}")
+    print(f"{'lat/lng':<10}{latlng:>12.1f}")
@@ -0,0 +1,78 @@
+"""
+Load-test a running server with concurrent owner searches, to compare
+connection settings.
+
+    python manage.py runscript bench_load --script-args http://127.0.0.1:8000 16 2000
+
+The arguments are the server's base URL (default http://127.0.0.1:8000),
+the number of concurrent clients (default 16) and the total number of
+requests (default 2000). Each request is a prefix search for a real owner
+name, which costs the database well under a millisecond, so connection
+setup dominates when connections are not reused. Run the server once with
+DB_POOL=false CONN_MAX_AGE=0 and once with the defaults, against a
+database that requires SSL, and compare the p50 and p99 reported.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from time import perf_counter
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.contrib.auth import get_user_model
+from rest_framework.authtoken.models import Token
+
+from whoownsmass.models import Owner
+
+
+def bench_token():
+    user, _ = get_user_model().objects.get_or_create(username="bench")
+    token, _ = Token.objects.get_or_create(user=user)
+    return token.key
+
+
+def fetch(url, token):
+    request = Request(url, headers={
+        "Authorization": f"Token {token}",
+        "Accept": "application/json",
+    })
+    start = perf_counter()
+    with urlopen(request) as response:
+        json.load(response)
+    return (perf_counter() - start) * 1000
+
+
+def load(urls, token, clients):
+    """
+    Fetch urls with clients concurrent clients. Returns requests per second
+    and the p50 and p99 latency in milliseconds.
+    """
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        timings = list(pool.map(lambda url: fetch(url, token), urls))
+    elapsed = perf_counter() - start
+    cuts = quantiles(timings, n=100)
+    return len(urls) / elapsed, cuts[49], cuts[98]
+
+
+def run(*args):
+    base_url = (args[0] if args else "http://127.0.0.1:8000").rstrip("/")
+    clients = int(args[1]) if len(args) > 1 else 16
+    n = int(args[2]) if len(args) > 2 else 2000
+    names = [
+        owner.name for owner in Owner.objects.raw(
+            "SELECT id, name FROM owner TABLESAMPLE SYSTEM (1) WHERE length(name) > 6 LIMIT %s",
+            [n]
+        )
+    ]
+    # The unused "_" parameter gives every request its own response cache
+    # key, so each one reaches the database.
+    urls = [
+        f"{base_url}/owners/?" + urlencode({
+            "search": names[i % len(names)][:4], "match": "prefix", "_": i
+        })
+        for i in range(n)
+    ]
+    rate, p50, p99 = load(urls, bench_token(), clients)
+    print(f"{n} requests, {clients} clients, {rate:.0f} requests/s")
+    print(f"p50 {p50:.1f} ms, p99 {p99:.1f} ms")
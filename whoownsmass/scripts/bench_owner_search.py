@@ -0,0 +1,57 @@
+"""
+Measure owner search latency through the /owners/ endpoint using real owner
+names with an injected typo.
+
+    python manage.py runscript bench_owner_search --script-args 200
+
+The argument is the number of queries to time (default 200). Reports p50
+and p95 for fuzzy and prefix matching.
+"""
+import random
+from statistics import quantiles
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from whoownsmass.models import Owner
+from whoownsmass.views import OwnerViewset
+
+factory = APIRequestFactory()
+view = OwnerViewset.as_view({"get": "list"})
+
+
+def typo(name):
+    """Drop one character from the middle of name."""
+    i = random.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1:]
+
+
+def time_search(queries, user, **params):
+    timings = []
+    for query in queries:
+        request = factory.get("/owners/", {"search": query, **params})
+        force_authenticate(request, user=user)
+        start = perf_counter()
+        view(request).render()
+        timings.append((perf_counter() - start) * 1000)
+    cuts = quantiles(timings, n=100)
+    return cuts[49], cuts[94]
+
+
+def run(*args):
+    n = int(args[0]) if args else 200
+    user = get_user_model()(username="bench")
+    # TABLESAMPLE avoids an ORDER BY random() over the whole table.
+    names = [
+        owner.name for owner in Owner.objects.raw(
+            "SELECT id, name FROM owner TABLESAMPLE SYSTEM (1) WHERE length(name) > 6 LIMIT %s",
+            [n]
+        )
+    ]
+    fuzzy = time_search([typo(name) for name in names], user)
+    prefix = time_search([name[:4] for name in names], user, match="prefix")
+    print(f"{len(names)} queries")
+    print(f"{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}")
+    print(f"{'fuzzy':<10}{fuzzy[0]:>10.2f}{fuzzy[1]:>10.2f}")
+    print(f"{'prefix':<10}{prefix[0]:>10.2f}{prefix[1]:>10.2f}")
@@ -0,0 +1,71 @@
+"""
+Compare LIMIT/OFFSET and cursor pagination latency on the site list.
+
+    python manage.py runscript bench_pagination --script-args 10000 20
+
+The first argument is the deep page to time (default 10,000), the second the
+number of repetitions per measurement (default 20).
+"""
+from statistics import median
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
+
+from rest_framework.pagination import Cursor
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from whoownsmass.models import Site
+from whoownsmass.pagination import (
+    SmallResultsSetPagination,
+    SmallResultsSetCursorPagination
+)
+from whoownsmass.serializers import SiteSerializer
+
+factory = APIRequestFactory()
+
+
+def time_page(paginator, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        request = Request(factory.get("/sites/", params))
+        start = perf_counter()
+        page = paginator.paginate_queryset(Site.objects.all(), request)
+        paginator.get_paginated_response(SiteSerializer(page, many=True).data)
+        timings.append(perf_counter() - start)
+    return median(timings) * 1000
+
+
+def cursor_for(paginator, position):
+    request = Request(factory.get("/sites/"))
+    paginator.base_url = request.build_absolute_uri()
+    url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+    return parse_qs(urlparse(url).query)["cursor"][0]
+
+
+def run(*args):
+    page = max(int(args[0]), 1) if args else 10000
+    repeat = int(args[1]) if len(args) > 1 else 20
+
+    offset = SmallResultsSetPagination()
+    cursor = SmallResultsSetCursorPagination()
+    size = offset.default_limit
+    deep_offset = (page - 1) * size
+    # The cursor for page n is the id of the last row on page n - 1; page 1
+    # has none.
+    deep_params = {}
+    if deep_offset:
+        position = (
+            Site.objects.order_by("id").values_list("id", flat=True)[deep_offset - 1]
+        )
+        deep_params["cursor"] = cursor_for(cursor, position)
+
+    rows = [
+        ("limit/offset", "page 1", time_page(offset, {}, repeat)),
+        ("limit/offset", f"page {page}", time_page(offset, {"offset": deep_offset}, repeat)),
+        ("cursor", "page 1", time_page(cursor, {}, repeat)),
+        ("cursor", f"page {page}", time_page(cursor, deep_params, repeat)),
+        ("cursor + estimate", f"page {page}", time_page(cursor, {**deep_params, "count": "estimate"}, repeat)),
+    ]
+    print(f"{'mode':<20}{'page':<14}{'median ms':>10}")
+    for mode, label, ms in rows:
+        print(f"{mode:<20}{label:<14}{ms:>10.2f}")
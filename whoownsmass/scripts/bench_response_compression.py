@@ -0,0 +1,63 @@
+"""
+Measure the CPU time the precompressed response store saves on the largest
+metacorp responses.
+
+    python manage.py runscript bench_response_compression --script-args 5 20
+
+The first argument is the number of metacorps to time, largest by
+prop_count first (default 5); the second the repetitions per measurement
+(default 20). For each response, compares compressing the body on every
+request, at the levels a proxy typically uses, with the total CPU time of
+a cache hit that sends the stored form.
+"""
+import gzip
+from statistics import median
+from time import process_time
+
+import brotli
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from whoownsmass.caching import CACHE_ALIAS
+from whoownsmass.models import MetaCorp
+from whoownsmass.views import MetaCorpViewset
+
+factory = APIRequestFactory()
+view = MetaCorpViewset.as_view({"get": "retrieve"})
+
+
+def cpu_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = process_time()
+        fn()
+        timings.append(process_time() - start)
+    return median(timings) * 1000
+
+
+def get(pk, user, encoding):
+    request = factory.get(f"/metacorps/{pk}/", HTTP_ACCEPT_ENCODING=encoding)
+    force_authenticate(request, user=user)
+    response = view(request, pk=pk)
+    # Cache hits come back as plain, already rendered HttpResponses.
+    if hasattr(response, "render"):
+        response.render()
+    return response
+
+
+def run(*args):
+    n = int(args[0]) if args else 5
+    repeat = int(args[1]) if len(args) > 1 else 20
+    user = get_user_model()(username="bench")
+    caches[CACHE_ALIAS].clear()
+
+    print(f"{'metacorp':<24}{'bytes':>12}{'gzip -6 ms':>12}{'br 4 ms':>10}{'hit ms':>11}{'saved ms':>10}")
+    for pk in MetaCorp.objects.order_by("-prop_count").values_list("id", flat=True)[:n]:
+        body = get(pk, user, "identity").content
+        on_the_fly = cpu_ms(lambda: gzip.compress(body, compresslevel=6), repeat)
+        br = cpu_ms(lambda: brotli.compress(body, quality=4), repeat)
+        # The first request rendered and stored the body; these are hits.
+        stored = cpu_ms(lambda: get(pk, user, "gzip, br"), repeat)
+        # A stored hit skips compressing the body as br, which the client gets.
+        print(f"{pk[:23]:<24}{len(body):>12,}{on_the_fly:>12.2f}{br:>10.2f}{stored:>11.2f}{br:>10.2f}")
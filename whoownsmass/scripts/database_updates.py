@@ -1,3 +1,7 @@
+import os
+from time import perf_counter
+
+from django.db import transaction
 from tqdm import tqdm
 from who_owns.models import (
     Address,
@@ -12,6 +16,15 @@ from who_owns.models import (
     Role,
 )
 
+CHUNK_SIZE = 1000
+BATCH_SIZE = 5000
+# Last LegacyCorps id fully migrated; lets an interrupted run pick up where
+# it stopped.
+CHECKPOINT = "create_landlord_institutions.checkpoint"
+
+ADDRESS_KEY = ["street", "city", "state", "zip", "prop_id", "loc_id", "use_code"]
+PERSON_KEY = ["name_address", "name", "address_id", "legacy_inds_id"]
+
 
 ### move people, corps, out of LegacyOwners, LegacyCorps, LegacyInds into other tables
 def create_metacorps():
@@ -19,83 +32,250 @@ def create_metacorps():
     legacycorps = (
         LegacyCorps.objects.all().values_list("group_network", flat=True).distinct()
     )
-    for lc_group in legacycorps:
-        MetaCorp.objects.get_or_create(id=lc_group)
+    MetaCorp.objects.bulk_create(
+        [MetaCorp(id=lc_group) for lc_group in legacycorps],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def read_checkpoint():
+    if not os.path.exists(CHECKPOINT):
+        return None
+    with open(CHECKPOINT) as f:
+        return f.read().strip() or None
+
+
+def write_checkpoint(corp_id):
+    with open(CHECKPOINT, "w") as f:
+        f.write(str(corp_id))
+
+
+def get_or_create_many(model, key_fields, lookup, objs):
+    """
+    Set-based get_or_create. lookup maps key tuples to ids for rows that
+    already exist and is extended with the rows created here.
+    """
+    missing = {}
+    for obj in objs:
+        key = tuple(getattr(obj, f) for f in key_fields)
+        if key not in lookup and key not in missing:
+            missing[key] = obj
+    if missing:
+        created = model.objects.bulk_create(list(missing.values()), batch_size=BATCH_SIZE)
+        for key, obj in zip(missing, created):
+            lookup[key] = obj.pk
+
+
+def migrate_chunk(corps, lookups, ll_role, owner_role, ll_company):
+    """
+    Migrate one chunk of LegacyCorps with a fixed number of queries,
+    whatever the number of edges, owners and individuals involved.
+    """
+    MetaCorp.objects.bulk_create(
+        [MetaCorp(id=group) for group in {lc.group_network for lc in corps}],
+        ignore_conflicts=True,
+    )
+    Institution.objects.bulk_create(
+        [
+            Institution(
+                id=lc.id,
+                name=lc.entityname,
+                company_type=ll_company,
+                metacorp_id=lc.group_network,
+            )
+            for lc in corps
+        ],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["id"],
+        update_fields=["name", "company_type", "metacorp"],
+    )
 
+    # owners are connected to corps through edges
+    edges = list(
+        LegacyEdges.objects.filter(id_corp__in=[lc.id for lc in corps])
+        .values_list("id_corp", "id_link")
+    )
+    links = {id_link for _, id_link in edges}
+    owners = list(LegacyOwners.objects.filter(group__in=links))
+    # inds are found in edges using inds.id edges.id_link
+    inds = list(LegacyInds.objects.filter(group_network__in=links))
+    ind_edges = list(
+        LegacyEdges.objects.filter(id_link__in=[ind.id for ind in inds])
+        .values_list("id_link", "id_corp")
+    )
+
+    owner_address = {
+        owner.pk: Address(
+            street=owner.own_addr,
+            city=owner.own_city,
+            state=owner.own_state,
+            zip=owner.own_zip,
+            prop_id=owner.prop_id,
+            loc_id=owner.loc_id,
+            use_code=owner.use_code,
+        )
+        for owner in owners
+    }
+    ind_address = {
+        ind.pk: Address(
+            street=ind.address_simp,
+            city=None,
+            state=None,
+            zip=None,
+            prop_id=None,
+            loc_id=None,
+            use_code=None,
+        )
+        for ind in inds
+    }
+    get_or_create_many(
+        Address,
+        ADDRESS_KEY,
+        lookups["address"],
+        list(owner_address.values()) + list(ind_address.values()),
+    )
 
-def create_landlord_institutions():
-    legacycorps = LegacyCorps.objects.all()
+    def address_id(address):
+        return lookups["address"][tuple(getattr(address, f) for f in ADDRESS_KEY)]
+
+    # Individuals were previously given the owner1 of the last owner seen
+    # for their edge group.
+    group_owner1 = {owner.group: owner.owner1 for owner in owners}
+    owner_people = {
+        owner.pk: Person(
+            name_address=owner.name_address,
+            name=owner.owner1,
+            address_id=address_id(owner_address[owner.pk]),
+            legacy_inds_id=None,
+        )
+        for owner in owners
+    }
+    ind_people = {
+        ind.pk: Person(
+            name=ind.fullname_simp,
+            name_address=group_owner1.get(ind.group_network),
+            legacy_inds_id=ind.id,
+            address_id=address_id(ind_address[ind.pk]),
+        )
+        for ind in inds
+    }
+    get_or_create_many(
+        Person,
+        PERSON_KEY,
+        lookups["person"],
+        list(owner_people.values()) + list(ind_people.values()),
+    )
+
+    def person_id(person):
+        return lookups["person"][tuple(getattr(person, f) for f in PERSON_KEY)]
+
+    owner_person_ids = {pk: person_id(p) for pk, p in owner_people.items()}
+    ind_person_ids = {pk: person_id(p) for pk, p in ind_people.items()}
+
+    PersonRoles = Person.roles.through
+    PersonRoles.objects.bulk_create(
+        [
+            PersonRoles(person_id=pid, role_id=role.pk)
+            for pid in set(owner_person_ids.values())
+            for role in (ll_role, owner_role)
+        ]
+        + [
+            PersonRoles(person_id=pid, role_id=ll_role.pk)
+            for pid in set(ind_person_ids.values())
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+    owners_by_group = {}
+    for owner in owners:
+        owners_by_group.setdefault(owner.group, []).append(owner_person_ids[owner.pk])
+    corps_by_ind = {}
+    for id_link, id_corp in ind_edges:
+        corps_by_ind.setdefault(id_link, set()).add(id_corp)
+
+    InstitutionPeople = Institution.people.through
+    memberships = set()
+    for id_corp, id_link in edges:
+        for pid in owners_by_group.get(id_link, []):
+            memberships.add((id_corp, pid))
+    for ind in inds:
+        for id_corp in corps_by_ind.get(ind.id, []):
+            memberships.add((id_corp, ind_person_ids[ind.pk]))
+    # Individuals can link to corps outside this chunk.
+    Institution.objects.bulk_create(
+        [
+            Institution(id=id_corp, company_type=ll_company)
+            for id_corp in {id_corp for id_corp, _ in memberships}
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    InstitutionPeople.objects.bulk_create(
+        [
+            InstitutionPeople(institution_id=id_corp, person_id=pid)
+            for id_corp, pid in memberships
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return len(owners) + len(inds)
+
+
+def create_landlord_institutions(chunk_size=CHUNK_SIZE):
     ll_role, _ = Role.objects.get_or_create(name="landlord")
     owner_role, _ = Role.objects.get_or_create(name="owner")
     ll_company, _ = CompanyType.objects.get_or_create(name="landlord")
-    print(legacycorps.count())
-    for lc in tqdm(legacycorps):
-        metacorp, _ = MetaCorp.objects.get_or_create(id=lc.group_network)
-        inst, _ = Institution.objects.get_or_create(id=lc.id)
-        inst.name = lc.entityname
-        inst.company_type = ll_company
-        inst.metacorp = metacorp
-        inst.save()
-        # owners are connected to corps through edges
-        edges = LegacyEdges.objects.filter(id_corp=inst.id)
-        for edge in edges:
-            owners = LegacyOwners.objects.filter(group=edge.id_link)
-            corps = LegacyCorps.objects.filter(id=edge.id_corp)
-            for owner in owners:
-                address, _ = Address.objects.get_or_create(
-                    street=owner.own_addr,
-                    city=owner.own_city,
-                    state=owner.own_state,
-                    zip=owner.own_zip,
-                    prop_id=owner.prop_id,
-                    loc_id=owner.loc_id,
-                    use_code=owner.use_code,
-                )
-                prsn, _ = Person.objects.get_or_create(
-                    name_address=owner.name_address, name=owner.owner1, address=address
-                )
-                prsn.roles.add(ll_role)
-                prsn.roles.add(owner_role)
-                prsn.save()
-
-                for corp in corps:
-                    inst2, _ = Institution.objects.get_or_create(id=corp.id)
-                    inst2.company_type = ll_company
-                    inst2.metacorp = metacorp
-                    inst2.name = lc.entityname
-                    inst2.people.add(prsn)
-                    inst2.save()
-                inst.people.add(prsn)
-                inst.save()
-
-            inds = LegacyInds.objects.filter(group_network=edge.id_link)
-            for ind in inds:
-                address, _ = Address.objects.get_or_create(
-                    street=ind.address_simp,
-                    state=None,
-                    city=None,
-                    zip=None,
-                )
-                prsn, _ = Person.objects.get_or_create(
-                    name=ind.fullname_simp,
-                    name_address=owner.owner1,
-                    legacy_inds_id=ind.id,
-                    address=address,
-                )
-                prsn.roles.add(ll_role)
-                prsn.save()
-
-                edges = LegacyEdges.objects.filter(id_link=inds.id)
-                for edge in edges:
-                    corps = LegacyCorps.objects.filter(id=edge.id_corp)
-                    for corp in corps:
-                        inst2, _ = Institution.objects.get_or_create(id=corp.id)
-                        inst2.people.add(prsn)
-                        inst2.name = lc.entityname
-                        inst2.company_type = ll_company
-                        inst2.metacorp = metacorp
-                        inst2.save()
-
-
-# owners are connected to corps through edges
-# inds are found in edges using inds.id edges.id_link
+
+    # Lookup maps are read once; chunks add to them as they create rows.
+    lookups = {
+        "address": {
+            tuple(row[:-1]): row[-1]
+            for row in Address.objects.values_list(*ADDRESS_KEY, "id").iterator()
+        },
+        "person": {
+            tuple(row[:-1]): row[-1]
+            for row in Person.objects.values_list(*PERSON_KEY, "id").iterator()
+        },
+    }
+
+    legacycorps = LegacyCorps.objects.order_by("id")
+    checkpoint = read_checkpoint()
+    if checkpoint is not None:
+        legacycorps = legacycorps.filter(id__gt=checkpoint)
+        print(f"Resuming after LegacyCorps {checkpoint}")
+    total = legacycorps.count()
+    print(total)
+
+    people = 0
+    start = perf_counter()
+    chunk = []
+    with tqdm(total=total, unit="corp") as progress:
+        for lc in legacycorps.iterator(chunk_size=chunk_size):
+            chunk.append(lc)
+            if len(chunk) < chunk_size:
+                continue
+            people += migrate_chunk_and_checkpoint(chunk, lookups, ll_role, owner_role, ll_company)
+            progress.update(len(chunk))
+            progress.set_postfix(people=people)
+            chunk = []
+        if chunk:
+            people += migrate_chunk_and_checkpoint(chunk, lookups, ll_role, owner_role, ll_company)
+            progress.update(len(chunk))
+    elapsed = perf_counter() - start
+    rate = total / elapsed if elapsed else 0
+    print(f"{total} corps and {people} owners/individuals in {elapsed:.1f}s ({rate:.0f} corps/s)")
+    if os.path.exists(CHECKPOINT):
+        os.remove(CHECKPOINT)
+
+
+def migrate_chunk_and_checkpoint(chunk, lookups, *args):
+    """
+    Migrate a chunk in its own transaction and record it as done.
+    """
+    with transaction.atomic():
+        people = migrate_chunk(chunk, lookups, *args)
+    write_checkpoint(chunk[-1].id)
+    return people
@@ -0,0 +1,78 @@
+import re
+import string
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Compiled once per process rather than on every call.
+DATE_PATTERN = re.compile(r"(?:On this date)(?:\s*)?(?:\d{2}\/\d{2}\/\d{4})?\s*")
+ACTION_PATTERN = re.compile(
+    r"(?:\s*)(added as| added for|withdrawn for|dismissed for|dismissed\/withdrawn for|dismissed\/withdrawn as|withdrawn as)(?:\s*)"
+)
+PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+CHUNK_SIZE = 2000
+FAILED = (None, None, None, None)
+
+
+def get_attorney_and_client_from_str(input_str):
+    """
+    >>> get_attorney_and_client_from_str('Attorney Appearance | On this date 12/11/2019 Pro Se added for Example, Bob')
+    ('Pro Se', 'Example, Bob', 'added', None)
+    >>> get_attorney_and_client_from_str('Attorney Appearance | On this date 12/03/2019 Ashton, Esq., Donna M added for Longview Apartments at Georgetown, LLC')
+    ('Ashton Donna M', 'Longview Apartments at Georgetown, LLC', 'added', None)
+    >>> get_attorney_and_client_from_str('On this date Judrick K Fletcher, Esq. added as Limited Assistance Representation for Defendant Elvin Cochran')
+    ('Judrick K Fletcher', 'Elvin Cochran', 'added', 'def')
+    >>> get_attorney_and_client_from_str('Attorney Appearance | On this date Pro Se dismissed/withdrawn for Defendant Elvin Cochran')
+    ('Pro Se', 'Elvin Cochran', 'dismissed', 'def')
+    >>> get_attorney_and_client_from_str('Attorney Appearance for Defendant by K. Wibby, Esq.')
+    """
+    try:
+        try:
+            _, parties = DATE_PATTERN.split(input_str)
+        except:
+            parties = input_str
+        attorney, action, client = ACTION_PATTERN.split(parties)
+        action = action.lower()
+        if ("dismissed" in action) or ("withdrawn" in action):
+            action = "dismissed"
+        elif "added" in action:
+            action = "added"
+        attorney_type = None
+        if "Defendant" in client:
+            client = client.split("Defendant")[-1].strip()
+            attorney_type = "def"
+        elif "Plaintiff" in client:
+            client = client.split("Plaintiff")[-1].strip()
+            attorney_type = "ptf"
+        if "Esq." in attorney:
+            attorney = attorney.translate(PUNCTUATION)
+            attorney = "".join(attorney.split(" Esq"))
+        return (attorney, client, action, attorney_type)
+    except Exception as err:
+        print("Exception", input_str)
+        return FAILED
+
+
+def parse_chunk(dockets):
+    """
+    Parse a chunk of (docket_id, text) pairs. Runs in worker processes.
+    """
+    return [
+        (docket_id, text, get_attorney_and_client_from_str(text))
+        for docket_id, text in dockets
+    ]
+
+
+def parsed_chunks(chunks, workers):
+    """
+    Parse chunks across a process pool, yielding results in order. At most
+    two chunks per worker are in flight, so memory stays bounded.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(parse_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
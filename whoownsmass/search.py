@@ -0,0 +1,48 @@
+"""
+Owner name search over the owner_alias view, backed by pg_trgm. Fuzzy
+queries use its trigram GIN index through the % operator and are ranked by
+similarity; prefix queries, used for autocomplete, read its upper(name)
+pattern index.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+
+from whoownsmass.models import OwnerAlias
+
+# Trigrams carry too little signal below this length, so shorter queries
+# fall back to prefix matching.
+MIN_FUZZY_LENGTH = 3
+
+
+def prefix_owner_search(query):
+    """
+    Owner aliases whose name starts with query.
+    """
+    return (
+        OwnerAlias.objects.filter(name__istartswith=query)
+        .order_by("name", "metacorp")
+    )
+
+
+def fuzzy_owner_search(query, threshold=None):
+    """
+    Owner aliases whose name is trigram-similar to query, best matches
+    first. Matching runs through the % operator so the GIN
+    index is used; it admits names above pg_trgm.similarity_threshold
+    (0.3 unless changed on the server), so threshold only tightens that.
+    """
+    if threshold is None:
+        threshold = settings.OWNER_SEARCH_THRESHOLD
+    return (
+        OwnerAlias.objects.filter(name__trigram_similar=query)
+        .annotate(similarity=TrigramSimilarity("name", query))
+        .filter(similarity__gte=threshold)
+        .order_by("-similarity", "-owner_count", "name")
+    )
+
+
+def owner_search(query, match="fuzzy"):
+    query = query.strip()
+    if match == "prefix" or len(query) < MIN_FUZZY_LENGTH:
+        return prefix_owner_search(query)
+    return fuzzy_owner_search(query)
@@ -1,18 +1,39 @@
+import json
+
 from rest_framework.serializers import (
+    FloatField,
     ModelSerializer,
     SerializerMethodField
 )
-from rest_framework_gis.serializers import (
-    GeoFeatureModelSerializer, 
-    GeometrySerializerMethodField
-)
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
 from whoownsmass.models import (
     Site,
     MetaCorp,
     Owner,
-    Address
+    OwnerAlias,
+    Address,
+    GeographyRollup
 )
 
+def point_geometry(obj):
+    """
+    GeoJSON for the parcel point of obj's address. The querysets in views
+    annotate point_lng/point_lat: the point's lat/lng columns or, for rows
+    missing them, coordinates read from the geometry in the same query, so
+    the geometry column itself is never fetched or parsed. Objects from
+    other querysets fall back to the loaded parcel.
+    """
+    if hasattr(obj, "point_lng"):
+        if obj.point_lng is None or obj.point_lat is None:
+            return None
+        return {"type": "Point", "coordinates": [obj.point_lng, obj.point_lat]}
+    parcel = obj.address.parcel if obj.address else None
+    if parcel is None:
+        return None
+    if parcel.lat is not None and parcel.lng is not None:
+        return {"type": "Point", "coordinates": [parcel.lng, parcel.lat]}
+    return json.loads(parcel.geometry.geojson)
+
 class AddressSerializer(ModelSerializer):
     class Meta:
         model = Address
@@ -20,23 +41,40 @@ class AddressSerializer(ModelSerializer):
 
 class OwnerSerializer(GeoFeatureModelSerializer):
     address = AddressSerializer()
-    geometry = GeometrySerializerMethodField()
+    geometry = SerializerMethodField()
     class Meta:
         model = Owner
         geo_field = "geometry"
         fields = ["name", "inst", "trust", "trustees", "address", "metacorp", "site"]
 
     def get_geometry(self, obj):
-        return obj.address.parcel.geometry if obj.address and obj.address.parcel else None
+        return point_geometry(obj)
 
 class OwnerNameSerializer(ModelSerializer):
     class Meta:
         model = Owner
         fields = ["name", "metacorp"]
 
+class OwnerAliasSerializer(ModelSerializer):
+    class Meta:
+        model = OwnerAlias
+        fields = ["name", "metacorp", "owner_count", "site_count"]
+
+class OwnerSearchSerializer(OwnerAliasSerializer):
+    # Only fuzzy matches are annotated with a similarity score.
+    similarity = FloatField(read_only=True)
+
+    class Meta(OwnerAliasSerializer.Meta):
+        fields = OwnerAliasSerializer.Meta.fields + ["similarity"]
+
+class GeographyRollupSerializer(ModelSerializer):
+    class Meta:
+        model = GeographyRollup
+        exclude = ["id"]
+
 class SimpleSiteSerializer(GeoFeatureModelSerializer):
     address = AddressSerializer()
-    geometry = GeometrySerializerMethodField()
+    geometry = SerializerMethodField()
     owners = SerializerMethodField()
 
     class Meta:
@@ -49,7 +87,7 @@ class SimpleSiteSerializer(GeoFeatureModelSerializer):
         return [OwnerSerializer(owner).data for owner in owners]
     
     def get_geometry(self, obj):
-        return obj.address.parcel.geometry if obj.address and obj.address.parcel else None
+        return point_geometry(obj)
 
 class MetaCorpSerializer(ModelSerializer):
     sites = SerializerMethodField()
@@ -58,14 +96,19 @@ class MetaCorpSerializer(ModelSerializer):
     class Meta:
         model = MetaCorp
         fields = "__all__"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Large portfolios are better paged through /metacorps/{id}/sites/.
+        if not self.context.get("include_sites", True):
+            self.fields.pop("sites")
     
     def get_sites(self, obj):
         owners = obj.owners.all()
         return SimpleSiteSerializer([site for owner in owners for site in owner.site.all()], many=True).data
     
     def get_aliases(self, obj):
-        owners = obj.owners.all()
-        return list(set([owner.name for owner in owners]))
+        return [alias.name for alias in obj.aliases.all()]
 
 class MetaCorpProps(ModelSerializer):
     class Meta:
@@ -74,7 +117,7 @@ class MetaCorpProps(ModelSerializer):
 
 class SiteSerializer(GeoFeatureModelSerializer):
     address = AddressSerializer()
-    geometry = GeometrySerializerMethodField()
+    geometry = SerializerMethodField()
     owners = SerializerMethodField()
     metacorp = SerializerMethodField()
 
@@ -84,7 +127,7 @@ class SiteSerializer(GeoFeatureModelSerializer):
         fields = "__all__"
 
     def get_geometry(self, obj):
-        return obj.address.parcel.geometry if obj.address and obj.address.parcel else None
+        return point_geometry(obj)
 
     def get_owners(self, obj):
         owners = obj.owners.all()
@@ -1,3 +1,1003 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import BytesIO
+from unittest.mock import patch
 
-# Create your tests here.
+import brotli
+import msgpack
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import MultiPolygon, Point, Polygon
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from whoownsmass.aggregates import recompute_metacorp_aggregates
+from whoownsmass.aliases import create_owner_aliases, refresh_owner_aliases
+from whoownsmass.caching import CACHE_ALIAS
+from whoownsmass.clustering import recluster_metacorps
+from whoownsmass.dedup import apply_renames, find_duplicates, renames
+from whoownsmass.generation import current_generation, reset_generation
+from whoownsmass.geographies import assign_geographies, load_polygons
+from whoownsmass.loading import LoadError, load_ownership
+from whoownsmass.models import (
+    Address,
+    BlockGroup,
+    Company,
+    GeographyRollup,
+    MetaCorp,
+    Municipality,
+    Officer,
+    OfficerToRole,
+    Owner,
+    OwnerAlias,
+    ParcelPoint,
+    Role,
+    Site,
+    SiteToOwner,
+    Tract
+)
+from whoownsmass.polygon_trees import assign_chunk, build_trees
+from whoownsmass.renderers import ORJSONRenderer
+from whoownsmass.rollups import refresh_rollups
+from whoownsmass.tiles import STALE_AGE, prune_generations, store_tile, tile_path
+from whoownsmass.views import SiteViewset
+
+
+def build_network(metacorp_id, n_sites, start=0, sites_per_owner=100):
+    """
+    Create a metacorp owning n_sites sites, each with its own address and
+    parcel point. Primary keys are allocated from start so several networks
+    can live in one test database.
+    """
+    metacorp = MetaCorp.objects.create(id=metacorp_id, name=metacorp_id)
+    parcels = ParcelPoint.objects.bulk_create([
+        ParcelPoint(
+            id=f"{metacorp_id}-{i}",
+            lat=42.36 + i * 1e-6,
+            lng=-71.06 - i * 1e-6,
+            geometry=Point(-71.06 - i * 1e-6, 42.36 + i * 1e-6, srid=4326)
+        )
+        for i in range(n_sites)
+    ])
+    addresses = Address.objects.bulk_create([
+        Address(
+            id=start + i,
+            addr=f"{i + 1} MAIN ST",
+            start=i + 1,
+            end=i + 1,
+            body="MAIN ST",
+            even=(i + 1) % 2 == 0,
+            muni="SOMERVILLE",
+            postal="02143",
+            state="MA",
+            parcel=parcel
+        )
+        for i, parcel in enumerate(parcels)
+    ])
+    sites = Site.objects.bulk_create([
+        Site(
+            id=start + i,
+            fy=2024,
+            units=1,
+            bld_val=100000,
+            lnd_val=100000,
+            use_code="101",
+            luc="101",
+            ooc=False,
+            condo=False,
+            address=address
+        )
+        for i, address in enumerate(addresses)
+    ])
+    owners = Owner.objects.bulk_create([
+        Owner(
+            id=start + i,
+            name=f"{metacorp_id} HOLDINGS LLC",
+            inst=True,
+            trust=False,
+            trustees=False,
+            address=addresses[0],
+            metacorp=metacorp
+        )
+        for i in range(n_sites // sites_per_owner + 1)
+    ])
+    SiteToOwner.objects.bulk_create([
+        SiteToOwner(site=site, owner=owners[i // sites_per_owner])
+        for i, site in enumerate(sites)
+    ])
+    refresh_owner_aliases()
+    return metacorp
+
+
+@override_settings(DATA_GENERATION_TTL=3600)
+class APITestCase(TestCase):
+    def setUp(self):
+        # Read the generation up front so it isn't counted as a query in
+        # whichever request happens to come first, and start every test
+        # with an empty response cache.
+        reset_generation()
+        current_generation()
+        caches[CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create(username="tester")
+        )
+
+    def count_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+
+class MetaCorpRetrieveTests(APITestCase):
+    def test_query_count_does_not_grow_with_portfolio(self):
+        small = build_network("small", 1, start=0)
+        large = build_network("large", 5000, start=10000)
+        self.assertEqual(
+            self.count_queries(reverse("metacorp-detail", args=[small.id])),
+            self.count_queries(reverse("metacorp-detail", args=[large.id]))
+        )
+
+    def test_retrieve_returns_every_site(self):
+        metacorp = build_network("network", 250)
+        response = self.client.get(reverse("metacorp-detail", args=[metacorp.id]))
+        self.assertEqual(len(response.json()["sites"]["features"]), 250)
+        self.assertEqual(response.json()["aliases"], ["network HOLDINGS LLC"])
+
+
+class SiteGeometryTests(APITestCase):
+    def test_point_built_from_lat_lng(self):
+        build_network("network", 2)
+        response = self.client.get(reverse("site-detail", args=[1]))
+        self.assertEqual(
+            response.json()["geometry"],
+            {"type": "Point", "coordinates": [-71.06 - 1e-6, 42.36 + 1e-6]}
+        )
+
+    def test_point_falls_back_to_geometry(self):
+        build_network("network", 1)
+        ParcelPoint.objects.update(lat=None, lng=None)
+        response = self.client.get(reverse("site-detail", args=[0]))
+        self.assertEqual(
+            response.json()["geometry"], {"type": "Point", "coordinates": [-71.06, 42.36]}
+        )
+
+    def test_fallback_adds_no_queries(self):
+        build_network("network", 20)
+        with_lat_lng = self.count_queries(reverse("site-list"))
+        caches[CACHE_ALIAS].clear()
+        ParcelPoint.objects.update(lat=None, lng=None)
+        reset_generation()
+        current_generation()
+        self.assertEqual(self.count_queries(reverse("site-list")), with_lat_lng)
+
+
+class GraphTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        metacorp = build_network("network", 2)
+        Company.objects.bulk_create([
+            Company(id=1, name="A LLC", address_id=0, metacorp=metacorp),
+            Company(id=2, name="B LLC", address_id=1, metacorp=metacorp),
+            Company(id=3, name="C LLC", address_id=1),
+        ])
+        officer = Officer.objects.create(
+            id=1, name="JANE DOE", company_id=1, address_id=1, metacorp=metacorp
+        )
+        Officer.objects.create(id=2, name="JOHN DOE", company_id=3, address_id=0)
+        OfficerToRole.objects.create(officer=officer, role=Role.objects.create(name="MANAGER"))
+
+    def test_metacorp_graph(self):
+        graph = self.client.get(reverse("metacorp-graph", args=["network"])).json()
+        self.assertEqual(
+            sorted(node["id"] for node in graph["nodes"]),
+            ["a:0", "a:1", "c:1", "c:2", "o:1"]
+        )
+        self.assertEqual(
+            sorted(graph["edges"]),
+            [["c:1", "a:0", "address"], ["c:2", "a:1", "address"],
+             ["o:1", "a:1", "address"], ["o:1", "c:1", "officer"]]
+        )
+        officer = next(node for node in graph["nodes"] if node["id"] == "o:1")
+        self.assertEqual(officer["roles"], ["MANAGER"])
+        self.assertFalse(graph["truncated"])
+
+    def test_neighborhood_reaches_through_shared_address(self):
+        url = reverse("graph", args=["company", 1])
+        one_hop = self.client.get(url, {"hops": 1}).json()
+        self.assertEqual(sorted(node["id"] for node in one_hop["nodes"]), ["a:0", "c:1", "o:1"])
+        two_hops = self.client.get(url, {"hops": 2}).json()
+        self.assertEqual(
+            sorted(node["id"] for node in two_hops["nodes"]),
+            ["a:0", "a:1", "c:1", "o:1", "o:2"]
+        )
+
+    def test_node_cap(self):
+        graph = self.client.get(reverse("graph", args=["company", 1]), {"max_nodes": 2}).json()
+        self.assertEqual(len(graph["nodes"]), 2)
+        self.assertTrue(graph["truncated"])
+
+    def test_missing_start_is_404(self):
+        self.assertEqual(self.client.get(reverse("graph", args=["officer", 99])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("graph", args=["site", 1])).status_code, 404)
+
+
+class MetaCorpSitesTests(APITestCase):
+    def test_pages_cover_portfolio_once(self):
+        metacorp = build_network("network", 25, sites_per_owner=10)
+        url = reverse("metacorp-sites", args=[metacorp.id]) + "?limit=10"
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen += [feature["id"] for feature in page["features"]]
+            url = page["next"]
+        self.assertEqual(seen, sorted(Site.objects.values_list("id", flat=True)))
+
+    def test_page_query_count_does_not_grow_with_depth(self):
+        metacorp = build_network("network", 1000)
+        url = reverse("metacorp-sites", args=[metacorp.id])
+        self.assertEqual(
+            self.count_queries(url, limit=10),
+            self.count_queries(url, limit=10, after=900)
+        )
+
+    def test_malformed_after_is_rejected(self):
+        metacorp = build_network("network", 10)
+        response = self.client.get(reverse("metacorp-sites", args=[metacorp.id]), {"after": "x"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("after", response.json())
+
+    def test_retrieve_can_skip_sites(self):
+        metacorp = build_network("network", 10)
+        response = self.client.get(
+            reverse("metacorp-detail", args=[metacorp.id]), {"sites": "false"}
+        )
+        self.assertNotIn("sites", response.json())
+
+
+class CursorPaginationTests(APITestCase):
+    def walk(self, url, rows):
+        """Ids on every page from url on, following next links."""
+        seen = []
+        with CaptureQueriesContext(connection) as ctx:
+            while url:
+                page = self.client.get(url).json()
+                self.assertNotIn("count", page)
+                seen += [row["id"] for row in rows(page)]
+                url = page["next"]
+        self.assertFalse(any("COUNT(" in query["sql"] for query in ctx.captured_queries))
+        return seen
+
+    def estimate(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            count = self.client.get(reverse("site-list"), {"count": "estimate", **params}).json()["count"]
+        self.assertIsInstance(count, int)
+        return count, " ".join(query["sql"] for query in ctx.captured_queries)
+
+    def test_site_pages_cover_every_site(self):
+        build_network("network", 12)
+        self.assertEqual(
+            self.walk(reverse("site-list"), lambda page: page["results"]["features"]),
+            sorted(Site.objects.values_list("id", flat=True))
+        )
+
+    def test_metacorp_pages_cover_every_metacorp(self):
+        MetaCorp.objects.bulk_create([MetaCorp(id=f"m{i}", name=f"M{i} LLC") for i in range(12)])
+        self.assertEqual(
+            self.walk(reverse("metacorp-list") + "?sites=false", lambda page: page["results"]),
+            sorted(MetaCorp.objects.values_list("id", flat=True))
+        )
+
+    def test_estimated_count_from_table_statistics(self):
+        build_network("network", 12)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE site")
+        count, sql = self.estimate()
+        self.assertEqual(count, 12)
+        self.assertIn("reltuples", sql)
+        self.assertNotIn("EXPLAIN", sql)
+
+    def test_estimated_count_of_filtered_list(self):
+        build_network("network", 12)
+        _, sql = self.estimate(luc="101")
+        self.assertIn("EXPLAIN", sql)
+
+
+class AddressLookupTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        build_network("network", 3)
+        Address.objects.filter(id=2).update(addr="41-49 MAIN ST", start=41, end=49, even=False)
+
+    def lookup(self, **params):
+        response = self.client.get(reverse("address-lookup"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def site_ids(self, q):
+        return [feature["id"] for feature in self.lookup(q=q)["features"]]
+
+    def test_exact_address(self):
+        result = self.lookup(q="1 Main Street, Somerville, MA 02143")
+        self.assertEqual([feature["id"] for feature in result["features"]], [0])
+        self.assertEqual(result["query"], {"number": 1, "body": "MAIN ST", "muni": "SOMERVILLE", "postal": "02143"})
+        self.assertEqual(result["features"][0]["properties"]["metacorp"]["id"], "network")
+
+    def test_range_matches_same_parity(self):
+        self.assertEqual(self.site_ids("45 Main St, Somerville"), [2])
+        self.assertEqual(self.site_ids("44 Main St, Somerville"), [])
+        self.assertEqual(self.site_ids("51 Main St, Somerville"), [])
+
+    def test_exact_match_survives_result_cap(self):
+        Address.objects.filter(id=0).update(addr="41-49 MAIN ST", start=41, end=49, even=False)
+        Address.objects.filter(id=2).update(addr="45 MAIN ST", start=45, end=45, even=False)
+        Site.objects.bulk_create([
+            Site(
+                id=i, fy=2024, units=1, bld_val=1, lnd_val=1, use_code="101", luc="101",
+                ooc=False, condo=False, address_id=0
+            )
+            for i in (10, 11)
+        ])
+        self.assertEqual(self.site_ids("45 Main St, Somerville"), [2, 0, 10, 11])
+        caches[CACHE_ALIAS].clear()
+        with patch("whoownsmass.views.MAX_RESULTS", 2):
+            self.assertEqual(self.site_ids("45 Main St, Somerville"), [2, 0])
+
+    def test_muni_is_required(self):
+        response = self.client.get(reverse("address-lookup"), {"q": "45 Main St"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.lookup(q="45 Main St", muni="Somerville")["query"]["muni"], "SOMERVILLE")
+
+
+class BatchLookupTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        build_network("network", 30)
+
+    def post(self, body):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse("batch"), body, format="json")
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return json.loads(content), len(ctx.captured_queries)
+
+    def test_results_keyed_by_id_with_missing(self):
+        result, _ = self.post({"sites": [3, 999, 1, 3], "metacorps": ["network", "none"]})
+        self.assertEqual(list(result["sites"]["found"]), ["3", "1"])
+        self.assertEqual(result["sites"]["found"]["1"]["properties"]["metacorp"]["id"], "network")
+        self.assertEqual(result["sites"]["missing"], [999])
+        self.assertEqual(list(result["metacorps"]["found"]), ["network"])
+        self.assertNotIn("sites", result["metacorps"]["found"]["network"])
+        self.assertEqual(result["metacorps"]["missing"], ["none"])
+
+    def test_query_count_does_not_grow_with_batch(self):
+        _, few = self.post({"sites": [0, 1]})
+        _, many = self.post({"sites": list(range(30))})
+        self.assertEqual(few, many)
+
+    def test_large_batch_is_streamed(self):
+        body = {"sites": list(range(35)), "owners": [0, 5]}
+        expected, _ = self.post(body)
+        with patch("whoownsmass.batch.CHUNK_SIZE", 10):
+            response = self.client.post(reverse("batch"), body, format="json")
+            self.assertTrue(response.streaming)
+            self.assertEqual(json.loads(b"".join(response.streaming_content)), expected)
+
+    def test_invalid_ids(self):
+        for body in (
+            {"sites": ["x"]},
+            {"sites": [1.9]},
+            {"owners": [True]},
+            {"metacorps": [None]},
+            {"metacorps": [[1]]},
+            {"parcels": [1]},
+        ):
+            response = self.client.post(reverse("batch"), body, format="json")
+            self.assertEqual(response.status_code, 400, body)
+
+
+class SiteSpatialFilterTests(APITestCase):
+    # Sites from build_network sit at (-71.06 - i * 1e-6, 42.36 + i * 1e-6).
+    bbox = "-71.0600025,42.3599999,-71.0599999,42.3600025"
+
+    def filtered_queryset(self, **params):
+        view = SiteViewset(
+            action="list",
+            request=Request(APIRequestFactory().get("/sites/", params)),
+            format_kwarg=None
+        )
+        return view.filter_queryset(view.get_queryset())
+
+    def assertUsesSpatialIndex(self, queryset):
+        # Test tables are tiny, so the planner would rightly prefer a
+        # sequential scan. Discouraging it shows whether an index can serve
+        # the query at all: without one the plan still reads "Seq Scan".
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan on parcels_point", plan)
+
+    def test_in_bbox(self):
+        build_network("network", 20)
+        response = self.client.get(reverse("site-list"), {"in_bbox": self.bbox})
+        self.assertEqual(len(response.json()["results"]["features"]), 3)
+
+    def test_distance_to_point(self):
+        build_network("network", 20)
+        response = self.client.get(
+            reverse("site-list"), {"point": "-71.06,42.36", "dist": 1}
+        )
+        self.assertGreater(len(response.json()["results"]["features"]), 0)
+
+    def test_viewport_query_uses_spatial_index(self):
+        build_network("network", 20)
+        self.assertUsesSpatialIndex(self.filtered_queryset(in_bbox=self.bbox))
+
+    def test_radius_query_uses_spatial_index(self):
+        build_network("network", 20)
+        self.assertUsesSpatialIndex(
+            self.filtered_queryset(point="-71.06,42.36", dist=100)
+        )
+
+
+class OwnerSearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        build_network("network", 1)
+        build_network("other", 1, start=10)
+
+    def test_fuzzy_search_tolerates_typos(self):
+        response = self.client.get(reverse("owner-list"), {"search": "netwrk holdngs llc"})
+        results = response.json()["results"]
+        self.assertEqual(results[0]["name"], "network HOLDINGS LLC")
+        self.assertEqual(results[0]["metacorp"], "network")
+
+    def test_list_pages_by_cursor(self):
+        for i in range(5):
+            build_network(f"more{i}", 1, start=20 + i)
+        names, url = [], reverse("owner-list")
+        with CaptureQueriesContext(connection) as ctx:
+            while url:
+                page = self.client.get(url).json()
+                self.assertNotIn("count", page)
+                names += [result["name"] for result in page["results"]]
+                url = page["next"]
+        self.assertEqual(names, sorted(OwnerAlias.objects.values_list("name", flat=True)))
+        self.assertFalse(any("COUNT(" in query["sql"] for query in ctx.captured_queries))
+
+    def test_owner_alias_created_when_missing(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP MATERIALIZED VIEW owner_alias")
+        self.assertTrue(create_owner_aliases())
+        self.assertFalse(create_owner_aliases())
+        self.assertEqual(OwnerAlias.objects.count(), 2)
+
+    def test_prefix_search(self):
+        response = self.client.get(reverse("owner-list"), {"search": "oth", "match": "prefix"})
+        self.assertEqual(
+            [result["name"] for result in response.json()["results"]],
+            ["other HOLDINGS LLC"]
+        )
+
+
+class SiteExportTests(APITestCase):
+    def export(self, **params):
+        response = self.client.get(reverse("site-export"), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_export_of_metacorp(self):
+        metacorp = build_network("network", 30)
+        build_network("other", 5, start=100)
+        lines = self.export(metacorp=metacorp.id, format="ndjson").splitlines()
+        self.assertEqual(len(lines), 30)
+        feature = json.loads(lines[0])
+        self.assertEqual(feature["properties"]["metacorp"], "network")
+        self.assertEqual(feature["geometry"]["type"], "Point")
+
+    def test_geojson_export_is_a_feature_collection(self):
+        metacorp = build_network("network", 3)
+        collection = json.loads(self.export(metacorp=metacorp.id))
+        self.assertEqual(len(collection["features"]), 3)
+
+    def test_msgpack_export_streams_features(self):
+        metacorp = build_network("network", 4)
+        response = self.client.get(reverse("site-export"), {"metacorp": metacorp.id, "format": "msgpack"})
+        features = list(msgpack.Unpacker(BytesIO(b"".join(response.streaming_content))))
+        self.assertEqual(len(features), 4)
+        self.assertEqual(features[0]["properties"]["metacorp"], "network")
+
+    def test_flatgeobuf_export(self):
+        metacorp = build_network("network", 4)
+        response = self.client.get(reverse("site-export"), {"metacorp": metacorp.id, "format": "fgb"})
+        self.assertEqual(response["Content-Type"], "application/flatgeobuf")
+        self.assertTrue(response.content.startswith(b"fgb\x03"))
+
+    def test_large_flatgeobuf_export_is_rejected(self):
+        metacorp = build_network("network", 4)
+        with patch("whoownsmass.export.MAX_FLATGEOBUF_SITES", 3):
+            response = self.client.get(reverse("site-export"), {"metacorp": metacorp.id, "format": "fgb"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_requires_a_scope(self):
+        response = self.client.get(reverse("site-export"))
+        self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("metacorp-detail", args=[build_network("network", 10).id])
+
+    def test_repeat_request_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(self.url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertIn("Last-Modified", second)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        caches[CACHE_ALIAS].clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_cached_body_is_sent_precompressed(self):
+        body = self.client.get(self.url).content
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_brotli_is_preferred(self):
+        body = self.client.get(self.url).content
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), body)
+
+    def test_refused_coding_is_not_sent_for_wildcard(self):
+        body = self.client.get(self.url).content
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="br;q=0, *")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), body)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip;q=0, br;q=0, *")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response.content, body)
+
+    def test_highest_quality_coding_is_chosen(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="br;q=0.4, gzip;q=0.8")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_new_generation_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        with patch("whoownsmass.caching.current_generation", return_value="next"):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class MetaCorpAggregateTests(TestCase):
+    def test_recompute_from_sites(self):
+        build_network("network", 30, sites_per_owner=10)
+        Site.objects.filter(id__lt=10).update(units=3, bld_area=500, res_area=800)
+        self.assertEqual(recompute_metacorp_aggregates(), 1)
+        metacorp = MetaCorp.objects.get(id="network")
+        self.assertEqual(metacorp.prop_count, 30)
+        self.assertEqual(metacorp.unit_count, 50)
+        self.assertEqual(metacorp.val, 30 * 200000)
+        self.assertEqual(metacorp.area, 10 * 800)
+        self.assertEqual(metacorp.val_per_prop, 200000)
+        self.assertEqual(metacorp.company_count, 0)
+
+    def test_totals_past_integer_range(self):
+        build_network("network", 30)
+        Site.objects.update(bld_val=2 ** 30, lnd_val=2 ** 30, bld_area=2 ** 30)
+        with connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE metacorps_network ALTER COLUMN val TYPE integer")
+        recompute_metacorp_aggregates()
+        metacorp = MetaCorp.objects.get(id="network")
+        self.assertEqual(metacorp.val, 30 * 2 ** 31)
+        self.assertEqual(metacorp.area, 30 * 2 ** 30)
+
+    def test_unchanged_metacorps_are_not_rewritten(self):
+        build_network("network", 5)
+        recompute_metacorp_aggregates()
+        self.assertEqual(recompute_metacorp_aggregates(), 0)
+
+
+class ReclusterTests(TestCase):
+    def setUp(self):
+        metacorp = build_network("m1", 4)
+        other = MetaCorp.objects.create(id="m3", name="C LLC")
+        Company.objects.bulk_create([
+            Company(id=1, name="A LLC", address_id=0, metacorp=metacorp),
+            Company(id=2, name="B LLC", address_id=1, metacorp=metacorp),
+            Company(id=3, name="C LLC", address_id=2, metacorp=other),
+            Company(id=4, name="D LLC", address_id=3),
+        ])
+        # Company 2's manager shares company 1's address.
+        Officer.objects.create(id=1, name="JANE DOE", company_id=2, address_id=0, metacorp=metacorp)
+        # Registered agents do not link companies.
+        Officer.objects.create(id=2, name="AGENTS INC", inst=True, company_id=4, address_id=0)
+        Owner.objects.filter(id=0).update(company_id=2)
+
+    def metacorps(self):
+        return dict(Company.objects.order_by("id").values_list("id", "metacorp_id"))
+
+    def test_full_run_keeps_existing_clusters(self):
+        self.assertEqual(recluster_metacorps(log=lambda message: None), 0)
+        self.assertEqual(self.metacorps(), {1: "m1", 2: "m1", 3: "m3", 4: None})
+
+    def test_added_link_merges_into_larger_metacorp(self):
+        Officer.objects.create(id=3, name="JOHN DOE", company_id=3, address_id=1)
+        self.assertEqual(recluster_metacorps(company_ids=[3], log=lambda message: None), 1)
+        self.assertEqual(self.metacorps(), {1: "m1", 2: "m1", 3: "m1", 4: None})
+        self.assertEqual(Officer.objects.get(id=3).metacorp_id, "m1")
+        self.assertEqual(MetaCorp.objects.get(id="m1").company_count, 3)
+        # m3 is left with nothing referring to it.
+        self.assertFalse(MetaCorp.objects.filter(id="m3").exists())
+
+    def test_merged_metacorp_holding_owners_is_kept(self):
+        Owner.objects.create(id=100, name="C LLC", inst=True, metacorp_id="m3")
+        Officer.objects.create(id=3, name="JOHN DOE", company_id=3, address_id=1)
+        recluster_metacorps(company_ids=[3], log=lambda message: None)
+        self.assertEqual(MetaCorp.objects.get(id="m3").company_count, 0)
+        self.assertEqual(
+            list(OwnerAlias.objects.filter(metacorp_id="m3").values_list("name", flat=True)),
+            ["C LLC"]
+        )
+
+    def test_removed_link_splits_metacorp(self):
+        Officer.objects.filter(id=1).delete()
+        self.assertEqual(recluster_metacorps(company_ids=[2], log=lambda message: None), 1)
+        self.assertEqual(self.metacorps(), {1: "m1", 2: "company-2", 3: "m3", 4: None})
+        self.assertEqual(MetaCorp.objects.get(id="company-2").name, "B LLC")
+        self.assertEqual(Owner.objects.get(id=0).metacorp_id, "company-2")
+
+
+class OwnerDedupTests(TestCase):
+    def test_find_duplicates(self):
+        records = [
+            (1, "HARBOR POINT APARTMENTS LLC", None, 5),
+            (2, "HARBOR POINTE APARTMENTS LLC", None, 1),
+            (3, "Maple Street Realty Trust", "a", 1),
+            (4, "MAPLE STREET REALTY TRST", "a", 2),
+            (5, "MAPLE STREET REALTY TRUST", "b", 1),
+            (6, "OAK HILL HOLDINGS LLC", None, 1),
+        ]
+        proposals, stats = find_duplicates(records, workers=1)
+        self.assertEqual(sorted((a, b) for a, b, _ in proposals), [(1, 2), (3, 4)])
+        self.assertEqual(
+            sorted(renames(records, proposals)),
+            [("HARBOR POINTE APARTMENTS LLC", None, "HARBOR POINT APARTMENTS LLC"),
+             ("Maple Street Realty Trust", "a", "MAPLE STREET REALTY TRST")]
+        )
+        self.assertGreater(stats["compared"], 0)
+
+    def test_pair_whose_first_key_is_skipped(self):
+        records = [
+            (1, "ACME WIDGET PARTNERS LLC", None, 1),
+            (2, "ACME WIDGET PARTNRS LLC", None, 1),
+            *[(i, f"ACME PX{i:04d} LLC", None, 1) for i in range(3, 1203)],
+        ]
+        proposals, stats = find_duplicates(records, workers=1)
+        self.assertEqual([(a, b) for a, b, _ in proposals], [(2, 1)])
+        self.assertEqual(stats["skipped_blocks"], 1)
+
+    def test_apply_merges_identical_owners(self):
+        build_network("network", 3, sites_per_owner=1)
+        Owner.objects.filter(id=1).update(name="NETWORK HOLDING LLC")
+        merged = apply_renames([("NETWORK HOLDING LLC", "network", "network HOLDINGS LLC")])
+        self.assertEqual(merged, 3)
+        self.assertEqual(list(Owner.objects.values_list("id", flat=True)), [0])
+        self.assertEqual(
+            sorted(SiteToOwner.objects.values_list("site_id", "owner_id")),
+            [(0, 0), (1, 0), (2, 0)]
+        )
+
+
+class GeographyAssignmentTests(TestCase):
+    def setUp(self):
+        build_network("network", 3)
+        area = MultiPolygon(Polygon.from_bbox((-71.2, 42.3, -71.0, 42.4)), srid=4326)
+        elsewhere = MultiPolygon(Polygon.from_bbox((-70.2, 41.3, -70.0, 41.4)), srid=4326)
+        Municipality.objects.create(id="274", muni="SOMERVILLE", geometry=area)
+        Municipality.objects.create(id="1", muni="NANTUCKET", geometry=elsewhere)
+        Tract.objects.create(id="25017350100", geometry=area)
+        BlockGroup.objects.create(id="250173501001", geometry=area)
+        ParcelPoint.objects.filter(id="network-0").update(muni_id="1")
+
+    def assert_fills_missing(self, method):
+        self.assertEqual(assign_geographies(method=method, workers=1, log=lambda message: None), 3)
+        self.assertEqual(
+            sorted(ParcelPoint.objects.values_list("id", "muni_id", "tract_id", "block_group_id")),
+            [("network-0", "1", "25017350100", "250173501001"),
+             ("network-1", "274", "25017350100", "250173501001"),
+             ("network-2", "274", "25017350100", "250173501001")]
+        )
+        self.assertEqual(assign_geographies(method=method, workers=1, log=lambda message: None), 0)
+        self.assertEqual(
+            assign_geographies(method=method, reassign=True, workers=1, log=lambda message: None), 1
+        )
+        self.assertEqual(ParcelPoint.objects.get(id="network-0").muni_id, "274")
+
+    def test_sql_assignment_fills_missing(self):
+        self.assert_fills_missing("sql")
+
+    def test_strtree_assignment_fills_missing(self):
+        self.assert_fills_missing("strtree")
+
+    def test_assign_chunk(self):
+        build_trees(load_polygons())
+        self.assertEqual(
+            assign_chunk([("in", -71.1, 42.35), ("out", -60.0, 40.0), ("edge", -71.0, 42.35)]),
+            [("in", "274", "25017350100", "250173501001"),
+             ("out", None, None, None),
+             ("edge", None, None, None)]
+        )
+
+
+class GeographyRollupTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        build_network("network", 30)
+        build_network("other", 10, start=100)
+        muni = Municipality.objects.create(
+            id="274",
+            muni="SOMERVILLE",
+            geometry=MultiPolygon(Polygon.from_bbox((-71.2, 42.3, -71.0, 42.4)), srid=4326)
+        )
+        ParcelPoint.objects.update(muni=muni)
+        Site.objects.filter(id__lt=5).update(ooc=True)
+        refresh_rollups()
+
+    def test_muni_rollup(self):
+        response = self.client.get(reverse("rollup-detail", args=["muni", "274"]))
+        self.assertEqual(response.status_code, 200)
+        rollup = response.json()
+        self.assertEqual(rollup["site_count"], 40)
+        self.assertEqual(rollup["unit_count"], 40)
+        self.assertEqual(rollup["value"], 40 * 200000)
+        self.assertAlmostEqual(rollup["ooc_rate"], 5 / 40)
+        self.assertAlmostEqual(rollup["large_network_unit_share"], 1.0)
+        self.assertAlmostEqual(rollup["hhi"], (30 / 40) ** 2 + (10 / 40) ** 2)
+        self.assertEqual(
+            [(top["metacorp"], top["unit_count"]) for top in rollup["top_metacorps"]],
+            [("network", 30), ("other", 10)]
+        )
+
+    def test_lookup_is_one_query(self):
+        self.assertEqual(self.count_queries(reverse("rollup-detail", args=["muni", "274"])), 1)
+
+    def test_unknown_geography_is_404(self):
+        response = self.client.get(reverse("rollup-detail", args=["muni", "999"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncEndpointTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        token = Token.objects.create(user=get_user_model().objects.create(username="async"))
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+
+    def test_metacorp_detail_matches_sync_endpoint(self):
+        metacorp = build_network("network", 20)
+        expected = self.client.get(reverse("metacorp-detail", args=[metacorp.id])).json()
+        response = self.client.get(
+            reverse("async-metacorp-detail", args=[metacorp.id]), **self.auth
+        )
+        self.assertEqual(response.json(), expected)
+
+    def test_site_pages_cover_every_site(self):
+        build_network("network", 25)
+        url = reverse("async-site-list") + "?limit=10"
+        seen = []
+        while url:
+            page = self.client.get(url, **self.auth).json()
+            seen += [feature["id"] for feature in page["features"]]
+            url = page["next"]
+        self.assertEqual(seen, sorted(Site.objects.values_list("id", flat=True)))
+
+    def test_point_without_lat_lng(self):
+        build_network("network", 1)
+        ParcelPoint.objects.update(lat=None, lng=None)
+        response = self.client.get(reverse("async-site-detail", args=[0]), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["geometry"], {"type": "Point", "coordinates": [-71.06, 42.36]}
+        )
+
+    def test_site_list_applies_spatial_filters(self):
+        build_network("network", 20)
+        response = self.client.get(
+            reverse("async-site-list"), {"in_bbox": SiteSpatialFilterTests.bbox}, **self.auth
+        )
+        self.assertEqual(len(response.json()["features"]), 3)
+
+    def test_owner_search_is_paginated(self):
+        for i in range(3):
+            build_network(f"network{i}", 1, start=i * 10)
+        url = reverse("async-owner-list") + "?search=network&match=prefix&limit=2"
+        names = []
+        while url:
+            page = self.client.get(url, **self.auth).json()
+            names += [result["name"] for result in page["results"]]
+            url = page["next"]
+        self.assertEqual(names, [f"network{i} HOLDINGS LLC" for i in range(3)])
+
+    def test_missing_metacorp_is_not_found(self):
+        response = self.client.get(reverse("async-metacorp-detail", args=["none"]), **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    def test_token_is_required(self):
+        response = self.client.get(reverse("async-owner-list"))
+        self.assertEqual(response.status_code, 401)
+
+
+class RendererTests(APITestCase):
+    def test_orjson_matches_json_renderer(self):
+        data = {"start": Decimal("12.5"), "label": gettext_lazy("Sites"), "ids": [1, 2]}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_sites_as_msgpack(self):
+        build_network("network", 3)
+        response = self.client.get(reverse("site-list"), {"format": "msgpack"})
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(len(msgpack.unpackb(response.content)["results"]["features"]), 3)
+
+
+class TileTests(APITestCase):
+    # Sites from build_network fall in tile 14/4957/6059, and 10/309/378.
+    point_tile = (14, 4957, 6059)
+    cluster_tile = (10, 309, 378)
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(TILE_CACHE_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+        build_network("network", 3)
+
+    def get_tile(self, z, x, y):
+        return self.client.get(reverse("tile", args=[z, x, y]))
+
+    def assert_tile(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertTrue(response.content)
+
+    def test_point_tile(self):
+        self.assert_tile(self.get_tile(*self.point_tile))
+
+    def test_cluster_tile(self):
+        self.assert_tile(self.get_tile(*self.cluster_tile))
+
+    def test_repeat_tile_is_read_from_disk(self):
+        first = self.get_tile(*self.point_tile)
+        path = tile_path(current_generation(), *self.point_tile)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), first.content)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.get_tile(*self.point_tile)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(second.content, first.content)
+
+    def test_out_of_range_tile_is_404(self):
+        for z, x, y in [(23, 0, 0), (14, 2 ** 14, 0), (2, 0, 4)]:
+            self.assertEqual(self.get_tile(z, x, y).status_code, 404)
+
+
+class TileCacheTests(TestCase):
+    def test_prune_keeps_current_and_recent_generations(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(TILE_CACHE_DIR=root):
+            for name in ("current", "recent", "stale"):
+                os.makedirs(os.path.join(root, name, "14"))
+            stale = os.path.join(root, "stale")
+            os.utime(stale, (0, 0))
+            os.utime(os.path.join(root, "current"), (0, 0))
+            prune_generations(keep="current", min_age=STALE_AGE)
+            self.assertEqual(sorted(os.listdir(root)), ["current", "recent"])
+
+    def test_storing_a_tile_keeps_generation_from_prune(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(TILE_CACHE_DIR=root):
+            os.makedirs(os.path.join(root, "previous", "14"))
+            os.utime(os.path.join(root, "previous"), (0, 0))
+            store_tile("previous", 14, 1, 1, b"tile")
+            prune_generations(keep="current", min_age=STALE_AGE)
+            self.assertEqual(os.listdir(root), ["previous"])
+
+
+class LoadOwnershipTests(TransactionTestCase):
+    # Tables are COPY'd on pool threads with their own connections, so the
+    # test data has to be committed for them to see it.
+    tables = ["site", "owner", "site_to_owner"]
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(TILE_CACHE_DIR=os.path.join(self.directory, "tiles")))
+        build_network("network", 3, sites_per_owner=1)
+        muni = Municipality.objects.create(
+            id="274",
+            muni="SOMERVILLE",
+            geometry=MultiPolygon(Polygon.from_bbox((-71.2, 42.3, -71.0, 42.4)), srid=4326)
+        )
+        ParcelPoint.objects.update(muni=muni)
+        refresh_rollups()
+
+    def write(self, table, rows):
+        path = os.path.join(self.directory, f"{table}.csv")
+        with open(path, "w") as f:
+            f.write("\n".join(",".join(str(value) for value in row) for row in rows) + "\n")
+        return path
+
+    def files(self, links):
+        return {
+            "site": self.write("site", [
+                ("id", "fy", "units", "bld_val", "lnd_val", "use_code", "luc", "ooc", "condo", "address_id"),
+                (10, 2025, 2, 100000, 50000, "104", "104", "f", "f", 0),
+                (11, 2025, 3, 100000, 50000, "105", "105", "t", "f", 1),
+            ]),
+            "owner": self.write("owner", [
+                ("id", "name", "inst", "trust", "trustees", "address_id", "metacorp_id"),
+                (10, "NEW HOLDINGS LLC", "t", "f", "f", 0, "network"),
+                (11, "NEW HOLDINGS LLC", "t", "f", "f", 1, "network"),
+            ]),
+            "site_to_owner": self.write("site_to_owner", [("id", "site_id", "owner_id"), *links]),
+        }
+
+    def schema(self):
+        """The loaded tables' index names and every constraint touching them."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tablename, indexname FROM pg_indexes WHERE tablename = ANY(%s) ORDER BY 1, 2",
+                [self.tables]
+            )
+            indexes = cursor.fetchall()
+            cursor.execute(
+                """
+                SELECT conrelid::regclass::text, conname, contype, convalidated
+                FROM pg_constraint
+                WHERE conrelid = ANY(%s::regclass[]) OR confrelid = ANY(%s::regclass[])
+                ORDER BY 1, 2
+                """,
+                [self.tables, self.tables]
+            )
+            return indexes, cursor.fetchall()
+
+    def test_load_replaces_tables(self):
+        schema = self.schema()
+        load_ownership(self.files([(5, 10, 10), (6, 11, 11)]), workers=2, log=lambda message: None)
+        self.assertEqual(list(Site.objects.order_by("id").values_list("id", flat=True)), [10, 11])
+        self.assertEqual(list(Owner.objects.order_by("id").values_list("id", flat=True)), [10, 11])
+        self.assertEqual(self.schema(), schema)
+        alias = OwnerAlias.objects.get()
+        self.assertEqual((alias.name, alias.owner_count, alias.site_count), ("NEW HOLDINGS LLC", 2, 2))
+        rollup = GeographyRollup.objects.get(id="muni:274")
+        self.assertEqual((rollup.site_count, rollup.unit_count), (2, 5))
+        # The identity sequence continues after the loaded ids.
+        self.assertEqual(SiteToOwner.objects.create(site_id=10, owner_id=11).id, 7)
+
+    def test_dangling_foreign_key_keeps_live_tables(self):
+        schema = self.schema()
+        with self.assertRaisesMessage(LoadError, "site_to_owner.site_id -> site: 1 missing"):
+            load_ownership(self.files([(5, 10, 10), (6, 99, 11)]), workers=2, log=lambda message: None)
+        self.assertEqual(list(Site.objects.order_by("id").values_list("id", flat=True)), [0, 1, 2])
+        self.assertEqual(self.schema(), schema)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tablename FROM pg_tables WHERE tablename LIKE '%\\_staging'")
+            self.assertEqual(cursor.fetchall(), [])
@@ -0,0 +1,177 @@
+"""
+Mapbox Vector Tiles of sites, built in PostGIS with ST_AsMVT and cached on
+disk per data generation.
+"""
+import os
+import shutil
+import tempfile
+from time import time
+
+from django.conf import settings
+from django.db import connection
+
+from whoownsmass.generation import current_generation
+
+MAX_ZOOM = 22
+EXTENT = 4096
+BUFFER = 64
+# Below this zoom, sites are aggregated into grid cells rather than drawn
+# one point per site.
+CLUSTER_ZOOM = 13
+# Cells per tile side when clustering.
+CLUSTER_GRID = 64
+LAYER = "sites"
+# Workers see a new generation up to DATA_GENERATION_TTL after a load and
+# keep writing the old one until then, so only generations left untouched
+# for this many seconds are pruned.
+STALE_AGE = 3600
+
+# Each site is drawn at its parcel point and tagged with one owning metacorp.
+SITES_SQL = """
+    WITH bounds AS (
+        SELECT
+            ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom,
+            ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s), 4326) AS geom_4326
+    ),
+    sites AS (
+        SELECT
+            s.id,
+            s.units,
+            s.luc,
+            s.ooc,
+            (
+                SELECT o.metacorp_id
+                FROM site_to_owner sto
+                JOIN owner o ON o.id = sto.owner_id
+                WHERE sto.site_id = s.id AND o.metacorp_id IS NOT NULL
+                ORDER BY o.metacorp_id
+                LIMIT 1
+            ) AS metacorp,
+            ST_Transform(p.geometry, 3857) AS geometry
+        FROM bounds
+        JOIN parcels_point p ON p.geometry && bounds.geom_4326
+        JOIN address a ON a.parcel_id = p.id
+        JOIN site s ON s.address_id = a.id
+    )
+"""
+
+POINTS_SQL = SITES_SQL + """
+    SELECT ST_AsMVT(tile, %(layer)s, %(extent)s, 'geom', 'id')
+    FROM (
+        SELECT
+            sites.id,
+            sites.units,
+            sites.luc,
+            sites.ooc,
+            sites.metacorp,
+            ST_AsMVTGeom(sites.geometry, bounds.geom, %(extent)s, %(buffer)s, true) AS geom
+        FROM sites, bounds
+    ) AS tile
+    WHERE tile.geom IS NOT NULL
+"""
+
+CLUSTERS_SQL = SITES_SQL + """
+    SELECT ST_AsMVT(tile, %(layer)s, %(extent)s, 'geom')
+    FROM (
+        SELECT
+            count(*) AS site_count,
+            sum(sites.units) AS units,
+            ST_AsMVTGeom(ST_Centroid(ST_Collect(sites.geometry)), bounds.geom, %(extent)s, %(buffer)s, true) AS geom
+        FROM sites, bounds
+        GROUP BY ST_SnapToGrid(sites.geometry, %(cell)s), bounds.geom
+    ) AS tile
+    WHERE tile.geom IS NOT NULL
+"""
+
+# Width of the web mercator world in metres.
+WORLD_SIZE = 2 * 20037508.342789244
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def render_tile(z, x, y):
+    """
+    Build the tile at z/x/y in the database and return it as bytes.
+    """
+    params = {
+        "z": z,
+        "x": x,
+        "y": y,
+        "layer": LAYER,
+        "extent": EXTENT,
+        "buffer": BUFFER,
+        "margin": BUFFER / EXTENT,
+        "cell": WORLD_SIZE / 2 ** z / CLUSTER_GRID,
+    }
+    sql = CLUSTERS_SQL if z < CLUSTER_ZOOM else POINTS_SQL
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        tile = cursor.fetchone()[0]
+    return bytes(tile) if tile else b""
+
+
+def generation_path(generation):
+    return os.path.join(settings.TILE_CACHE_DIR, generation)
+
+
+def tile_path(generation, z, x, y):
+    return os.path.join(generation_path(generation), str(z), str(x), f"{y}.mvt")
+
+
+def prune_generations(keep, min_age=STALE_AGE):
+    """
+    Delete cached tiles from every generation other than keep whose
+    directory has not been written to for min_age seconds. Run by
+    load_ownership after swapping tables, and by the prune_tiles command.
+    """
+    if not os.path.isdir(settings.TILE_CACHE_DIR):
+        return
+    cutoff = time() - min_age
+    for name in os.listdir(settings.TILE_CACHE_DIR):
+        path = generation_path(name)
+        if name == keep:
+            continue
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def store_tile(generation, z, x, y, tile):
+    path = tile_path(generation, z, x, y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file and rename it into place so concurrent
+    # requests never read a partial tile.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(tile)
+    os.replace(tmp, path)
+    # Writing z/x/y.mvt leaves the generation directory's mtime alone, and
+    # prune_generations reads that as the last time it was written to.
+    os.utime(generation_path(generation))
+
+
+def get_tile(z, x, y):
+    """
+    Return the tile at z/x/y, reading it from the disk cache for the current
+    data generation or rendering and storing it on a miss.
+    """
+    generation = current_generation()
+    path = tile_path(generation, z, x, y)
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    tile = render_tile(z, x, y)
+    try:
+        store_tile(generation, z, x, y, tile)
+    except FileNotFoundError:
+        # The generation was pruned while the tile was being written; it is
+        # served uncached.
+        pass
+    return tile
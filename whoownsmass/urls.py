@@ -19,15 +19,28 @@ from django.urls import include, path
 
 from rest_framework.routers import DefaultRouter
 
-from whoownsmass.views import SiteViewset, MetaCorpViewset, OwnerViewset
+from whoownsmass import async_views
+from whoownsmass.rollups import GEOGRAPHIES
+from whoownsmass.views import AddressLookupView, BatchLookupView, GeographyRollupViewset, GraphView, SiteViewset, MetaCorpViewset, OwnerViewset, SiteExportView, TileView
 
 router = DefaultRouter()
 router.register(r'sites', SiteViewset, basename='site')
 router.register(r'metacorps', MetaCorpViewset, basename='metacorp')
 router.register(r'owners', OwnerViewset, basename='owner')
+router.register(rf'rollups/(?P<geography>{"|".join(GEOGRAPHIES)})', GeographyRollupViewset, basename='rollup')
 
 urlpatterns = [
     path('api/auth/', include('rest_framework.urls')),
     path('admin/', admin.site.urls),
+    path('export/sites/', SiteExportView.as_view(), name='site-export'),
+    path('lookup/address/', AddressLookupView.as_view(), name='address-lookup'),
+    path('batch/', BatchLookupView.as_view(), name='batch'),
+    path('graph/<str:kind>/<int:pk>/', GraphView.as_view(), name='graph'),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', TileView.as_view(), name='tile'),
+    path('async/sites/', async_views.site_list, name='async-site-list'),
+    path('async/sites/<int:pk>/', async_views.site_detail, name='async-site-detail'),
+    path('async/metacorps/', async_views.metacorp_list, name='async-metacorp-list'),
+    path('async/metacorps/<str:pk>/', async_views.metacorp_detail, name='async-metacorp-detail'),
+    path('async/owners/', async_views.owner_list, name='async-owner-list'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
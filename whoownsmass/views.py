@@ -1,28 +1,377 @@
+from django.db.models import Case, F, FloatField, Func, IntegerField, Prefetch, Value, When
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
-from rest_framework.pagination import LimitOffsetPagination
-from whoownsmass.models import MetaCorp, Site, Owner
-from rest_framework import filters
+from whoownsmass.models import GeographyRollup, MetaCorp, Site, Owner, OwnerAlias, SiteToOwner
+from rest_framework_gis.filters import DistanceToPointFilter, InBBoxFilter
 
-from whoownsmass.serializers import SiteSerializer, MetaCorpSerializer, OwnerSerializer, OwnerNameSerializer
+from whoownsmass.addresses import MAX_RESULTS, AddressParseError, matching_addresses, parse_address
+from whoownsmass.batch import BatchError, parse_batch, resolve_batch, stream_batch, streamed
+from whoownsmass.caching import CachedResponseMixin, cache_response
+from whoownsmass.export import MAX_FLATGEOBUF_SITES, export_flatgeobuf, flatgeobuf_allowed, stream_geojson, stream_msgpack, stream_ndjson
+from whoownsmass.filters import SiteFilter, SiteExportFilter
+from whoownsmass.graph import MAX_HOPS, MAX_NODES, metacorp_graph, neighborhood_graph
+from whoownsmass.renderers import FlatGeobufRenderer, GeoJSONRenderer, MessagePackRenderer, MVTRenderer, NDJSONRenderer
+from whoownsmass.tiles import get_tile, valid_tile
+from whoownsmass.pagination import QueryOrderedCursorPagination, SmallResultsSetCursorPagination, GeoJsonKeysetPagination
+from whoownsmass.search import owner_search
+from whoownsmass.serializers import GeographyRollupSerializer, SiteSerializer, MetaCorpSerializer, OwnerSerializer, OwnerNameSerializer, OwnerAliasSerializer, OwnerSearchSerializer, SimpleSiteSerializer
 
-class SmallResultsSetPagination(LimitOffsetPagination):
-    default_limit = 5  # Limit to 5 items per page
-    max_limit = 5  # Optional: maximum allowed page size
+FALSE_VALUES = {"0", "false", "no", "off"}
+# Spatial endpoints can also be requested as MessagePack (`?format=msgpack`).
+SPATIAL_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer]
 
-class SiteViewset(ReadOnlyModelViewSet):
-    queryset = Site.objects.all()
+# Serializers draw points from the parcel's lat/lng (see
+# serializers.point_geometry), so the geometry column is left unread. Rows
+# missing lat/lng take coordinates from the geometry in the same query.
+PARCEL_GEOMETRY = "address__parcel__geometry"
+
+def parcel_coordinate(column, function):
+    return Coalesce(
+        F(f"address__parcel__{column}"),
+        Func(F(PARCEL_GEOMETRY), function=function, output_field=FloatField())
+    )
+
+POINT_ANNOTATIONS = {
+    "point_lng": parcel_coordinate("lng", "ST_X"),
+    "point_lat": parcel_coordinate("lat", "ST_Y"),
+}
+
+def int_param(request, name, default, maximum):
+    """A positive integer query parameter, capped at maximum."""
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: "Must be an integer."})
+    if value < 1:
+        raise ValidationError({name: "Must be at least 1."})
+    return min(value, maximum)
+
+def owner_queryset():
+    """
+    Owners ready for OwnerSerializer: address and parcel joined in, and the
+    site primary keys (the only part of Site that serializer reads) prefetched.
+    """
+    return Owner.objects.select_related("address__parcel").defer(PARCEL_GEOMETRY).annotate(
+        **POINT_ANNOTATIONS
+    ).prefetch_related(
+        Prefetch("site", queryset=Site.objects.only("id"))
+    )
+
+def site_queryset():
+    """
+    Sites ready for SimpleSiteSerializer, with every owner fetched up front.
+    """
+    return Site.objects.select_related("address__parcel").defer(PARCEL_GEOMETRY).annotate(
+        **POINT_ANNOTATIONS
+    ).prefetch_related(
+        Prefetch("owners", queryset=owner_queryset())
+    )
+
+def site_detail_queryset():
+    """
+    Sites ready for SiteSerializer, which also reads each owner's metacorp.
+    """
+    return Site.objects.select_related("address__parcel").defer(PARCEL_GEOMETRY).annotate(
+        **POINT_ANNOTATIONS
+    ).prefetch_related(
+        Prefetch("owners", queryset=owner_queryset().select_related("metacorp"))
+    )
+
+def metacorp_queryset(include_sites=True):
+    """
+    Metacorps ready for MetaCorpSerializer: aliases, most used first, and
+    optionally every site with its owners.
+    """
+    queryset = MetaCorp.objects.prefetch_related(
+        Prefetch("aliases", queryset=OwnerAlias.objects.order_by("-owner_count", "name"))
+    )
+    if include_sites:
+        # metacorp -> owners -> sites -> owners -> site ids, each level in
+        # one query no matter how many sites the network holds.
+        queryset = queryset.prefetch_related(
+            Prefetch(
+                "owners",
+                queryset=Owner.objects.prefetch_related(
+                    Prefetch("site", queryset=site_queryset())
+                )
+            )
+        )
+    return queryset
+
+class SiteViewset(CachedResponseMixin, ReadOnlyModelViewSet):
+    """
+    Sites, filterable by `muni`, `luc` and `fy`, by viewport
+    (`in_bbox=min_lng,min_lat,max_lng,max_lat`) and by radius
+    (`point=lng,lat&dist=<metres>`). Spatial filters resolve through the
+    site's address to its parcel point.
+    """
     serializer_class = SiteSerializer
-    pagination_class = SmallResultsSetPagination
+    pagination_class = SmallResultsSetCursorPagination
+    renderer_classes = SPATIAL_RENDERERS
+    filter_backends = [DjangoFilterBackend, InBBoxFilter, DistanceToPointFilter]
+    filterset_class = SiteFilter
+    bbox_filter_field = "address__parcel__geometry"
+    bbox_filter_include_overlapping = True
+    distance_filter_field = "address__parcel__geometry"
+    distance_filter_convert_meters = True
 
-class MetaCorpViewset(ReadOnlyModelViewSet):
+    def get_queryset(self):
+        return site_detail_queryset()
+
+class MetaCorpViewset(CachedResponseMixin, ReadOnlyModelViewSet):
     queryset = MetaCorp.objects.all()
     serializer_class = MetaCorpSerializer
-    pagination_class = SmallResultsSetPagination
+    pagination_class = SmallResultsSetCursorPagination
+    renderer_classes = SPATIAL_RENDERERS
+
+    def include_sites(self):
+        return self.request.query_params.get("sites", "true").lower() not in FALSE_VALUES
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["include_sites"] = self.include_sites()
+        return context
+
+    def get_queryset(self):
+        if self.action not in ("list", "retrieve"):
+            return super().get_queryset()
+        return metacorp_queryset(self.include_sites())
 
-class OwnerViewset(ReadOnlyModelViewSet):
-    queryset = Owner.objects.distinct('name', 'metacorp')
+    @action(detail=True, url_path="sites")
+    @cache_response
+    def sites(self, request, pk=None):
+        """
+        Keyset-paginated GeoJSON pages of the sites held by this metacorp,
+        optionally filtered by `muni`, `luc` and `fy`. Follow `next` (or
+        pass `after=<last site id>`) to fetch the following page.
+        """
+        metacorp = self.get_object()
+        paginator = GeoJsonKeysetPagination()
+        # Push the seek condition into the site_to_owner scan so each page
+        # reads an index range on (owner_id, site_id) rather than the whole
+        # portfolio.
+        links = SiteToOwner.objects.filter(owner__metacorp_id=metacorp.pk)
+        after = paginator.get_after(request)
+        if after is not None:
+            links = links.filter(site_id__gt=after)
+        filterset = SiteFilter(
+            request.query_params,
+            queryset=site_queryset().filter(id__in=links.values("site_id")),
+            request=request
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        page = paginator.paginate_queryset(filterset.qs, request, view=self)
+        serializer = SimpleSiteSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, url_path="graph")
+    @cache_response
+    def graph(self, request, pk=None):
+        """
+        The metacorp's companies, their officers and the addresses of both,
+        as nodes and edges (see whoownsmass.graph). `max_nodes` lowers the
+        node cap.
+        """
+        metacorp = self.get_object()
+        return Response(metacorp_graph(
+            metacorp.pk, int_param(request, "max_nodes", MAX_NODES, MAX_NODES)
+        ))
+
+class OwnerViewset(CachedResponseMixin, ReadOnlyModelViewSet):
+    """
+    Owner names, listed from the owner_alias view as distinct (name,
+    metacorp) pairs. `search=<text>` ranks them by trigram similarity,
+    tolerating typos; add `match=prefix` for fast starts-with matching
+    while the user is still typing.
+    """
+    queryset = Owner.objects.all()
     serializer_class = OwnerNameSerializer
-    pagination_class = SmallResultsSetPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name']
\ No newline at end of file
+    pagination_class = QueryOrderedCursorPagination
+
+    def get_search(self):
+        if self.action != "list":
+            return None
+        return self.request.query_params.get("search", "").strip() or None
+
+    def get_queryset(self):
+        search = self.get_search()
+        if search is not None:
+            return owner_search(search, match=self.request.query_params.get("match", "fuzzy"))
+        if self.action == "list":
+            return OwnerAlias.objects.order_by("name", "metacorp")
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if self.get_search() is not None:
+            return OwnerSearchSerializer
+        if self.action == "list":
+            return OwnerAliasSerializer
+        return super().get_serializer_class()
+
+class GeographyRollupViewset(CachedResponseMixin, ReadOnlyModelViewSet):
+    """
+    Ownership statistics for a municipality, tract or block group, read
+    from the geography_rollup view: site, unit and value totals, the
+    owner-occupancy rate, the share of units held by large networks, the
+    HHI of unit ownership and the largest metacorps.
+    """
+    serializer_class = GeographyRollupSerializer
+    pagination_class = SmallResultsSetCursorPagination
+    lookup_field = "geo_id"
+
+    def get_queryset(self):
+        return GeographyRollup.objects.filter(geography=self.kwargs["geography"])
+
+class AddressLookupView(APIView):
+    """
+    Sites at a free-text address, `q=45 Main St, Somerville`, including
+    sites on address ranges covering the number on the same side of the
+    street. `muni` supplies the municipality when `q` has none. Sites on
+    exact addresses come first, then those on the narrowest ranges.
+    """
+    renderer_classes = SPATIAL_RENDERERS
+
+    @cache_response
+    def get(self, request):
+        try:
+            parsed = parse_address(request.query_params.get("q", ""), request.query_params.get("muni"))
+        except AddressParseError as err:
+            raise ValidationError({"q": str(err)})
+        addresses = list(matching_addresses(parsed).values_list("id", flat=True)[:MAX_RESULTS])
+        # Rank in SQL so the cut at MAX_RESULTS keeps the best matches.
+        rank = Case(
+            *[When(address_id=address_id, then=Value(i)) for i, address_id in enumerate(addresses)],
+            output_field=IntegerField()
+        )
+        sites = (
+            site_detail_queryset()
+            .filter(address_id__in=addresses)
+            .order_by(rank, "id")[:MAX_RESULTS]
+        )
+        data = SiteSerializer(sites, many=True).data
+        data["query"] = {
+            "number": parsed.number,
+            "body": parsed.body,
+            "muni": parsed.muni,
+            "postal": parsed.postal,
+        }
+        return Response(data)
+
+class BatchLookupView(APIView):
+    """
+    Many sites, owners or metacorps by id in one request: POST
+    `{"sites": [...], "owners": [...], "metacorps": [...]}` (any of the
+    three). Each type answers `{"found": {id: data}, "missing": [ids]}`,
+    with sites and owners as GeoJSON features and metacorps without their
+    embedded sites. Batches larger than one chunk are streamed (see
+    whoownsmass.batch).
+    """
+    types = {
+        "sites": (int, site_detail_queryset, SiteSerializer),
+        "owners": (int, owner_queryset, OwnerSerializer),
+        "metacorps": (str, lambda: metacorp_queryset(include_sites=False), MetaCorpSerializer),
+    }
+
+    def post(self, request):
+        try:
+            batch = parse_batch(request.data, self.types)
+        except BatchError as err:
+            raise ValidationError({err.field: str(err)})
+        context = {"include_sites": False}
+        if streamed(batch):
+            return StreamingHttpResponse(
+                stream_batch(batch, self.types, context),
+                content_type="application/json"
+            )
+        return Response(resolve_batch(batch, self.types, context))
+
+class GraphView(APIView):
+    """
+    The network around a `company` or `officer`: every company, officer and
+    address within `hops` hops (default 2), as nodes and edges (see
+    whoownsmass.graph). `max_nodes` lowers the node cap.
+    """
+    kinds = ["company", "officer"]
+
+    @cache_response
+    def get(self, request, kind, pk):
+        if kind not in self.kinds:
+            raise NotFound(f"Graphs start from one of {', '.join(self.kinds)}.")
+        data = neighborhood_graph(
+            kind,
+            pk,
+            hops=int_param(request, "hops", 2, MAX_HOPS),
+            max_nodes=int_param(request, "max_nodes", MAX_NODES, MAX_NODES)
+        )
+        if data is None:
+            raise NotFound()
+        return Response(data)
+
+class TileView(APIView):
+    """
+    Mapbox Vector Tile of sites at z/x/y. Each feature carries the site id,
+    units, luc, ooc and owning metacorp; below tiles.CLUSTER_ZOOM sites are
+    aggregated into grid cells with site_count and units.
+    """
+    renderer_classes = [MVTRenderer]
+
+    def get(self, request, z, x, y):
+        if not valid_tile(z, x, y):
+            raise NotFound("Tile out of range.")
+        return Response(get_tile(z, x, y))
+
+class SiteExportView(APIView):
+    """
+    Streams every site owned by a `metacorp`, or located in a `muni` or
+    `tract`, as a GeoJSON FeatureCollection or, with `format=ndjson`, as
+    newline-delimited GeoJSON features. `format=msgpack` streams
+    MessagePack-encoded features and `format=fgb` returns a FlatGeobuf
+    file. `luc` and `fy` narrow the export.
+    """
+    renderer_classes = [GeoJSONRenderer, NDJSONRenderer, MessagePackRenderer, FlatGeobufRenderer]
+    streams = {
+        "geojson": stream_geojson,
+        "ndjson": stream_ndjson,
+        "msgpack": stream_msgpack,
+    }
+    scopes = ["metacorp", "muni", "tract"]
+
+    def get(self, request):
+        if not any(request.query_params.get(scope) for scope in self.scopes):
+            raise ValidationError(
+                f"Specify one of {', '.join(self.scopes)} to export."
+            )
+        filterset = SiteExportFilter(
+            request.query_params,
+            queryset=Site.objects.all(),
+            request=request
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        renderer = request.accepted_renderer
+        if renderer.format == "fgb":
+            if not flatgeobuf_allowed(filterset.qs):
+                raise ValidationError({"format": (
+                    f"FlatGeobuf exports are limited to {MAX_FLATGEOBUF_SITES:,} sites; "
+                    "narrow the export or use format=ndjson."
+                )})
+            return HttpResponse(
+                export_flatgeobuf(filterset.qs),
+                content_type=renderer.media_type
+            )
+        return StreamingHttpResponse(
+            self.streams[renderer.format](filterset.qs),
+            content_type=renderer.media_type
+        )